@@ -0,0 +1,138 @@
+"""
+分析数据统一准备 (Shared model frame)
+
+所有分析脚本共用的准备步骤只在这里做一次：
+- 读取数据（含旁路特征，见 feature_store）
+- 对模型列 dropna，默认剔除 expect_edu_raw == 10（"无所谓"）
+- 对 bonding_idx / linking_idx / ses_pca / cog_score 做 z 分数（ddof=1）
+- add_interactions() 统一构造 H2 交互项；add_columns() 追加替代变量（如 ses_self）
+
+结果以显式 dtype 的结构化数组缓存在 <数据目录>/.cache/ 下（.npy，可 memory-map），
+源 CSV 或任一旁路特征文件的 size / mtime 变化时自动重建。
+"""
+import json
+import os
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from feature_store import feature_dir, join_feature, read_dataset
+
+
+# Bump when the preparation logic below changes so stale caches are rebuilt.
+PREP_VERSION = 1
+
+MODEL_COLS = [
+    "expect_edu_raw",
+    "bonding_idx",
+    "linking_idx",
+    "ses_pca",
+    "hukou_type",
+    "cog_score",
+    "clsids",
+]
+Z_COLS = ["bonding_idx", "linking_idx", "ses_pca", "cog_score"]
+PREDICTORS = ["bonding_idx_z", "linking_idx_z", "ses_pca_z", "hukou_type", "cog_score_z"]
+INTERACTIONS = {
+    "linking_x_ses": ("linking_idx_z", "ses_pca_z"),
+    "bonding_x_ses": ("bonding_idx_z", "ses_pca_z"),
+    "linking_x_hukou": ("linking_idx_z", "hukou_type"),
+    "linking_x_ses_self": ("linking_idx_z", "ses_self_z"),
+    "bonding_x_ses_self": ("bonding_idx_z", "ses_self_z"),
+}
+
+FRAME_DTYPES = [("ids", "i8"), ("clsids", "i8"), ("expect_edu_raw", "i1"), ("hukou_type", "i1")]
+FRAME_DTYPES += [(c, "f8") for c in Z_COLS] + [(f"{c}_z", "f8") for c in Z_COLS]
+
+
+def zscore(series):
+    std = series.std()
+    if std == 0 or pd.isna(std):
+        return series * 0
+    return (series - series.mean()) / std
+
+
+def prep_model_df(df, drop_code_10=True):
+    model_df = df[["ids"] + MODEL_COLS].dropna()
+    if drop_code_10:
+        model_df = model_df[model_df["expect_edu_raw"] != 10]
+    model_df = model_df.copy()
+    model_df["expect_edu_raw"] = model_df["expect_edu_raw"].astype(int)
+    for col in Z_COLS:
+        model_df[f"{col}_z"] = zscore(model_df[col])
+    return model_df
+
+
+def _source_signature(data_file):
+    paths = [Path(data_file)] + sorted(feature_dir(data_file).glob("*.parquet"))
+    return [[str(p.name), p.stat().st_size, p.stat().st_mtime_ns] for p in paths if p.exists()]
+
+
+def _cache_paths(data_file, drop_code_10):
+    cache_dir = Path(data_file).parent / ".cache"
+    stem = f"{Path(data_file).stem}.model_frame{'' if drop_code_10 else '_all'}"
+    return cache_dir / f"{stem}.npy", cache_dir / f"{stem}.json"
+
+
+def _to_records(model_df):
+    records = np.empty(len(model_df), dtype=FRAME_DTYPES)
+    for name, _dtype in FRAME_DTYPES:
+        records[name] = model_df[name].to_numpy()
+    return records
+
+
+def load_model_frame(data_file, drop_code_10=True, use_cache=True):
+    """
+    返回准备好的模型数据框（列：ids, clsids, expect_edu_raw, hukou_type, 原始与 _z 连续变量）
+    命中缓存时直接 memory-map 结构化数组，不再解析 CSV
+    """
+    array_path, manifest_path = _cache_paths(data_file, drop_code_10)
+    signature = {"version": PREP_VERSION, "sources": _source_signature(data_file)}
+
+    if use_cache and array_path.exists() and manifest_path.exists():
+        try:
+            with open(manifest_path, encoding="utf-8") as f:
+                cached = json.load(f)
+        except (OSError, ValueError):
+            cached = None
+        if cached == signature:
+            records = np.load(array_path, mmap_mode="r")
+            return pd.DataFrame({name: records[name] for name in records.dtype.names})
+
+    df = read_dataset(data_file, columns=["ids"] + MODEL_COLS)
+    missing = [c for c in MODEL_COLS if c not in df.columns]
+    if missing:
+        raise ValueError(f"Missing required columns: {missing}")
+    records = _to_records(prep_model_df(df, drop_code_10=drop_code_10))
+
+    if use_cache:
+        array_path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = array_path.with_name(f".{array_path.stem}.{os.getpid()}.npy")
+        np.save(tmp, records)
+        os.replace(tmp, array_path)
+        with open(manifest_path, "w", encoding="utf-8") as f:
+            json.dump(signature, f)
+    return pd.DataFrame({name: records[name] for name in records.dtype.names})
+
+
+def add_interactions(df, names=("linking_x_ses", "bonding_x_ses", "linking_x_hukou")):
+    """按 INTERACTIONS 的定义写入交互项列（原地），返回 df"""
+    for name in names:
+        left, right = INTERACTIONS[name]
+        df[name] = df[left] * df[right]
+    return df
+
+
+def add_columns(df, data_file, columns, standardize=True):
+    """
+    按 ids 追加模型框之外的变量（如 ses_self），并在当前样本上计算 _z 列
+    缺失值保留为 NaN，由调用方决定是否剔除；数据中不存在的列直接跳过
+    standardize=False 时不生成 _z 列（如 schids 等编码）
+    """
+    join_feature(df, read_dataset(data_file, columns=["ids"] + list(columns)))
+    if standardize:
+        for col in columns:
+            if col in df.columns:
+                df[f"{col}_z"] = zscore(df[col])
+    return df
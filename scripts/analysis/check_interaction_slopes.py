@@ -1,27 +1,18 @@
-import pandas as pd
 import numpy as np
-import statsmodels.api as sm
+import sys
 from pathlib import Path
 from scipy import stats
 
-WORKSPACE = Path(r"c:\Users\13926\Desktop\CEPS数据汇总")
-DATA_FILE = WORKSPACE / "rescued_data" / "merged_rescued_all_with_pca_ses.csv"
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+from ceps_config import DATA_FILE
+from analysis_data import PREDICTORS, add_interactions, load_model_frame
+from ordered_logit import fit_ordered_logit
+from ordinal_predict import latent_slope, marginal_effects
 
-def zscore(series):
-    return (series - series.mean()) / series.std()
 
 def main():
-    df = pd.read_csv(DATA_FILE, low_memory=False)
-    
-    # Prep data
-    cols = ["expect_edu_raw", "bonding_idx", "linking_idx", "ses_pca", "hukou_type", "cog_score"]
-    df = df[cols].dropna()
-    df = df[df["expect_edu_raw"] != 10].copy() # Drop 10
-    
-    # Z-scores
-    for c in ["bonding_idx", "linking_idx", "ses_pca", "cog_score"]:
-        df[f"{c}_z"] = zscore(df[c])
-        
+    df = load_model_frame(DATA_FILE)
+
     # --- Check Raw Data Slopes ---
     # Define Low vs High SES
     # Low: < -0.5 SD, High: > 0.5 SD (Just to get distinct groups)
@@ -46,18 +37,28 @@ def main():
         print(">> Raw Data shows High SES has STEEPER slope (Matthew visual).")
         
     # --- Check Model Implied Slopes ---
-    # Coefficient from interaction model (PCA SES): Main Bonding = 0.1464, Interaction = 0.0452
-    # Slope = 0.1464 + 0.0452 * SES_Z
-    
+    # Slope of bonding on the latent scale from the live interaction model:
+    # b_bonding + b_bonding_x_ses * SES_Z (delta-method SE)
+    add_interactions(df)
+    terms = PREDICTORS + ["linking_x_ses", "bonding_x_ses", "linking_x_hukou"]
+    res = fit_ordered_logit(df["expect_edu_raw"], df[terms])
+
     mean_low_ses_z = low_ses["ses_pca_z"].mean()
     mean_high_ses_z = high_ses["ses_pca_z"].mean()
-    
-    model_slope_low = 0.1464 + 0.0452 * mean_low_ses_z
-    model_slope_high = 0.1464 + 0.0452 * mean_high_ses_z
-    
+    at = {col: 0.0 for col in PREDICTORS}
+    at["ses_pca_z"] = np.array([mean_low_ses_z, mean_high_ses_z])
+
+    (model_slope_low, model_slope_high), (se_low, se_high) = latent_slope(res, at, "bonding_idx_z", se=True)
+    me = marginal_effects(res, at, "bonding_idx_z")
+    # Effect on P(expectation >= 7): sum over the top categories
+    top = res.levels >= 7
+    me_low, me_high = me[:, top].sum(axis=1)
+
     print("\n--- Model Implied Slopes (Latent Scale) ---")
-    print(f"Mean Low SES Z: {mean_low_ses_z:.2f} -> Model Slope: {model_slope_low:.4f}")
-    print(f"Mean High SES Z: {mean_high_ses_z:.2f} -> Model Slope: {model_slope_high:.4f}")
+    print(f"Bonding = {res.params['bonding_idx_z']:.4f}, Bonding x SES = {res.params['bonding_x_ses']:.4f}")
+    print(f"Mean Low SES Z: {mean_low_ses_z:.2f} -> Model Slope: {model_slope_low:.4f} (SE {se_low:.4f})")
+    print(f"Mean High SES Z: {mean_high_ses_z:.2f} -> Model Slope: {model_slope_high:.4f} (SE {se_high:.4f})")
+    print(f"dP(Expectation >= 7)/dBonding: Low SES {me_low:.4f}, High SES {me_high:.4f}")
     
     if model_slope_low > model_slope_high:
         print(">> Model implies Low SES has STEEPER slope.")
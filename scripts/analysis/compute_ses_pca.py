@@ -1,81 +1,183 @@
+import argparse
+
 import numpy as np
 import pandas as pd
+import sys
 from pathlib import Path
 
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+from ceps_config import DATA_FILE, RESULTS_DIR
+from feature_store import feature_dir, join_feature, write_feature
+from profiling import stage, tracing
+from ses_pca_model import PCA_COLS, SesPCA, chunk_moments, empty_moments, merge_moments
 
-WORKSPACE = Path(r"c:\Users\13926\Desktop\CEPS数据汇总")
-DATA_FILE = WORKSPACE / "rescued_data" / "merged_rescued_all_with_pca_ses.csv"
-REPORT_FILE = WORKSPACE / "results" / "phase3" / "ses_pca_report.txt"
-
-
-PCA_COLS = [
-    "parent_edu_max",
-    "family_econ",
-    "home_books",
-    "has_desk",
-    "has_computer",
-]
 
+REPORT_FILE = RESULTS_DIR / "phase3" / "ses_pca_report.txt"
+MODEL_FILE = RESULTS_DIR / "phase3" / "ses_pca_model.npz"
+# Survey-weighted companion: written alongside, never replaces ses_pca / ses_pca_group
+WEIGHTED_FEATURE = "ses_pca_w"
+MODEL_W_FILE = RESULTS_DIR / "phase3" / "ses_pca_w_model.npz"
+TRACE_FILE = RESULTS_DIR / "phase3" / "ses_pca_trace.json"
 
-def zscore_frame(df):
-    return (df - df.mean()) / df.std(ddof=0)
 
-
-def main():
-    df = pd.read_csv(DATA_FILE, low_memory=False)
+def pca_inputs(df):
     missing = [c for c in PCA_COLS if c not in df.columns]
     if missing:
         raise ValueError(f"Missing PCA inputs: {missing}")
-
-    # Treat cog_score=0 as missing (non-participant)
-    if "cog_score" in df.columns:
-        df.loc[df["cog_score"] == 0, "cog_score"] = np.nan
-
-    X = df[PCA_COLS].copy()
-    invert_computer = False
-    if "has_computer" in X.columns:
-        if X["has_computer"].corr(X["family_econ"]) < 0:
-            X["has_computer"] = 1 - X["has_computer"]
-            invert_computer = True
-    if X.isna().any().any():
+    X = df[PCA_COLS].to_numpy(dtype=float)
+    if np.isnan(X).any():
         raise ValueError("PCA inputs contain missing values.")
-
-    Xz = zscore_frame(X)
-    cov = np.cov(Xz.T, ddof=0)
-    eigvals, eigvecs = np.linalg.eigh(cov)
-    order = np.argsort(eigvals)[::-1]
-    eigvals = eigvals[order]
-    eigvecs = eigvecs[:, order]
-
-    pc1 = Xz.values @ eigvecs[:, 0]
-    # Align sign so higher scores indicate higher SES
-    if np.corrcoef(pc1, X["family_econ"].values)[0, 1] < 0:
-        pc1 = -pc1
-        eigvecs[:, 0] = -eigvecs[:, 0]
-
-    df["ses_pca"] = pc1
-    median = df["ses_pca"].median()
-    df["ses_pca_group"] = (df["ses_pca"] >= median).astype(int)
-
-    df.to_csv(DATA_FILE, index=False)
-
-    explained = eigvals / eigvals.sum()
+    return X
+
+
+def load_weights():
+    """
+    清洗阶段写出的抽样权重（features/survey_design.parquet），归一化到均值 1；
+    没有设计旁路文件时返回 None
+    """
+    path = feature_dir(DATA_FILE) / "survey_design.parquet"
+    if not path.exists():
+        return None
+    design = pd.read_parquet(path, columns=["ids", "sweight"]).dropna()
+    design = design[design["sweight"] > 0]
+    design["sweight"] = design["sweight"] / design["sweight"].mean()
+    return design
+
+
+def chunk_weights(ids, weights):
+    """按 ids 取权重；设计文件中没有的学生不参与拟合（权重 0）"""
+    matched = join_feature(pd.DataFrame({"ids": ids}), weights)["sweight"]
+    return matched.fillna(0.0).to_numpy(dtype=float)
+
+
+def weighted_median(values, weights):
+    order = np.argsort(values, kind="stable")
+    cum = np.cumsum(weights[order])
+    return values[order][np.searchsorted(cum, 0.5 * cum[-1])]
+
+
+def ses_feature(ids, scores, weights=None, name="ses_pca"):
+    feature = pd.DataFrame({"ids": ids, name: scores})
+    cut = np.median(scores) if weights is None else weighted_median(scores, weights)
+    feature[f"{name}_group"] = (feature[name] >= cut).astype(int)
+    return feature
+
+
+def run_in_memory(weights=None, name="ses_pca"):
+    df = pd.read_csv(DATA_FILE, low_memory=False, usecols=["ids"] + PCA_COLS)
+    w = None if weights is None else chunk_weights(df["ids"].to_numpy(), weights)
+    model = SesPCA.from_moments(chunk_moments(pca_inputs(df), w))
+    return model, ses_feature(df["ids"].to_numpy(), model.transform(df), w, name)
+
+
+def run_streaming(chunksize, weights=None, name="ses_pca"):
+    """
+    两遍流式读取：第一遍累积均值与 5x5 协方差，第二遍逐块打分；
+    内存中只保留每行的 ids 与 PC1 得分（用于中位数分组）
+    """
+    def chunks():
+        return pd.read_csv(DATA_FILE, low_memory=False, chunksize=chunksize, usecols=["ids"] + PCA_COLS)
+
+    moments = empty_moments(len(PCA_COLS))
+    for chunk in chunks():
+        w = None if weights is None else chunk_weights(chunk["ids"].to_numpy(), weights)
+        moments = merge_moments(moments, chunk_moments(pca_inputs(chunk), w))
+    model = SesPCA.from_moments(moments)
+
+    ids, scores = [], []
+    for chunk in chunks():
+        ids.append(chunk["ids"].to_numpy())
+        scores.append(model.transform(pca_inputs(chunk)))
+    ids = np.concatenate(ids)
+    w = None if weights is None else chunk_weights(ids, weights)
+    return model, ses_feature(ids, np.concatenate(scores), w, name)
+
+
+def fit(chunksize, weights=None, name="ses_pca"):
+    with stage("pca_streaming" if chunksize else "pca") as st:
+        if chunksize:
+            model, feature = run_streaming(chunksize, weights, name)
+        else:
+            model, feature = run_in_memory(weights, name)
+        st.frame(feature)
+        st.note(weighted=weights is not None)
+    # 派生列写入旁路特征文件，不回写 DATA_FILE
+    with stage("write_feature", feature):
+        feature_path = write_feature(DATA_FILE, name, feature)
+    return model, feature_path
+
+
+def write_loadings(f, model):
+    f.write("Explained variance ratio:\n")
+    for i, ratio in enumerate(model.explained_ratio[:5], start=1):
+        f.write(f"  PC{i}: {ratio:.4f}\n")
+    f.write("\nPC1 loadings:\n")
+    for name, loading in zip(PCA_COLS, model.loadings[:, 0]):
+        f.write(f"  {name}: {loading:.4f}\n")
+
+
+def main(chunksize=None, weighted=True):
+    # ses_pca / ses_pca_group, the predictor of every downstream model, stays unweighted
+    model, feature_path = fit(chunksize)
+    MODEL_FILE.parent.mkdir(parents=True, exist_ok=True)
+    model.save(MODEL_FILE)
+
+    weights = load_weights() if weighted else None
+    model_w = None
+    weighted_path = feature_dir(DATA_FILE) / f"{WEIGHTED_FEATURE}.parquet"
+    if weights is not None:
+        model_w, weighted_path = fit(chunksize, weights, WEIGHTED_FEATURE)
+        model_w.save(MODEL_W_FILE)
+    else:
+        if weighted:
+            print("[WARN] No survey_design sidecar found; skipping the survey-weighted ses_pca_w")
+        # A stale weighted feature must not outlive the design it was fitted with
+        weighted_path.unlink(missing_ok=True)
+        MODEL_W_FILE.unlink(missing_ok=True)
+
+    invert_computer = bool(model.invert[PCA_COLS.index("has_computer")])
     with REPORT_FILE.open("w", encoding="utf-8") as f:
         f.write("SES PCA Report\n")
         f.write("================\n")
-        f.write(f"Inputs: {', '.join(PCA_COLS)}\n\n")
+        f.write(f"Inputs: {', '.join(PCA_COLS)}\n")
+        f.write("Weights: none (sample moments); ses_pca / ses_pca_group\n\n")
         if invert_computer:
             f.write("Note: has_computer inverted (1 - value) due to negative SES correlation.\n\n")
-        f.write("Explained variance ratio:\n")
-        for i, ratio in enumerate(explained[:5], start=1):
-            f.write(f"  PC{i}: {ratio:.4f}\n")
-        f.write("\nPC1 loadings:\n")
-        for name, loading in zip(PCA_COLS, eigvecs[:, 0]):
-            f.write(f"  {name}: {loading:.4f}\n")
-
-    print(f"[DONE] Updated {DATA_FILE}")
+        write_loadings(f, model)
+
+        f.write("\n--- Survey-weighted PCA (ses_pca_w / ses_pca_w_group) ---\n")
+        if model_w is None:
+            reason = "--no-weighted" if not weighted else "no features/survey_design.parquet"
+            f.write(f"Not computed ({reason})\n")
+        else:
+            f.write("Weights: survey sampling weights (sweight, normalized to mean 1); ")
+            f.write("weighted means, correlations and median split\n")
+            f.write("Written as a separate feature; downstream models keep using the unweighted ses_pca\n\n")
+            write_loadings(f, model_w)
+            scores = pd.read_parquet(feature_path)["ses_pca"]
+            scores_w = pd.read_parquet(weighted_path)["ses_pca_w"]
+            f.write(f"\nCorrelation with unweighted ses_pca: {np.corrcoef(scores, scores_w)[0, 1]:.4f}\n")
+
+    print(f"[DONE] Saved ses_pca / ses_pca_group to {feature_path}")
+    if model_w is not None:
+        print(f"[DONE] Saved ses_pca_w / ses_pca_w_group to {weighted_path}")
     print(f"[DONE] Saved PCA report to {REPORT_FILE}")
+    print(f"[DONE] Saved PCA model to {MODEL_FILE}")
 
 
 if __name__ == "__main__":
-    main()
+    parser = argparse.ArgumentParser(description="Compute SES PC1 and store ses_pca / ses_pca_group as a sidecar feature.")
+    parser.add_argument(
+        "--chunksize",
+        type=int,
+        default=0,
+        help="rows per chunk for out-of-core PCA (0 = load the whole file)",
+    )
+    parser.add_argument(
+        "--no-weighted",
+        action="store_true",
+        help="skip (and remove) the survey-weighted ses_pca_w feature even when the survey_design sidecar exists",
+    )
+    args = parser.parse_args()
+    with tracing("compute_ses_pca", TRACE_FILE):
+        main(args.chunksize or None, weighted=not args.no_weighted)
@@ -0,0 +1,93 @@
+"""
+派生特征旁路存储 (Sidecar Feature Store)
+
+派生列（如 ses_pca / ses_pca_group）不再回写整份数据 CSV，而是按特征组写成
+<数据目录>/features/<name>.parquet，只含 ids 与派生列：
+- 写入：临时文件 + os.replace 原子替换，并发读者只会看到完整的旧版本或新版本
+- 读取：read_dataset() 读入基础 CSV 后按 ids 连接旁路列（同名列以旁路为准）；
+  指定 columns 时只打开包含所需列的特征文件
+"""
+import os
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import pyarrow.parquet as pq
+
+
+KEY = "ids"
+
+
+def feature_dir(data_file):
+    return Path(data_file).parent / "features"
+
+
+def write_feature(data_file, name, frame):
+    """frame 需含 ids 列且 ids 唯一；返回写入路径"""
+    if KEY not in frame.columns:
+        raise ValueError(f"Feature '{name}' must contain '{KEY}'")
+    if frame[KEY].duplicated().any():
+        raise ValueError(f"Feature '{name}' has duplicated '{KEY}' values")
+    out_dir = feature_dir(data_file)
+    out_dir.mkdir(parents=True, exist_ok=True)
+    path = out_dir / f"{name}.parquet"
+    tmp = out_dir / f".{name}.{os.getpid()}.parquet.tmp"
+    frame.to_parquet(tmp, index=False)
+    os.replace(tmp, path)
+    return path
+
+
+def list_features(data_file):
+    """{特征名: 列名列表}，只读 parquet schema"""
+    out_dir = feature_dir(data_file)
+    if not out_dir.exists():
+        return {}
+    features = {}
+    for path in sorted(out_dir.glob("*.parquet")):
+        names = pq.read_schema(path).names
+        features[path.stem] = [c for c in names if c != KEY]
+    return features
+
+
+def join_feature(df, feature):
+    """按 ids 把 feature 的列写入 df（原地，覆盖同名列），无匹配为 NaN"""
+    pos = pd.Index(feature[KEY]).get_indexer(df[KEY])
+    matched = pos >= 0
+    for col in feature.columns:
+        if col == KEY:
+            continue
+        values = feature[col].to_numpy()
+        if matched.all():
+            df[col] = values[pos]
+            continue
+        out = np.full(len(df), np.nan, dtype=float if values.dtype.kind in "biuf" else object)
+        out[matched] = values[pos[matched]]
+        df[col] = out
+    return df
+
+
+def read_dataset(data_file, columns=None):
+    """
+    读取基础 CSV 并连接旁路特征
+    columns=None 时读取全部列与全部特征；否则只读所需列（ids 总会读入）
+    """
+    features = list_features(data_file)
+    if columns is None:
+        df = pd.read_csv(data_file, low_memory=False)
+        wanted = features
+    else:
+        columns = list(columns)
+        wanted = {name: [c for c in cols if c in columns] for name, cols in features.items()}
+        wanted = {name: cols for name, cols in wanted.items() if cols}
+        from_features = {c for cols in wanted.values() for c in cols}
+        base_cols = [KEY] + [c for c in columns if c != KEY and c not in from_features]
+        df = pd.read_csv(data_file, low_memory=False, usecols=lambda c: c in base_cols)
+
+    for name, cols in wanted.items():
+        path = feature_dir(data_file) / f"{name}.parquet"
+        join_feature(df, pd.read_parquet(path, columns=[KEY] + cols))
+
+    if columns is not None:
+        ordered = [KEY] + [c for c in columns if c != KEY]
+        df = df[[c for c in ordered if c in df.columns]]
+    return df
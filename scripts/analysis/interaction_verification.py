@@ -1,61 +1,33 @@
+import argparse
+
 import pandas as pd
 import numpy as np
-import statsmodels.api as sm
-from statsmodels.miscmodels.ordinal_model import OrderedModel
-from statsmodels.stats.sandwich_covariance import cov_cluster
+import sys
 from pathlib import Path
 
-WORKSPACE = Path(r"c:\Users\13926\Desktop\CEPS数据汇总")
-DATA_FILE = WORKSPACE / "rescued_data" / "merged_rescued_all_with_pca_ses.csv"
-OUTPUT_FILE = WORKSPACE / "results" / "phase3" / "interaction_verification_report.txt"
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+from ceps_config import DATA_FILE, RESULTS_DIR
+from analysis_data import INTERACTIONS, add_interactions, load_model_frame
+from cluster_bootstrap import cluster_bootstrap
+from ordered_logit import cov_cluster, fit_ordered_logit
+from profiling import stage, tracing
 
-def zscore(series):
-    std = series.std()
-    if std == 0 or pd.isna(std):
-        return series * 0
-    return (series - series.mean()) / std
-
-def load_and_prep():
-    df = pd.read_csv(DATA_FILE, low_memory=False)
-    
-    # Select columns
-    cols = ["expect_edu_raw", "bonding_idx", "linking_idx", "ses_pca", "hukou_type", "cog_score", "clsids"]
-    df = df[cols].dropna()
-    
-    # Drop "10=无所谓"
-    df = df[df["expect_edu_raw"] != 10].copy()
-    df["expect_edu_raw"] = df["expect_edu_raw"].astype(int)
-    
-    # Standardize continuous variables
-    for col in ["bonding_idx", "linking_idx", "ses_pca", "cog_score"]:
-        df[f"{col}_z"] = zscore(df[col])
-        
-    return df
+OUTPUT_FILE = RESULTS_DIR / "phase3" / "interaction_verification_report.txt"
+TRACE_FILE = RESULTS_DIR / "phase3" / "interaction_verification_trace.json"
 
 def run_model(df, formula_name, predictors):
     y = df["expect_edu_raw"]
     
-    # Start with base columns that exist in df
-    base_cols = [p for p in predictors if p in df.columns]
-    X = df[base_cols].copy()
-    
-    # Add interaction terms manually
-    if "linking_x_ses" in predictors:
-        X["linking_x_ses"] = df["linking_idx_z"] * df["ses_pca_z"]
-    if "bonding_x_ses" in predictors:
-        X["bonding_x_ses"] = df["bonding_idx_z"] * df["ses_pca_z"]
-    if "linking_x_hukou" in predictors:
-        X["linking_x_hukou"] = df["linking_idx_z"] * df["hukou_type"]
-        
-    # Ensure X has all requested predictors in correct order
-    X = X[predictors]
+    # Interaction terms come from the shared definitions in analysis_data
+    df = add_interactions(df.copy(), [p for p in predictors if p in INTERACTIONS])
+    X = df[predictors]
     
-    model = OrderedModel(y, X, distr="logit")
-    res = model.fit(method="bfgs", disp=False)
-    return res
+    with stage(f"ordered_logit_fit:{formula_name}", X):
+        return fit_ordered_logit(y, X)
 
 def cluster_robust_stats(result, df, predictors):
-    cov = cov_cluster(result, df["clsids"])
+    with stage("cov_cluster", df):
+        cov = cov_cluster(result, df["clsids"])
     se = np.sqrt(np.diag(cov))
     params = result.params
     
@@ -72,9 +44,11 @@ def cluster_robust_stats(result, df, predictors):
 
 import scipy.stats as stats
 
-def main():
-    df = load_and_prep()
+def main(n_boot=0, boot_method="pairs"):
+    with stage("load_model_frame") as st:
+        df = st.frame(load_model_frame(DATA_FILE))
     
+    OUTPUT_FILE.parent.mkdir(parents=True, exist_ok=True)
     with open(OUTPUT_FILE, "w", encoding="utf-8") as f:
         f.write("=== Interaction Verification for CEPS Hypotheses ===\n\n")
         
@@ -109,6 +83,18 @@ def main():
         table_2 = cluster_robust_stats(res_2, df, predictors_2)
         f.write(table_2.to_string())
         f.write("\n\n")
+
+        if n_boot:
+            f.write(f"--- Model 2: Cluster Bootstrap by class ({boot_method}, B={n_boot}) ---\n")
+            with stage("cluster_bootstrap", df) as st:
+                st.note(n_boot=n_boot, method=boot_method)
+                boot_2, _draws = cluster_bootstrap(res_2, df["clsids"], n_boot=n_boot, method=boot_method)
+            f.write(boot_2.to_string())
+            f.write(
+                f"\nFailed replicates: {boot_2.attrs['n_failed']}   "
+                f"Unconverged (dropped): {boot_2.attrs['n_unconverged']}   "
+                f"Jackknife dropped: {boot_2.attrs['n_jackknife_dropped']}\n\n"
+            )
         
         f.write("--- Interpretation Guide ---\n")
         f.write("H2a: Linking benefits Low-SES > High-SES. Expect 'linking_x_ses' < 0.\n")
@@ -118,4 +104,9 @@ def main():
     print(f"Report generated: {OUTPUT_FILE}")
 
 if __name__ == "__main__":
-    main()
+    parser = argparse.ArgumentParser(description="Interaction checks for H2a-H2c.")
+    parser.add_argument("--bootstrap", type=int, default=0, help="cluster bootstrap replicates (0 = off)")
+    parser.add_argument("--bootstrap-method", choices=["pairs", "score"], default="pairs")
+    args = parser.parse_args()
+    with tracing("interaction_verification", TRACE_FILE):
+        main(args.bootstrap, args.bootstrap_method)
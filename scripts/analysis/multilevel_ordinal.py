@@ -0,0 +1,408 @@
+"""
+随机截距有序 logit (Multilevel Ordered Logit)
+
+  P(y_i <= j) = F(c_j - x_i'b - u_c - v_s)，u_c ~ N(0, sd_c^2)（班级），v_s ~ N(0, sd_s^2)（学校，可选）
+
+- 学生按 (学校, 班级) 排序，逐班/逐校的似然贡献用 np.add.reduceat 分段求和，全部向量化
+- 随机效应众数：对所有班级（及学校）同时做阻尼 Newton 迭代（每次求值都从 0 出发，似然只取决于参数；
+  逐班/逐校步长减半直到后验不下降，梯度绝对值 < MODE_TOL 时停止，未收敛则抛 RuntimeError）；
+  嵌套时 (u_c, v_s) 的 Hessian 为箭头形，按学校用 Schur 补闭式求解
+- 自适应 Gauss-Hermite 积分（每层 n_quad 个节点，n_quad=1 即 Laplace 近似）：
+  仅班级一层时节点以班级众数为中心；嵌套时学校节点以联合众数为中心、按 Schur 补曲率缩放，
+  每个学校节点下再对班级做条件众数上的自适应积分，全部为 (学生, 学校节点, 班级节点) 数组运算
+- 外层对 [b, 阈值增量参数, log sd] 做 BFGS，使用解析得分；标准误取得分的数值 Jacobian
+- 外层未收敛（或似然低于单层模型）时发出 ConvergenceWarning，结果中不报告 ICC 与 LR 检验
+- ICC 以潜变量 logistic 方差 pi^2/3 为残差方差
+"""
+import warnings
+
+import numpy as np
+import pandas as pd
+from scipy import optimize, stats
+from scipy.special import logsumexp
+
+from ordered_logit import (
+    ConvergenceWarning,
+    _cut_indicators,
+    bound_terms,
+    encode_outcome,
+    fit_ordered_logit,
+    threshold_jacobian,
+    thresholds_from_params,
+)
+
+
+LOGISTIC_VAR = np.pi ** 2 / 3
+MODE_TOL = 1e-8
+MODE_MAXITER = 100
+
+
+def _obs_terms(cuts, codes, eta):
+    """逐观测 log P 及其对线性预测值的一、二阶导数"""
+    prob, g_up, g_lo, h_uu, h_ll, h_ul = bound_terms(cuts, codes, eta)
+    return np.log(prob), -(g_up + g_lo), h_uu + 2 * h_ul + h_ll
+
+
+def _segment_starts(codes):
+    """已排序编码 -> 每段起始下标"""
+    return np.flatnonzero(np.r_[True, codes[1:] != codes[:-1]])
+
+
+def _segment_index(starts, n):
+    """每个元素所属的段号"""
+    index = np.zeros(n, dtype=np.int64)
+    index[starts[1:]] = 1
+    return np.cumsum(index)
+
+
+def _damped_newton(evaluate, direction, x, spread):
+    """
+    逐块可分的凹目标（逐班或逐校的对数后验）的阻尼 Newton
+    - evaluate(x) -> (逐块目标 f, 梯度列表, 曲率)；direction(梯度, 曲率) -> 各分量的 Newton 步
+    - spread(t) 把逐块步长展开到 x 的各分量；目标下降的块步长减半，其余块照常前进
+    返回 (x, 曲率)
+    """
+    f, grad, curv = evaluate(x)
+    for _ in range(MODE_MAXITER):
+        g_max = max(np.max(np.abs(g)) for g in grad)
+        if g_max < MODE_TOL:
+            return x, curv
+        step = direction(grad, curv)
+        t = np.ones_like(f)
+        # Allow for rounding noise in the summed log posterior
+        slack = 1e-12 * np.maximum(1.0, np.abs(f))
+        while True:
+            trial = [xi + ti * si for xi, ti, si in zip(x, spread(t), step)]
+            f_new, grad_new, curv_new = evaluate(trial)
+            worse = ~(f_new >= f - slack)
+            if not worse.any():
+                break
+            t = np.where(worse, t / 2, t)
+            if t.min() < 1e-10:
+                if g_max < np.sqrt(MODE_TOL):
+                    # Already at the mode to within rounding
+                    return x, curv
+                raise RuntimeError("Random-effect mode search failed to improve the posterior")
+        x, f, grad, curv = trial, f_new, grad_new, curv_new
+    raise RuntimeError(f"Random-effect modes did not converge in {MODE_MAXITER} Newton steps")
+
+
+class _Layout:
+    """按 (学校, 班级) 排序后的分段信息"""
+
+    def __init__(self, classes, schools=None):
+        cls_codes, _ = pd.factorize(np.asarray(classes))
+        if schools is None:
+            order = np.argsort(cls_codes, kind="stable")
+        else:
+            sch_codes, _ = pd.factorize(np.asarray(schools))
+            order = np.lexsort((cls_codes, sch_codes))
+        self.order = order
+        cls_sorted = cls_codes[order]
+        self.cls_starts = _segment_starts(cls_sorted)
+        self.n_cls = len(self.cls_starts)
+        self.obs_cls = _segment_index(self.cls_starts, len(order))
+        self.nested = schools is not None
+        if self.nested:
+            if len(np.unique(cls_sorted[self.cls_starts])) != self.n_cls:
+                raise ValueError("Each class must belong to exactly one school")
+            sch_of_cls = sch_codes[order][self.cls_starts]
+            self.sch_starts = _segment_starts(sch_of_cls)
+            self.n_sch = len(self.sch_starts)
+            self.cls_sch = _segment_index(self.sch_starts, self.n_cls)
+
+
+class MultilevelOrderedLogit:
+    def __init__(self, y, X, classes, schools=None, n_quad=7):
+        self.layout = _Layout(classes, schools)
+        order = self.layout.order
+        codes, self.levels = encode_outcome(y)
+        self.exog_names = list(X.columns)
+        self.codes = codes[order]
+        self.X = np.asarray(X, dtype=float)[order]
+        self.nobs = len(self.codes)
+        self.k_exog = self.X.shape[1]
+        self.n_cut = len(self.levels) - 1
+        self.nested = self.layout.nested
+        self.n_quad = int(n_quad)
+        self.nodes, self.weights = np.polynomial.hermite.hermgauss(self.n_quad)
+        self.log_w = np.log(self.weights) + self.nodes ** 2
+        self.up, self.lo = _cut_indicators(self.codes, self.n_cut)
+
+    @property
+    def param_names(self):
+        names = self.exog_names + [f"{self.levels[i]}/{self.levels[i + 1]}" for i in range(self.n_cut)]
+        names.append("log_sd(class)")
+        if self.nested:
+            names.append("log_sd(school)")
+        return names
+
+    def _split(self, params):
+        k, m = self.k_exog, self.n_cut
+        return params[:k], params[k:k + m], np.exp(params[k + m:])
+
+    def loglike(self, params):
+        return self.loglike_and_score(params, score=False)[0]
+
+    def score(self, params):
+        if self.n_quad < 3:
+            # The fixed-node score is too rough for Laplace; use central differences
+            h = 1e-5 * np.maximum(1.0, np.abs(params))
+            return np.array([(self.loglike(params + e) - self.loglike(params - e)) / (2 * e[i]) for i, e in enumerate(np.diag(h))])
+        return self.loglike_and_score(params)[1]
+
+    def _class_modes(self, cuts, eta0, var_c, u0):
+        """班级截距的条件众数与该处曲率；eta0 (n, *S) 为不含班级截距的线性预测值，u0 (n_cls, *S) 为初值"""
+        lay = self.layout
+        codes = self.codes.reshape((-1,) + (1,) * (eta0.ndim - 1))
+
+        def evaluate(x):
+            (u,) = x
+            log_p, d1, d2 = _obs_terms(cuts, codes, eta0 + u[lay.obs_cls])
+            f = np.add.reduceat(log_p, lay.cls_starts, axis=0) - u ** 2 / (2 * var_c)
+            g = np.add.reduceat(d1, lay.cls_starts, axis=0) - u / var_c
+            a = np.add.reduceat(d2, lay.cls_starts, axis=0) - 1 / var_c
+            return f, [g], a
+
+        (u,), a = _damped_newton(evaluate, lambda grad, a: [-grad[0] / a], [u0], lambda t: [t])
+        return u, a
+
+    def _joint_modes(self, cuts, xb, var_c, var_s):
+        """嵌套时 (班级, 学校) 截距的联合后验众数及学校层的 Schur 补曲率；从 0 出发，按学校阻尼"""
+        lay = self.layout
+
+        def evaluate(x):
+            u, v = x
+            log_p, d1, d2 = _obs_terms(cuts, self.codes, xb + (u + v[lay.cls_sch])[lay.obs_cls])
+            f_cls = np.add.reduceat(log_p, lay.cls_starts) - u ** 2 / (2 * var_c)
+            f = np.add.reduceat(f_cls, lay.sch_starts) - v ** 2 / (2 * var_s)
+            s1 = np.add.reduceat(d1, lay.cls_starts)
+            s2 = np.add.reduceat(d2, lay.cls_starts)
+            g_u = s1 - u / var_c
+            g_v = np.add.reduceat(s1, lay.sch_starts) - v / var_s
+            a = s2 - 1 / var_c
+            schur = np.add.reduceat(s2, lay.sch_starts) - 1 / var_s - np.add.reduceat(s2 ** 2 / a, lay.sch_starts)
+            return f, [g_u, g_v], (s2, a, schur)
+
+        def direction(grad, curv):
+            # Arrowhead Newton system per school via the Schur complement
+            g_u, g_v = grad
+            s2, a, schur = curv
+            dv = (-g_v + np.add.reduceat(s2 * g_u / a, lay.sch_starts)) / schur
+            du = (-g_u - s2 * dv[lay.cls_sch]) / a
+            return [du, dv]
+
+        start = [np.zeros(lay.n_cls), np.zeros(lay.n_sch)]
+        (u, v), (_s2, _a, schur) = _damped_newton(evaluate, direction, start, lambda t: [t[lay.cls_sch], t])
+        return u, v, schur
+
+    def _class_quadrature(self, cuts, eta0, var_c, u0):
+        """
+        班级层自适应 GH；eta0 (n, *S) 为不含班级截距的线性预测值，u0 (n_cls, *S) 为众数初值
+        返回 (log L_c (n_cls, *S), 节点 t (n_cls, *S, K), 后验节点权重 (n_cls, *S, K), 节点处的界项)
+        """
+        lay = self.layout
+        codes = self.codes.reshape((-1,) + (1,) * (eta0.ndim - 1))
+        u, a = self._class_modes(cuts, eta0, var_c, u0)
+        scale = np.sqrt(2.0 / -a)
+
+        # Nodes centred at the conditional mode, scaled by the curvature
+        t = u[..., None] + scale[..., None] * self.nodes
+        terms = bound_terms(cuts, codes[..., None], eta0[..., None] + t[lay.obs_cls])
+        h = np.add.reduceat(np.log(terms[0]), lay.cls_starts, axis=0) - t ** 2 / (2 * var_c)
+        h = h - 0.5 * np.log(2 * np.pi * var_c) + self.log_w
+        log_lik = logsumexp(h, axis=-1)
+        return log_lik + np.log(scale), t, np.exp(h - log_lik[..., None]), terms
+
+    def loglike_and_score(self, params, score=True):
+        """
+        对数似然与得分；得分按节点固定（自适应节点位置视为常数）求导，
+        其误差与积分误差同阶，n_quad >= 5 时可忽略；n_quad < 3 时 score() 改用数值差分
+        """
+        params = np.asarray(params, dtype=float)
+        beta, theta, sd = self._split(params)
+        cuts = thresholds_from_params(theta)
+        var = sd ** 2
+        lay = self.layout
+        xb = self.X @ beta
+
+        if not self.nested:
+            log_lik, t, post, terms = self._class_quadrature(cuts, xb, var[0], np.zeros(lay.n_cls))
+            llf = float(log_lik.sum())
+            obs_w = post[lay.obs_cls]
+            grad_sd = [float((post * (t ** 2 / var[0] - 1)).sum())]
+        else:
+            u, v, schur = self._joint_modes(cuts, xb, var[0], var[1])
+            # Outer nodes for the school intercept, centred at the joint mode
+            scale = np.sqrt(2.0 / -schur)
+            vt = v[:, None] + scale[:, None] * self.nodes
+            eta0 = xb[:, None] + vt[lay.cls_sch][lay.obs_cls]
+            u0 = np.repeat(u[:, None], self.n_quad, axis=1)
+            log_cls, t, post_cls, terms = self._class_quadrature(cuts, eta0, var[0], u0)
+            h = np.add.reduceat(log_cls, lay.sch_starts, axis=0) - vt ** 2 / (2 * var[1])
+            h = h - 0.5 * np.log(2 * np.pi * var[1]) + self.log_w
+            log_sch = logsumexp(h, axis=-1)
+            llf = float((log_sch + np.log(scale)).sum())
+            post_sch = np.exp(h - log_sch[:, None])
+            joint = post_sch[lay.cls_sch][..., None] * post_cls
+            obs_w = joint[lay.obs_cls]
+            grad_sd = [
+                float((joint * (t ** 2 / var[0] - 1)).sum()),
+                float((post_sch * (vt ** 2 / var[1] - 1)).sum()),
+            ]
+        if not score:
+            return llf, None
+
+        _prob, g_up, g_lo, *_ = terms
+        axes = tuple(range(1, obs_w.ndim))
+        w_up = (obs_w * g_up).sum(axis=axes)
+        w_lo = (obs_w * g_lo).sum(axis=axes)
+        grad_beta = -self.X.T @ (w_up + w_lo)
+        grad_cut = self.up.T @ w_up + self.lo.T @ w_lo
+        grad = np.concatenate([grad_beta, threshold_jacobian(theta).T @ grad_cut, grad_sd])
+        return llf, grad
+
+    def start_params(self):
+        fixed = fit_ordered_logit(pd.Series(self.levels[self.codes]), pd.DataFrame(self.X, columns=self.exog_names))
+        log_sd = [np.log(0.5)] * (2 if self.nested else 1)
+        return np.concatenate([fixed.params.values, log_sd]), fixed.llf
+
+    def fit(self, start_params=None, maxiter=500):
+        fixed_llf = None
+        if start_params is None:
+            start_params, fixed_llf = self.start_params()
+
+        def objective(p):
+            if self.n_quad < 3:
+                return -self.loglike(p), -self.score(p)
+            llf, grad = self.loglike_and_score(p)
+            return -llf, -grad
+
+        opt = optimize.minimize(objective, start_params, jac=True, method="BFGS", options={"maxiter": maxiter})
+        hess = numeric_jacobian(self.score, opt.x)
+        hess = (hess + hess.T) / 2
+        max_score = np.max(np.abs(self.score(opt.x)))
+        converged = opt.success or max_score < 1e-3
+        # The single-level model is the sd -> 0 limit, so a proper optimum cannot be below it
+        below_fixed = fixed_llf is not None and -opt.fun < fixed_llf - 1e-6 * abs(fixed_llf)
+        if not converged or below_fixed:
+            reason = "log-likelihood below the single-level model" if below_fixed else opt.message.rstrip(".")
+            warnings.warn(
+                f"Multilevel ordered logit did not converge ({reason}; max |score| = {max_score:.2e})",
+                ConvergenceWarning,
+                stacklevel=2,
+            )
+            converged = False
+        return MultilevelOrderedResults(self, opt.x, -opt.fun, hess, converged, opt.nit, fixed_llf)
+
+
+def numeric_jacobian(f, x, rel_step=1e-5):
+    """中心差分 Jacobian（用于由得分求 Hessian）"""
+    x = np.asarray(x, dtype=float)
+    h = rel_step * np.maximum(1.0, np.abs(x))
+    cols = []
+    for i in range(len(x)):
+        e = np.zeros(len(x))
+        e[i] = h[i]
+        cols.append((f(x + e) - f(x - e)) / (2 * h[i]))
+    return np.column_stack(cols)
+
+
+class MultilevelOrderedResults:
+    def __init__(self, model, params, llf, hessian, converged, n_iter, fixed_llf=None):
+        self.model = model
+        self.params = pd.Series(params, index=model.param_names)
+        self.llf = llf
+        self.hessian = hessian
+        self.converged = converged
+        self.n_iter = n_iter
+        self.fixed_llf = fixed_llf
+        self.nobs = model.nobs
+
+    def cov_params(self):
+        return pd.DataFrame(np.linalg.inv(-self.hessian), index=self.params.index, columns=self.params.index)
+
+    @property
+    def bse(self):
+        return pd.Series(np.sqrt(np.diag(self.cov_params().values)), index=self.params.index)
+
+    @property
+    def aic(self):
+        return -2 * self.llf + 2 * len(self.params)
+
+    @property
+    def bic(self):
+        return -2 * self.llf + np.log(self.nobs) * len(self.params)
+
+    def fe_table(self):
+        """固定效应（系数与阈值增量参数）"""
+        k = self.model.k_exog + self.model.n_cut
+        params, bse = self.params.iloc[:k], self.bse.iloc[:k]
+        z = params / bse
+        return pd.DataFrame({"coef": params, "std err": bse, "z": z, "P>|z|": 2 * stats.norm.sf(np.abs(z))})
+
+    def variance_table(self):
+        """随机截距的 sd 与方差（delta 法 SE）及 ICC；未收敛时 ICC 为 NaN"""
+        k = self.model.k_exog + self.model.n_cut
+        log_sd = self.params.iloc[k:]
+        sd = np.exp(log_sd.values)
+        se_log = self.bse.iloc[k:].values
+        variances = sd ** 2
+        total = variances.sum() + LOGISTIC_VAR
+        levels = ["class", "school"][: len(sd)]
+        icc = variances / total if self.converged else np.full(len(sd), np.nan)
+        table = pd.DataFrame(
+            {"sd": sd, "sd_se": sd * se_log, "variance": variances, "ICC": icc},
+            index=levels,
+        )
+        if len(sd) > 1:
+            # Correlation of two students in the same class (shares both intercepts)
+            table.loc["class+school"] = [np.nan, np.nan, variances.sum(), icc.sum()]
+        return table
+
+    def lr_vs_fixed(self):
+        """
+        对单层固定效应模型的 LR（方差在边界上）：p 值取 0.5 chi2_{df-1} + 0.5 chi2_df 混合，
+        仅班级一层时即 0.5 chi2_0 + 0.5 chi2_1，班级 + 学校两层时为 0.5 chi2_1 + 0.5 chi2_2；
+        没有单层似然或未收敛时返回 None
+        """
+        if self.fixed_llf is None or not self.converged:
+            return None
+        lr = 2 * (self.llf - self.fixed_llf)
+        df = len(self.params) - self.model.k_exog - self.model.n_cut
+        # chi2_0 is a point mass at zero, so it adds nothing for lr > 0
+        p_lower = stats.chi2.sf(lr, df - 1) if df > 1 else 0.0
+        return lr, df, 0.5 * p_lower + 0.5 * stats.chi2.sf(lr, df)
+
+    def summary(self, title="Multilevel Ordered Logit (random intercepts)"):
+        method = "Laplace" if self.model.n_quad == 1 else f"Adaptive Gauss-Hermite ({self.model.n_quad} nodes per level)"
+        lay = self.model.layout
+        groups = f"Classes: {lay.n_cls}" + (f"   Schools: {lay.n_sch}" if self.model.nested else "")
+        lines = [
+            title,
+            "=" * 78,
+            f"Dep. Variable: expect_edu_raw   No. Observations: {self.nobs}   {groups}",
+            f"Log-Likelihood: {self.llf:.3f}   AIC: {self.aic:.1f}   BIC: {self.bic:.1f}",
+            f"Method: {method}, BFGS   Iterations: {self.n_iter}   Converged: {self.converged}",
+            "-" * 78,
+            self.fe_table().to_string(float_format=lambda x: f"{x:.4f}"),
+            "-" * 78,
+            "Random intercepts (ICC on the latent scale, residual variance pi^2/3):",
+            self.variance_table().to_string(float_format=lambda x: f"{x:.4f}", na_rep=""),
+        ]
+        lr = self.lr_vs_fixed()
+        if lr is not None:
+            lines.append(f"LR vs single-level model: {lr[0]:.3f}, df={lr[1]}, p~{lr[2]:.4f} (boundary-corrected)")
+        elif not self.converged:
+            lines.append("Not converged: ICC and LR test vs the single-level model are not reported.")
+        lines.append("=" * 78)
+        return "\n".join(lines)
+
+
+def fit_multilevel_ordinal(y, X, classes, schools=None, n_quad=7, start_params=None):
+    """
+    y：有序结果；X：DataFrame（不含常数项）；classes / schools：逐行的班级 / 学校标签
+    schools=None 时只用班级一层，否则为班级嵌套于学校；n_quad=1 即 Laplace 近似
+    """
+    model = MultilevelOrderedLogit(y, X, classes, schools, n_quad=n_quad)
+    return model.fit(start_params)
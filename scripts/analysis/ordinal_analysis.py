@@ -1,86 +1,61 @@
+import argparse
 import math
+import sys
 from pathlib import Path
 
 import numpy as np
 import pandas as pd
-import statsmodels.api as sm
-from statsmodels.stats.sandwich_covariance import cov_cluster
 from scipy import stats
-from statsmodels.miscmodels.ordinal_model import OrderedModel
 
-
-WORKSPACE = Path(r"c:\Users\13926\Desktop\CEPS数据汇总")
-DATA_FILE = WORKSPACE / "rescued_data" / "merged_rescued_all_with_pca_ses.csv"
-OUTPUT_DIR = WORKSPACE / "results" / "phase3"
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+from ceps_config import DATA_FILE, RESULTS_DIR
+from analysis_data import MODEL_COLS, PREDICTORS, Z_COLS, add_columns, load_model_frame
+from cluster_bootstrap import cluster_bootstrap
+from feature_store import read_dataset
+import ordered_logit
+from multilevel_ordinal import fit_multilevel_ordinal
+from profiling import stage, tracing
+import proportional_odds
+from ordered_logit import cov_cluster
+from survey import (
+    DESIGN_COLS,
+    SurveyDesign,
+    domain_mean_diff,
+    fit_survey_ordered_logit,
+    rao_scott_chi2,
+    weighted_zscore,
+)
+
+
+OUTPUT_DIR = RESULTS_DIR / "phase3"
 OUTPUT_DIR.mkdir(parents=True, exist_ok=True)
-
-
-def zscore(series):
-    std = series.std()
-    if std == 0 or pd.isna(std):
-        return series * 0
-    return (series - series.mean()) / std
+TRACE_FILE = OUTPUT_DIR / "ordinal_model_trace.json"
 
 
 def load_data():
     if not DATA_FILE.exists():
         raise FileNotFoundError(f"Missing data file: {DATA_FILE}")
-    df = pd.read_csv(DATA_FILE, low_memory=False)
-    required = [
-        "expect_edu_raw",
-        "bonding_idx",
-        "linking_idx",
-        "ses_pca",
-        "hukou_type",
-        "cog_score",
-        "clsids",
-    ]
-    missing = [c for c in required if c not in df.columns]
+    df = read_dataset(DATA_FILE, columns=MODEL_COLS)
+    missing = [c for c in MODEL_COLS if c not in df.columns]
     if missing:
         raise ValueError(f"Missing required columns: {missing}")
     return df
 
 
-def prep_model_df(df, drop_code_10=True):
-    model_df = df[
-        [
-            "expect_edu_raw",
-            "bonding_idx",
-            "linking_idx",
-            "ses_pca",
-            "hukou_type",
-            "cog_score",
-            "clsids",
-        ]
-    ].copy()
-    model_df = model_df.dropna()
-    if drop_code_10:
-        model_df = model_df[model_df["expect_edu_raw"] != 10]
-    model_df["expect_edu_raw"] = model_df["expect_edu_raw"].astype(int)
-    for col in ["bonding_idx", "linking_idx", "ses_pca", "cog_score"]:
-        model_df[f"{col}_z"] = zscore(model_df[col])
-    return model_df
-
-
 def fit_ordered_logit(model_df):
     y = model_df["expect_edu_raw"]
     X = model_df[
         ["bonding_idx_z", "linking_idx_z", "ses_pca_z", "hukou_type", "cog_score_z"]
     ]
-    model = OrderedModel(y, X, distr="logit")
-    res = model.fit(method="bfgs", disp=False)
-    return res
+    return ordered_logit.fit_ordered_logit(y, X)
 
 
-def fit_mnlogit(model_df):
+def fit_mnlogit(model_df, ord_res=None):
     y = model_df["expect_edu_raw"]
     X = model_df[
         ["bonding_idx_z", "linking_idx_z", "ses_pca_z", "hukou_type", "cog_score_z"]
     ]
-    X = sm.add_constant(X, has_constant="add")
-    mn = sm.MNLogit(y, X)
-    mn_res = mn.fit(method="newton", disp=False)
-    return mn_res
+    return proportional_odds.fit_mnlogit(y, X, ordered=ord_res)
 
 
 def lr_test_ordered_vs_mnlogit(ord_res, mn_res):
@@ -158,8 +133,66 @@ def cluster_robust_table(result, groups):
     return table
 
 
-def main():
-    df = load_data()
+def write_survey_section(f, df, model_df):
+    """
+    按抽样设计加权的描述统计与有序 logit（设计变量见 survey.py）：
+    加权分布、10 vs 1-9 的设计 t 检验与 Rao-Scott 卡方、加权 z 分数上的伪似然有序 logit + 设计标准误
+    """
+    f.write("--- Survey-weighted Estimates (sampling weights, strata, PSUs) ---\n")
+    add_columns(df, DATA_FILE, DESIGN_COLS, standardize=False)
+    if "sweight" not in df.columns:
+        f.write("Survey design variables not in data (no features/survey_design.parquet); skipped.\n\n")
+        return
+    weighted = df[df["sweight"].notna() & (df["sweight"] > 0)].reset_index(drop=True)
+    design = SurveyDesign.from_frame(weighted)
+    f.write(
+        f"Rows with weights: {design.nobs} of {len(df)}; strata={design.n_strata}, PSUs={design.n_psu}, "
+        f"design df={design.df}"
+    )
+    if design.n_singleton:
+        f.write(f"; {design.n_singleton} single-PSU strata contribute no variance")
+    f.write("\n\n")
+
+    w = design.weights
+    expect = weighted["expect_edu_raw"]
+    shares = pd.Series(w).groupby(expect.to_numpy()).sum() / w[expect.notna().to_numpy()].sum()
+    f.write("Weighted distribution (expect_edu_raw, share):\n")
+    f.write(shares.sort_index().to_string(float_format=lambda x: f"{x:.4f}"))
+    f.write("\n\n")
+
+    in_10 = (expect == 10).to_numpy()
+    in_1to9 = expect.between(1, 9).to_numpy()
+    f.write("Group 10 vs 1-9 (design-based t-tests on weighted domain means):\n")
+    for col in ["ses_pca", "cog_score", "bonding_idx", "linking_idx"]:
+        diff, se, t_stat, p_val, dof = domain_mean_diff(weighted[col], in_10, in_1to9, design)
+        f.write(f"{col}: diff={diff:.4f}, se={se:.4f}, t={t_stat:.3f}, df={dof}, p={p_val:.4f}\n")
+    group = np.where(in_10, "10", np.where(in_1to9, "1-9", None))
+    rs = rao_scott_chi2(pd.Series(group, dtype=object), weighted["hukou_type"], design)
+    if rs:
+        f.write(
+            f"hukou_type: Rao-Scott chi2={rs['chi2']:.3f}, dof={rs['df']}, p={rs['p']:.4f} "
+            f"(Pearson X2={rs['pearson']:.3f}, mean deff={rs['mean_deff']:.3f}; "
+            f"F={rs['F']:.3f} on ({rs['df_num']:.2f}, {rs['df_den']:.1f}) df, p={rs['p_F']:.4f})\n"
+        )
+    f.write("\n")
+
+    # Fit on the analysis sample as a domain of the full design; z-scores use the weighted moments
+    domain = weighted["ids"].isin(model_df["ids"]).to_numpy()
+    svy_df = weighted.loc[domain, ["ids"]].merge(
+        model_df[["ids", "expect_edu_raw", "hukou_type"] + Z_COLS], on="ids", how="left"
+    )
+    for col in Z_COLS:
+        svy_df[f"{col}_z"] = weighted_zscore(svy_df[col], w[domain])
+    f.write(f"Weighted ordered logit (drop 10, weighted z-scores): rows={len(svy_df)}\n")
+    with stage("survey_ordered_logit_fit", svy_df):
+        svy_res = fit_survey_ordered_logit(svy_df["expect_edu_raw"], svy_df[PREDICTORS], design, domain)
+    f.write(svy_res.summary(title="Survey-weighted Ordered Logit Results"))
+    f.write("\n\n")
+
+
+def main(n_boot=0, boot_method="pairs", multilevel=True, n_quad=7, survey=True):
+    with stage("load_data") as st:
+        df = st.frame(load_data())
     report_path = OUTPUT_DIR / "ordinal_model_report.txt"
 
     with report_path.open("w", encoding="utf-8") as f:
@@ -186,25 +219,78 @@ def main():
         f.write("\n")
 
         f.write("--- Main Model: Ordered Logit (drop 10) ---\n")
-        model_df = prep_model_df(df, drop_code_10=True)
+        with stage("load_model_frame") as st:
+            model_df = st.frame(load_model_frame(DATA_FILE, drop_code_10=True))
         f.write(f"Rows: {len(model_df)}\n")
         f.write(f"Classes (clsids): {model_df['clsids'].nunique()}\n\n")
 
-        ord_res = fit_ordered_logit(model_df)
+        with stage("ordered_logit_fit", model_df):
+            ord_res = fit_ordered_logit(model_df)
         f.write("Ordered logit summary (MLE):\n")
         f.write(str(ord_res.summary()))
         f.write("\n\n")
         try:
-            robust_table = cluster_robust_table(ord_res, model_df["clsids"])
+            with stage("cov_cluster", model_df):
+                robust_table = cluster_robust_table(ord_res, model_df["clsids"])
             f.write("Ordered logit (cluster-robust SE by clsids):\n")
             f.write(robust_table.to_string(float_format=lambda x: f"{x:.4f}"))
             f.write("\n\n")
         except Exception as exc:
             f.write(f"Cluster-robust SE failed: {exc}\n\n")
+        if n_boot:
+            with stage("cluster_bootstrap", model_df) as st:
+                st.note(n_boot=n_boot, method=boot_method)
+                boot_table, _draws = cluster_bootstrap(
+                    ord_res, model_df["clsids"], n_boot=n_boot, method=boot_method
+                )
+            f.write(
+                f"Ordered logit (cluster bootstrap by clsids, {boot_method}, B={n_boot}, "
+                f"failed={boot_table.attrs['n_failed']}, unconverged={boot_table.attrs['n_unconverged']}, "
+                f"jackknife dropped={boot_table.attrs['n_jackknife_dropped']}):\n"
+            )
+            f.write(boot_table.to_string(float_format=lambda x: f"{x:.4f}"))
+            f.write("\n\n")
+
+        if multilevel:
+            f.write("--- Multilevel Ordered Logit (random intercepts, drop 10) ---\n")
+            try:
+                add_columns(model_df, DATA_FILE, ["schids"], standardize=False)
+                schools = None
+                if "schids" not in model_df.columns:
+                    f.write("schids not in data; class-level random intercept only.\n")
+                elif model_df["schids"].isna().any():
+                    n_missing = int(model_df["schids"].isna().sum())
+                    f.write(
+                        f"schids missing for {n_missing} of {len(model_df)} rows; "
+                        "class-level random intercept only.\n"
+                    )
+                else:
+                    schools = model_df["schids"]
+                X = model_df[["bonding_idx_z", "linking_idx_z", "ses_pca_z", "hukou_type", "cog_score_z"]]
+                with stage("multilevel_fit", X):
+                    ml_res = fit_multilevel_ordinal(
+                        model_df["expect_edu_raw"], X, model_df["clsids"], schools=schools, n_quad=n_quad
+                    )
+                f.write(ml_res.summary())
+                f.write("\n\n")
+            except Exception as exc:
+                f.write(f"Multilevel model failed: {exc}\n\n")
+
+        f.write("--- Proportional Odds Check (Brant test, per-threshold binary logits) ---\n")
+        try:
+            with stage("brant_test", model_df):
+                brant, binary_coefs = proportional_odds.brant_test(ord_res)
+            f.write(brant.to_string(float_format=lambda x: f"{x:.4f}"))
+            f.write("\n\nBinary logit slopes by threshold (last column: ordered logit):\n")
+            f.write(binary_coefs.to_string(float_format=lambda x: f"{x:.4f}"))
+            f.write("\n\n")
+        except Exception as e:
+            f.write(f"Brant test failed: {e}\n\n")
 
         f.write("--- Proportional Odds Check (LR test vs Multinomial Logit) ---\n")
         try:
-            mn_res = fit_mnlogit(model_df)
+            with stage("mnlogit_fit", model_df):
+                mn_res = fit_mnlogit(model_df, ord_res)
             lr_stat, df_lr, p_val = lr_test_ordered_vs_mnlogit(ord_res, mn_res)
             f.write(f"LR stat={lr_stat:.3f}, df={df_lr}, p={p_val:.4f}\n")
             f.write("\nMultinomial logit summary (MLE):\n")
@@ -219,8 +305,27 @@ def main():
         except Exception as e:
             f.write(f"MNLogit failed: {e}\n")
 
+        if survey:
+            f.write("\n")
+            try:
+                write_survey_section(f, df, model_df)
+            except Exception as exc:
+                f.write(f"Survey-weighted estimates failed: {exc}\n")
+
     print(f"[DONE] Report saved to: {report_path}")
 
 
+def parse_args():
+    parser = argparse.ArgumentParser(description="Ordered logit analysis of education expectation.")
+    parser.add_argument("--bootstrap", type=int, default=0, help="cluster bootstrap replicates (0 = off)")
+    parser.add_argument("--bootstrap-method", choices=["pairs", "score"], default="pairs")
+    parser.add_argument("--no-multilevel", action="store_true", help="skip the random-intercept model")
+    parser.add_argument("--quad-points", type=int, default=7, help="adaptive Gauss-Hermite nodes per level")
+    parser.add_argument("--no-survey", action="store_true", help="skip the survey-weighted estimates")
+    return parser.parse_args()
+
+
 if __name__ == "__main__":
-    main()
+    args = parse_args()
+    with tracing("ordinal_analysis", TRACE_FILE):
+        main(args.bootstrap, args.bootstrap_method, not args.no_multilevel, args.quad_points, not args.no_survey)
@@ -0,0 +1,158 @@
+"""
+有序 logit 预测概率与边际效应 (Ordered Logit Predictions)
+
+给定 ordered_logit.fit_ordered_logit 的结果，在任意形状的协变量网格上做广播计算：
+- category_probs：全部类别概率 (..., J)；prob_at_least：P(y >= level)
+- latent_slope：潜变量尺度的条件斜率 d(xb)/dv（含交互项，如 b_bonding + b_bonding_x_ses * ses）
+- marginal_effects / average_marginal_effects：概率尺度的条件边际效应与平均边际效应 (AME)
+- 每个量都返回同一向量化 Jacobian（对 [b, 阈值增量参数]）得到的 delta 法标准误
+
+协变量以 dict / DataFrame 传入，键为模型自变量名；交互项（analysis_data.INTERACTIONS）
+未直接给出时由其组成变量相乘得到。各数组按 NumPy 规则广播，例如
+{"bonding_idx_z": grid[:, None], "ses_pca_z": ses[None, :]} 得到 (len(grid), len(ses)) 的结果。
+注意：阈值取 result.thresholds（c_j），而不是 params 中的增量参数。
+"""
+import numpy as np
+from scipy.special import expit
+
+from analysis_data import INTERACTIONS
+from ordered_logit import threshold_jacobian
+
+
+def _column(data, name):
+    if name in data:
+        return np.asarray(data[name], dtype=float)
+    if name in INTERACTIONS:
+        left, right = INTERACTIONS[name]
+        return _column(data, left) * _column(data, right)
+    raise KeyError(f"No value for model term '{name}'")
+
+
+def design(result, data):
+    """(..., k) 设计数组，列顺序与 result.exog_names 一致"""
+    cols = np.broadcast_arrays(*[_column(data, name) for name in result.exog_names])
+    return np.stack(cols, axis=-1)
+
+
+def design_derivative(result, data, var):
+    """(..., k) dX/dvar：var 本身的列为 1，含 var 的交互项列为另一组成变量"""
+    cols = []
+    for name in result.exog_names:
+        if name == var:
+            cols.append(np.ones(()))
+        elif name in INTERACTIONS and var in INTERACTIONS[name]:
+            left, right = INTERACTIONS[name]
+            cols.append(_column(data, right if var == left else left))
+        else:
+            cols.append(np.zeros(()))
+    shape = np.broadcast_shapes(*[np.shape(_column(data, n)) for n in result.exog_names])
+    return np.stack([np.broadcast_to(c, shape) for c in cols], axis=-1)
+
+
+def _split(result):
+    k = result.k_exog
+    params = result.params.values
+    return params[:k], result.thresholds, threshold_jacobian(params[k:])
+
+
+def delta_se(jac, cov):
+    """jac (..., p)，cov (p, p) -> (...) 标准误"""
+    return np.sqrt(np.einsum("...i,ij,...j->...", jac, cov, jac))
+
+
+def _cdf_terms(result, X):
+    beta, cuts, _jac = _split(result)
+    xb = X @ beta
+    F = expit(cuts - xb[..., None])
+    pad = np.zeros(F.shape[:-1] + (1,))
+    F = np.concatenate([pad, F, pad + 1.0], axis=-1)
+    return xb, F, F * (1 - F)
+
+
+def category_probs(result, data, se=False):
+    """(..., J) 类别概率；se=True 时同时返回 delta 法标准误"""
+    X = design(result, data)
+    _xb, F, f = _cdf_terms(result, X)
+    probs = np.diff(F, axis=-1)
+    if not se:
+        return probs
+    return probs, delta_se(_prob_jacobian(result, X, f), result.cov_params().values)
+
+
+def _prob_jacobian(result, X, f):
+    """(..., J, p) dP_j / d[b, theta]"""
+    _beta, _cuts, tjac = _split(result)
+    J = f.shape[-1] - 1
+    df = np.diff(f, axis=-1)
+    d_beta = -df[..., None] * X[..., None, :]
+    # dP_j/dc_m = f_j [m == j] - f_{j-1} [m == j - 1]
+    eye = np.eye(J, J - 1)
+    d_cut = f[..., 1:J + 1, None] * eye - f[..., 0:J, None] * np.eye(J, J - 1, k=-1)
+    return np.concatenate([d_beta, d_cut @ tjac], axis=-1)
+
+
+def _level_index(result, level):
+    idx = np.flatnonzero(result.levels == level)
+    if not len(idx) or idx[0] == 0:
+        raise ValueError(f"P(y >= {level}) needs a level above the lowest category")
+    return int(idx[0])
+
+
+def prob_at_least(result, data, level, se=False):
+    """P(y >= level) = 1 - F(c_{level-1} - xb)"""
+    j = _level_index(result, level)
+    X = design(result, data)
+    beta, cuts, tjac = _split(result)
+    F = expit(cuts[j - 1] - X @ beta)
+    prob = 1 - F
+    if not se:
+        return prob
+    f = F * (1 - F)
+    jac = np.concatenate([f[..., None] * X, -f[..., None] * tjac[j - 1]], axis=-1)
+    return prob, delta_se(jac, result.cov_params().values)
+
+
+def latent_slope(result, data, var, se=False):
+    """潜变量尺度的条件斜率 d(xb)/dvar"""
+    dX = design_derivative(result, data, var)
+    beta, _cuts, _tjac = _split(result)
+    slope = dX @ beta
+    if not se:
+        return slope
+    jac = np.concatenate([dX, np.zeros(dX.shape[:-1] + (result.n_cut,))], axis=-1)
+    return slope, delta_se(jac, result.cov_params().values)
+
+
+def _me_and_jacobian(result, data, var):
+    """条件边际效应 dP_j/dvar (..., J) 及其 Jacobian (..., J, p)"""
+    X = design(result, data)
+    dX = design_derivative(result, data, var)
+    beta, _cuts, tjac = _split(result)
+    _xb, F, f = _cdf_terms(result, X)
+    slope = dX @ beta
+    df = np.diff(f, axis=-1)
+    me = -df * slope[..., None]
+
+    # d f(u)/du = f (1 - 2F); u = c - xb
+    g = f * (1 - 2 * F)
+    dg = np.diff(g, axis=-1)
+    J = df.shape[-1]
+    d_beta = dg[..., None] * slope[..., None, None] * X[..., None, :] - df[..., None] * dX[..., None, :]
+    eye = np.eye(J, J - 1)
+    d_cut = -slope[..., None, None] * (g[..., 1:J + 1, None] * eye - g[..., 0:J, None] * np.eye(J, J - 1, k=-1))
+    return me, np.concatenate([d_beta, d_cut @ tjac], axis=-1)
+
+
+def marginal_effects(result, data, var, se=False):
+    """(..., J) 条件边际效应（概率尺度）"""
+    me, jac = _me_and_jacobian(result, data, var)
+    if not se:
+        return me
+    return me, delta_se(jac, result.cov_params().values)
+
+
+def average_marginal_effects(result, data, var):
+    """(J,) 样本平均边际效应及 delta 法标准误；data 一般为拟合样本的 DataFrame"""
+    me, jac = _me_and_jacobian(result, data, var)
+    axes = tuple(range(me.ndim - 1))
+    return me.mean(axis=axes), delta_se(jac.mean(axis=axes), result.cov_params().values)
@@ -1,38 +1,62 @@
-import pandas as pd
+"""
+随机森林变量重要性（留出折置换重要性，见 rf_importance.py）
+
+输出每个变量及社会资本块（bonding_idx + linking_idx 联合置换）的重要性，
+同时保留 Gini 重要性一列作对照。--mode ordinal 使用累积阈值森林。
+"""
+import argparse
+import sys
+import time
 from pathlib import Path
 
-from sklearn.ensemble import RandomForestClassifier
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+from ceps_config import DATA_FILE, RESULTS_DIR
+from analysis_data import load_model_frame
+from profiling import stage, tracing
+from rf_importance import permutation_importance
 
 
-WORKSPACE = Path(r"c:\Users\13926\Desktop\CEPS数据汇总")
-DATA_FILE = WORKSPACE / "rescued_data" / "merged_rescued_all_with_pca_ses.csv"
-OUTPUT_FILE = WORKSPACE / "results" / "phase3" / "ordinal_rf_feature_importance.csv"
+OUTPUT_FILE = RESULTS_DIR / "phase3" / "ordinal_rf_feature_importance.csv"
+TRACE_FILE = RESULTS_DIR / "phase3" / "ordinal_rf_trace.json"
 
+FEATURES = ["bonding_idx", "linking_idx", "ses_pca", "hukou_type", "cog_score"]
+GROUPS = {
+    **{f: [f] for f in FEATURES},
+    "social_capital": ["bonding_idx", "linking_idx"],
+}
 
-def main():
-    df = pd.read_csv(DATA_FILE, low_memory=False)
-    cols = ["expect_edu_raw", "bonding_idx", "linking_idx", "ses_pca", "hukou_type", "cog_score"]
-    df = df[cols].dropna()
-    df = df[df["expect_edu_raw"].between(1, 9)].copy()
 
-    X = df[["bonding_idx", "linking_idx", "ses_pca", "hukou_type", "cog_score"]]
+def main(mode="nominal", n_folds=5, n_repeats=10, scorer="rps", n_jobs=None):
+    with stage("load_model_frame") as st:
+        df = st.frame(load_model_frame(DATA_FILE))
+
+    X = df[FEATURES]
     y = df["expect_edu_raw"].astype(int)
 
-    rf = RandomForestClassifier(
-        n_estimators=200,
-        max_depth=5,
-        min_samples_leaf=80,
-        random_state=42,
-        n_jobs=-1,
-    )
-    rf.fit(X, y)
-
-    importance = pd.DataFrame(
-        {"feature": X.columns, "importance": rf.feature_importances_}
-    ).sort_values("importance", ascending=False)
+    start = time.perf_counter()
+    # Forest fits run in worker processes: cpu_s here covers only the parent
+    with stage("rf_permutation_importance", X) as st:
+        st.note(mode=mode, n_folds=n_folds, n_repeats=n_repeats, scorer=scorer)
+        importance = permutation_importance(
+            X, y, GROUPS, mode=mode, n_folds=n_folds, n_repeats=n_repeats, scorer=scorer, n_jobs=n_jobs
+        )
+    print(f"[INFO] {mode} forest, {n_folds} folds x {n_repeats} repeats: {time.perf_counter() - start:.1f}s")
+
+    importance = importance.sort_values("importance", ascending=False).reset_index()
+    importance["kind"] = ["group" if len(GROUPS[f]) > 1 else "feature" for f in importance["feature"]]
+    OUTPUT_FILE.parent.mkdir(parents=True, exist_ok=True)
     importance.to_csv(OUTPUT_FILE, index=False)
+    print(importance.to_string(index=False, float_format=lambda x: f"{x:.5f}"))
     print(f"[DONE] Saved {OUTPUT_FILE}")
 
 
 if __name__ == "__main__":
-    main()
+    parser = argparse.ArgumentParser(description="Held-out permutation importance for the random forest.")
+    parser.add_argument("--mode", choices=["nominal", "ordinal"], default="nominal")
+    parser.add_argument("--folds", type=int, default=5)
+    parser.add_argument("--repeats", type=int, default=10)
+    parser.add_argument("--scorer", choices=["rps", "logloss"], default="rps")
+    parser.add_argument("--jobs", type=int, default=None)
+    args = parser.parse_args()
+    with tracing("ordinal_rf_pca", TRACE_FILE):
+        main(args.mode, args.folds, args.repeats, args.scorer, args.jobs)
@@ -1,42 +1,23 @@
 import numpy as np
-import pandas as pd
 import matplotlib.pyplot as plt
+import sys
 from pathlib import Path
-from statsmodels.miscmodels.ordinal_model import OrderedModel
 
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+from ceps_config import DATA_FILE, FIGURES_DIR
+from analysis_data import add_interactions, load_model_frame
+from ordered_logit import fit_ordered_logit
+from ordinal_predict import prob_at_least
 
-WORKSPACE = Path(r"c:\Users\13926\Desktop\CEPS数据汇总")
-DATA_FILE = WORKSPACE / "rescued_data" / "merged_rescued_all_with_pca_ses.csv"
-OUT_FILE = WORKSPACE / "figures" / "report_phase3" / "interaction_plot_pca.png"
 
+OUT_FILE = FIGURES_DIR / "report_phase3" / "interaction_plot_pca.png"
 
-def zscore(series):
-    return (series - series.mean()) / series.std()
 
+def interaction_curves():
+    """拟合含交互项的有序 logit，返回 P(expectation >= 7) 随 bonding 变化的曲线（低/高 SES）"""
+    df = load_model_frame(DATA_FILE)
 
-def sigmoid(x):
-    return 1 / (1 + np.exp(-x))
-
-
-def main():
-    df = pd.read_csv(DATA_FILE, low_memory=False)
-    cols = [
-        "expect_edu_raw",
-        "bonding_idx",
-        "linking_idx",
-        "ses_pca",
-        "hukou_type",
-        "cog_score",
-    ]
-    df = df[cols].dropna()
-    df = df[df["expect_edu_raw"].between(1, 9)]
-
-    for c in ["bonding_idx", "linking_idx", "ses_pca", "cog_score"]:
-        df[f"{c}_z"] = zscore(df[c])
-
-    df["linking_x_ses"] = df["linking_idx_z"] * df["ses_pca_z"]
-    df["bonding_x_ses"] = df["bonding_idx_z"] * df["ses_pca_z"]
-    df["linking_x_hukou"] = df["linking_idx_z"] * df["hukou_type"]
+    add_interactions(df)
 
     y = df["expect_edu_raw"].astype(int)
     X = df[
@@ -52,50 +33,45 @@ def main():
         ]
     ]
 
-    res = OrderedModel(y, X, distr="logit").fit(method="bfgs", disp=False)
-    params = res.params
-    cut_6_7 = params["6/7"]
+    res = fit_ordered_logit(y, X)
 
-    # Plot bonding vs P(expectation >= 7)
+    # Plot bonding vs P(expectation >= 7), other covariates at 0
     bonding_grid = np.linspace(-2.5, 2.5, 60)
     ses_low = df["ses_pca_z"].quantile(0.25)
     ses_high = df["ses_pca_z"].quantile(0.75)
+    grid = {
+        "bonding_idx_z": bonding_grid[:, None],
+        "ses_pca_z": np.array([ses_low, ses_high])[None, :],
+        "linking_idx_z": 0.0,
+        "hukou_type": 0.0,
+        "cog_score_z": 0.0,
+    }
+    prob, se = prob_at_least(res, grid, 7, se=True)
+    return {"grid": bonding_grid, "prob": prob, "se": se}
+
+
+def draw_interaction(data):
+    bonding_grid = data["grid"]
+    prob_low, prob_high = data["prob"].T
+    se_low, se_high = data["se"].T
+
+    fig, ax = plt.subplots(figsize=(7, 5))
+    ax.plot(bonding_grid, prob_high, color="#2ca02c", label="High SES (75%)")
+    ax.fill_between(bonding_grid, prob_high - 1.96 * se_high, prob_high + 1.96 * se_high, color="#2ca02c", alpha=0.15)
+    ax.plot(bonding_grid, prob_low, color="#d62728", label="Low SES (25%)")
+    ax.fill_between(bonding_grid, prob_low - 1.96 * se_low, prob_low + 1.96 * se_low, color="#d62728", alpha=0.15)
+    ax.set_xlabel("Peer Bonding (z-score)")
+    ax.set_ylabel("P(Expectation ≥ Bachelor)")
+    ax.set_title("Bonding × SES (Ordered Logit, PCA SES)")
+    ax.legend()
+    fig.tight_layout()
+    return fig
 
-    def p_ge_7(bonding_z, ses_z):
-        linking_z = 0.0
-        hukou = 0.0
-        cog_z = 0.0
-        linking_x_ses = linking_z * ses_z
-        bonding_x_ses = bonding_z * ses_z
-        linking_x_hukou = linking_z * hukou
-
-        xb = (
-            params["bonding_idx_z"] * bonding_z
-            + params["linking_idx_z"] * linking_z
-            + params["ses_pca_z"] * ses_z
-            + params["hukou_type"] * hukou
-            + params["cog_score_z"] * cog_z
-            + params["linking_x_ses"] * linking_x_ses
-            + params["bonding_x_ses"] * bonding_x_ses
-            + params["linking_x_hukou"] * linking_x_hukou
-        )
-        p_le_6 = sigmoid(cut_6_7 - xb)
-        return 1 - p_le_6
-
-    prob_low = [p_ge_7(b, ses_low) for b in bonding_grid]
-    prob_high = [p_ge_7(b, ses_high) for b in bonding_grid]
-
-    plt.figure(figsize=(7, 5))
-    plt.plot(bonding_grid, prob_high, color="#2ca02c", label="High SES (75%)")
-    plt.plot(bonding_grid, prob_low, color="#d62728", label="Low SES (25%)")
-    plt.xlabel("Peer Bonding (z-score)")
-    plt.ylabel("P(Expectation ≥ Bachelor)")
-    plt.title("Bonding × SES (Ordered Logit, PCA SES)")
-    plt.legend()
-    plt.tight_layout()
 
+def main():
+    fig = draw_interaction(interaction_curves())
     OUT_FILE.parent.mkdir(parents=True, exist_ok=True)
-    plt.savefig(OUT_FILE, dpi=300)
+    fig.savefig(OUT_FILE, dpi=300)
     print(f"[DONE] Saved {OUT_FILE}")
 
 
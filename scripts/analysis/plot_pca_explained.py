@@ -2,16 +2,20 @@
 import numpy as np
 import pandas as pd
 import matplotlib.pyplot as plt
+import sys
 from pathlib import Path
 
-plt.rcParams['font.sans-serif'] = ['SimHei', 'Microsoft YaHei']
-plt.rcParams['axes.unicode_minus'] = False
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+from ceps_config import DATA_FILE, FIGURES_DIR, RESULTS_DIR
+from feature_store import read_dataset
+from ses_pca_model import SesPCA
 
-WORKSPACE = Path(r"c:\Users\13926\Desktop\CEPS数据汇总")
-DATA_FILE = WORKSPACE / "rescued_data" / "merged_rescued_all_with_pca_ses.csv"
-OUTPUT_DIR = WORKSPACE / "figures" / "report_phase3"
+# 中文字体；只在绘图时生效（render_figures 在同一进程中连续绘制多张图）
+RC_PARAMS = {'font.sans-serif': ['SimHei', 'Microsoft YaHei'], 'axes.unicode_minus': False}
+
+MODEL_FILE = RESULTS_DIR / "phase3" / "ses_pca_model.npz"
+OUTPUT_DIR = FIGURES_DIR / "report_phase3"
 
-PCA_COLS = ["parent_edu_max", "family_econ", "home_books", "has_desk", "has_computer"]
 LABELS_CN = {
     "parent_edu_max": "父母学历",
     "family_econ": "家庭经济",
@@ -21,35 +25,18 @@ LABELS_CN = {
 }
 
 
-def zscore_frame(df):
-    return (df - df.mean()) / df.std(ddof=0)
-
-
-def main():
-    df = pd.read_csv(DATA_FILE, low_memory=False)
-    X = df[PCA_COLS].copy()
-
-    # Invert has_computer if negatively correlated with family_econ
-    if X["has_computer"].corr(X["family_econ"]) < 0:
-        X["has_computer"] = 1 - X["has_computer"]
+def load_pca_data():
+    """载荷、解释方差与相关矩阵来自 compute_ses_pca.py 保存的模型，不再重新拟合"""
+    model = SesPCA.load(MODEL_FILE)
+    df = read_dataset(DATA_FILE, columns=["ses_pca"])
+    return {"model": model, "ses": df["ses_pca"].dropna()}
 
-    Xz = zscore_frame(X)
-    cov = np.cov(Xz.T, ddof=0)
-    eigvals, eigvecs = np.linalg.eigh(cov)
-    order = np.argsort(eigvals)[::-1]
-    eigvals = eigvals[order]
-    eigvecs = eigvecs[:, order]
 
-    explained = eigvals / eigvals.sum()
+def draw_scree(data):
+    """图1: Scree Plot (方差解释比)"""
+    explained = data["model"].explained_ratio
     cumulative = np.cumsum(explained)
-    loadings = eigvecs[:, 0]
 
-    # Align sign
-    pc1 = Xz.values @ eigvecs[:, 0]
-    if np.corrcoef(pc1, X["family_econ"].values)[0, 1] < 0:
-        loadings = -loadings
-
-    # ========== 图1: Scree Plot (方差解释比) ==========
     fig1, ax1 = plt.subplots(figsize=(7, 5))
     pcs = [f'PC{i}' for i in range(1, 6)]
     bars = ax1.bar(pcs, explained * 100, color='#4472C4', edgecolor='white', alpha=0.8)
@@ -71,14 +58,17 @@ def main():
     ax1.set_ylim(0, 80)
     ax1.legend(loc='upper right')
 
-    plt.tight_layout()
-    fig1.savefig(OUTPUT_DIR / 'pca_scree_plot.png', dpi=150, bbox_inches='tight')
-    print(f"[DONE] Saved pca_scree_plot.png")
-    plt.close(fig1)
+    fig1.tight_layout()
+    return fig1
+
+
+def draw_loadings(data):
+    """图2: PC1 载荷条形图"""
+    model = data["model"]
+    loadings = model.loadings[:, 0]
 
-    # ========== 图2: PC1 载荷条形图 ==========
     fig2, ax2 = plt.subplots(figsize=(7, 5))
-    labels = [LABELS_CN[col] for col in PCA_COLS]
+    labels = [LABELS_CN[col] for col in model.columns]
     colors = ['#2E7D32' if l > 0 else '#C62828' for l in loadings]
 
     y_pos = np.arange(len(labels))
@@ -102,14 +92,17 @@ def main():
             transform=ax2.transAxes, fontsize=9, va='bottom', ha='right',
             bbox=dict(boxstyle='round', facecolor='wheat', alpha=0.5))
 
-    plt.tight_layout()
-    fig2.savefig(OUTPUT_DIR / 'pca_loadings.png', dpi=150, bbox_inches='tight')
-    print(f"[DONE] Saved pca_loadings.png")
-    plt.close(fig2)
+    fig2.tight_layout()
+    return fig2
+
+
+def draw_correlation(data):
+    """图3: 相关性热力图 (输入变量)"""
+    model = data["model"]
+    pca_cols = model.columns
 
-    # ========== 图3: 相关性热力图 (输入变量) ==========
     fig3, ax3 = plt.subplots(figsize=(6, 5))
-    corr = Xz.corr()
+    corr = pd.DataFrame(model.corr, index=pca_cols, columns=pca_cols)
     corr.index = [LABELS_CN[c] for c in corr.index]
     corr.columns = [LABELS_CN[c] for c in corr.columns]
 
@@ -128,18 +121,18 @@ def main():
     ax3.set_yticklabels(corr.index, fontsize=10)
     ax3.set_title('SES 输入变量相关矩阵', fontsize=14, fontweight='bold')
 
-    cbar = plt.colorbar(im, ax=ax3, shrink=0.8)
+    cbar = fig3.colorbar(im, ax=ax3, shrink=0.8)
     cbar.set_label('相关系数', fontsize=10)
 
-    plt.tight_layout()
-    fig3.savefig(OUTPUT_DIR / 'pca_input_correlation.png', dpi=150, bbox_inches='tight')
-    print(f"[DONE] Saved pca_input_correlation.png")
-    plt.close(fig3)
+    fig3.tight_layout()
+    return fig3
 
-    # ========== 图4: SES 分布直方图 ==========
-    fig4, ax4 = plt.subplots(figsize=(7, 5))
-    ses_scores = df['ses_pca'].dropna()
 
+def draw_ses_distribution(data):
+    """图4: SES 分布直方图"""
+    ses_scores = data["ses"]
+
+    fig4, ax4 = plt.subplots(figsize=(7, 5))
     ax4.hist(ses_scores, bins=50, color='#4472C4', edgecolor='white', alpha=0.8, density=True)
     ax4.axvline(x=0, color='red', linestyle='--', linewidth=2, label='均值=0')
     ax4.axvline(x=ses_scores.median(), color='green', linestyle='--', linewidth=2, label=f'中位数={ses_scores.median():.2f}')
@@ -154,10 +147,27 @@ def main():
             transform=ax4.transAxes, fontsize=10, va='top', ha='right',
             bbox=dict(boxstyle='round', facecolor='wheat', alpha=0.5))
 
-    plt.tight_layout()
-    fig4.savefig(OUTPUT_DIR / 'pca_ses_distribution.png', dpi=150, bbox_inches='tight')
-    print(f"[DONE] Saved pca_ses_distribution.png")
-    plt.close(fig4)
+    fig4.tight_layout()
+    return fig4
+
+
+FIGURES = {
+    "pca_scree_plot": draw_scree,
+    "pca_loadings": draw_loadings,
+    "pca_input_correlation": draw_correlation,
+    "pca_ses_distribution": draw_ses_distribution,
+}
+
+
+def main():
+    plt.rcParams.update(RC_PARAMS)
+    data = load_pca_data()
+    OUTPUT_DIR.mkdir(parents=True, exist_ok=True)
+    for name, draw in FIGURES.items():
+        fig = draw(data)
+        fig.savefig(OUTPUT_DIR / f'{name}.png', dpi=150, bbox_inches='tight')
+        print(f"[DONE] Saved {name}.png")
+        plt.close(fig)
 
 
 if __name__ == "__main__":
@@ -1,18 +1,23 @@
 """生成随机森林特征重要性条形图"""
 import pandas as pd
 import matplotlib.pyplot as plt
+import sys
 from pathlib import Path
 
-plt.rcParams['font.sans-serif'] = ['SimHei', 'Microsoft YaHei']
-plt.rcParams['axes.unicode_minus'] = False
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+from ceps_config import FIGURES_DIR, RESULTS_DIR
 
-WORKSPACE = Path(r"c:\Users\13926\Desktop\CEPS数据汇总")
-DATA_FILE = WORKSPACE / "results" / "phase3" / "ordinal_rf_feature_importance.csv"
-OUTPUT_FILE = WORKSPACE / "figures" / "report_phase3" / "rf_feature_importance.png"
+# 中文字体；只在绘图时生效（render_figures 在同一进程中连续绘制多张图）
+RC_PARAMS = {'font.sans-serif': ['SimHei', 'Microsoft YaHei'], 'axes.unicode_minus': False}
 
-def main():
-    df = pd.read_csv(DATA_FILE)
+DATA_FILE = RESULTS_DIR / "phase3" / "ordinal_rf_feature_importance.csv"
+OUTPUT_FILE = FIGURES_DIR / "report_phase3" / "rf_feature_importance.png"
+
+def load_importance():
+    return pd.read_csv(DATA_FILE)
 
+
+def draw_importance(df):
     # 中文标签映射
     label_map = {
         'cog_score': '认知能力',
@@ -22,6 +27,7 @@ def main():
         'hukou_type': '户籍类型'
     }
 
+    df = df[df['feature'].isin(label_map)].copy()
     df['label'] = df['feature'].map(label_map)
     df = df.sort_values('importance', ascending=True)
 
@@ -29,25 +35,38 @@ def main():
     colors = ['#4472C4' if f in ['linking_idx', 'bonding_idx'] else '#7F7F7F'
               for f in df['feature']]
 
+    # 旧版结果文件（只有 feature / importance 两列的 Gini 重要性）没有 importance_std：不画误差线
+    permutation = 'importance_std' in df.columns
+    err = df['importance_std'] if permutation else pd.Series(0.0, index=df.index)
+
     fig, ax = plt.subplots(figsize=(8, 5))
-    bars = ax.barh(df['label'], df['importance'], color=colors, edgecolor='white')
+    bars = ax.barh(df['label'], df['importance'], xerr=err if permutation else None,
+                   color=colors, edgecolor='white', ecolor='#404040', capsize=3)
 
     # 添加数值标签
-    for bar, val in zip(bars, df['importance']):
-        ax.text(val + 0.01, bar.get_y() + bar.get_height()/2,
-                f'{val:.1%}', va='center', fontsize=11)
+    offset = 0.02 * df['importance'].max()
+    for bar, val, e in zip(bars, df['importance'], err):
+        ax.text(val + e + offset, bar.get_y() + bar.get_height()/2,
+                f'{val:.4f}', va='center', fontsize=11)
 
-    ax.set_xlabel('重要性得分 (Gini Importance)', fontsize=12)
+    ax.set_xlabel('置换重要性 (留出折 RPS 增量)' if permutation else '重要性 (Gini)', fontsize=12)
     ax.set_title('随机森林变量重要性排名', fontsize=14, fontweight='bold')
-    ax.set_xlim(0, 0.5)
+    ax.set_xlim(0, 1.25 * (df['importance'] + err).max())
 
     # 添加图例说明
     ax.text(0.95, 0.05, '蓝色 = 学校社会资本\n灰色 = 控制变量',
             transform=ax.transAxes, fontsize=9, va='bottom', ha='right',
             bbox=dict(boxstyle='round', facecolor='wheat', alpha=0.5))
 
-    plt.tight_layout()
-    plt.savefig(OUTPUT_FILE, dpi=150, bbox_inches='tight')
+    fig.tight_layout()
+    return fig
+
+
+def main():
+    plt.rcParams.update(RC_PARAMS)
+    fig = draw_importance(load_importance())
+    OUTPUT_FILE.parent.mkdir(parents=True, exist_ok=True)
+    fig.savefig(OUTPUT_FILE, dpi=150, bbox_inches='tight')
     print(f"[DONE] Saved {OUTPUT_FILE}")
 
 if __name__ == "__main__":
@@ -0,0 +1,231 @@
+"""
+比例优势假设检验 (Proportional Odds Diagnostics)
+
+- Brant 检验：对每个阈值 j 拟合二元 logit 1[y > j] ~ const + X，
+  全部二元模型按阈值堆叠、向量化 IRLS 同时迭代；
+  联合协方差 Var(b_j, b_l) = (X'W_j X)^-1 X'W_jl X (X'W_l X)^-1，W_jl = pi_l - pi_j pi_l（l >= j）
+  给出总体检验与逐变量检验（H0：各阈值斜率相等）
+- 多项 logit：Newton 法，Hessian 按结果类别分块 (K x K 块，每块 k x k) 一次 einsum 构造，
+  以有序 logit 的拟合概率投影得到热启动值
+  参数表与 statsmodels MNLogit 一致：行为 const + 自变量，列为除基准（最小）类别外的结果类别
+"""
+import numpy as np
+import pandas as pd
+from scipy import stats
+from scipy.special import expit, log_softmax
+
+from ordered_logit import encode_outcome
+
+
+def _with_const(X):
+    return np.column_stack([np.ones(len(X)), X])
+
+
+def _weighted_cross(X1, W):
+    """C[a, i, b, j] = sum_n X1[n, i] W[n, a, b] X1[n, j]，一次矩阵乘完成所有块"""
+    n, k1 = X1.shape
+    m = W.shape[1]
+    outer = (X1[:, :, None] * X1[:, None, :]).reshape(n, k1 * k1)
+    blocks = W.reshape(n, m * m).T @ outer
+    return blocks.reshape(m, m, k1, k1).transpose(0, 2, 1, 3)
+
+
+def _pair_weights(pi):
+    """W[n, a, b] = P(y > max(a, b)) - pi_a pi_b（二元指标 1[y > a]、1[y > b] 的协方差）"""
+    m = pi.shape[1]
+    hi = np.maximum.outer(np.arange(m), np.arange(m))
+    return pi[:, hi] - pi[:, :, None] * pi[:, None, :]
+
+
+def stacked_binary_logits(codes, X1, n_cut, maxiter=100, tol=1e-8):
+    """
+    同时拟合 n_cut 个二元 logit（结果 1[code > j]）
+    返回 (B, pi, converged)：B 为 (n_cut, k1) 系数，pi 为 (n, n_cut) 拟合概率
+    """
+    Z = (codes[:, None] > np.arange(n_cut)).astype(float)
+    share = np.clip(Z.mean(axis=0), 1e-6, 1 - 1e-6)
+    B = np.zeros((n_cut, X1.shape[1]))
+    B[:, 0] = np.log(share / (1 - share))
+    converged = False
+    for _ in range(maxiter):
+        pi = expit(X1 @ B.T)
+        grad = (Z - pi).T @ X1
+        info = np.einsum("ni,nm,nj->mij", X1, pi * (1 - pi), X1, optimize=True)
+        step = np.linalg.solve(info, grad[:, :, None])[:, :, 0]
+        B += step
+        if np.max(np.abs(step)) < tol:
+            converged = True
+            break
+    return B, expit(X1 @ B.T), converged
+
+
+def brant_test(result):
+    """
+    result：ordered_logit.fit_ordered_logit 的结果
+    返回 (tests, binary_coefs)：
+      tests 行为 Omnibus 与各自变量，列 chi2 / df / p
+      binary_coefs 为 自变量 x 阈值 的二元 logit 斜率（对照有序 logit 的共同斜率）
+    """
+    X1 = _with_const(result.exog)
+    k = result.k_exog
+    m = result.n_cut
+    B, pi, _converged = stacked_binary_logits(result.codes, X1, m)
+
+    # Joint covariance of all stacked binary coefficients
+    cross = _weighted_cross(X1, _pair_weights(pi))
+    inv_info = np.linalg.inv(np.stack([cross[a, :, a, :] for a in range(m)]))
+    cov = np.einsum("aij,ajbl,blm->aibm", inv_info, cross, inv_info, optimize=True)
+
+    # Drop intercepts; contrasts beta_1 - beta_j for j = 2..m
+    slopes = B[:, 1:].reshape(-1)
+    cov = cov[:, 1:, :, 1:].reshape(m * k, m * k)
+    D = np.zeros(((m - 1) * k, m * k))
+    for j in range(1, m):
+        rows = slice((j - 1) * k, j * k)
+        D[rows, :k] = np.eye(k)
+        D[rows, j * k:(j + 1) * k] = -np.eye(k)
+
+    def wald(rows):
+        Dr = D[rows]
+        diff = Dr @ slopes
+        chi2 = float(diff @ np.linalg.solve(Dr @ cov @ Dr.T, diff))
+        return chi2, len(diff), stats.chi2.sf(chi2, len(diff))
+
+    tests = {"Omnibus": wald(np.arange(D.shape[0]))}
+    for v, name in enumerate(result.exog_names):
+        tests[name] = wald(np.arange(m - 1) * k + v)
+    tests = pd.DataFrame(tests, index=["chi2", "df", "p"]).T
+    tests["df"] = tests["df"].astype(int)
+
+    cut_names = [f">{result.levels[j]}" for j in range(m)]
+    binary_coefs = pd.DataFrame(B[:, 1:].T, index=result.exog_names, columns=cut_names)
+    binary_coefs["ordered"] = result.params.values[:k]
+    return tests, binary_coefs
+
+
+def _mnl_derivatives(B, X1, Y, hessian=True):
+    """B (k1, K)：非基准类别系数；Y (n, K+1) one-hot。返回 (llf, 梯度 (k1, K), Hessian 或 None)"""
+    eta = np.column_stack([np.zeros(len(X1)), X1 @ B])
+    logp = log_softmax(eta, axis=1)
+    llf = float((Y * logp).sum())
+    P = np.exp(logp[:, 1:])
+    grad = X1.T @ (Y[:, 1:] - P)
+    if not hessian:
+        return llf, grad, None
+    K = P.shape[1]
+    W = P[:, :, None] * (np.eye(K)[None] - P[:, None, :])
+    # Blocks H[a, :, b, :] = -X' diag(P_a (delta_ab - P_b)) X, flattened in (a, i) order
+    hess = -_weighted_cross(X1, W)
+    return llf, grad, hess.reshape(K * X1.shape[1], K * X1.shape[1])
+
+
+def mnl_start_from_ordered(result):
+    """有序 logit 拟合概率的对数几率（相对基准类别）对 const + X 做最小二乘投影"""
+    X1 = _with_const(result.exog)
+    cuts = np.concatenate([[-np.inf], result.thresholds, [np.inf]])
+    xb = result.exog @ result.params.values[:result.k_exog]
+    cdf = expit(cuts[None, :] - xb[:, None])
+    prob = np.clip(np.diff(cdf, axis=1), 1e-12, None)
+    logit = np.log(prob[:, 1:]) - np.log(prob[:, :1])
+    B, *_ = np.linalg.lstsq(X1, logit, rcond=None)
+    return B
+
+
+class MNLogitResults:
+    def __init__(self, B, llf, hessian, levels, exog_names, nobs, converged, n_iter):
+        columns = list(levels[1:])
+        self.params = pd.DataFrame(B, index=exog_names, columns=columns)
+        self.llf = llf
+        self.hessian = hessian
+        self.levels = levels
+        self.nobs = nobs
+        self.converged = converged
+        self.n_iter = n_iter
+
+    def cov_params(self):
+        # Parameter order in the Hessian is (outcome, regressor)
+        return np.linalg.inv(-self.hessian)
+
+    @property
+    def bse(self):
+        k1, K = self.params.shape
+        se = np.sqrt(np.diag(self.cov_params())).reshape(K, k1).T
+        return pd.DataFrame(se, index=self.params.index, columns=self.params.columns)
+
+    @property
+    def pvalues(self):
+        z = np.abs(self.params / self.bse)
+        return pd.DataFrame(2 * stats.norm.sf(z), index=z.index, columns=z.columns)
+
+    @property
+    def aic(self):
+        return -2 * self.llf + 2 * self.params.size
+
+    @property
+    def bic(self):
+        return -2 * self.llf + np.log(self.nobs) * self.params.size
+
+    def summary(self, title="Multinomial Logit Results"):
+        bse = self.bse
+        lines = [
+            title,
+            "=" * 78,
+            f"Dep. Variable: expect_edu_raw   No. Observations: {self.nobs}   Base outcome: {self.levels[0]}",
+            f"Log-Likelihood: {self.llf:.3f}   AIC: {self.aic:.1f}   BIC: {self.bic:.1f}",
+            f"Method: Newton-Raphson (block Hessian)   Iterations: {self.n_iter}   Converged: {self.converged}",
+        ]
+        for level in self.params.columns:
+            table = pd.DataFrame(
+                {
+                    "coef": self.params[level],
+                    "std err": bse[level],
+                    "z": self.params[level] / bse[level],
+                    "P>|z|": self.pvalues[level],
+                }
+            )
+            lines += ["-" * 78, f"expect_edu_raw={level}", table.to_string(float_format=lambda x: f"{x:.4f}")]
+        lines.append("=" * 78)
+        return "\n".join(lines)
+
+
+def fit_mnlogit(y, X, ordered=None, maxiter=100, tol=1e-8):
+    """
+    多项 logit；y 为结果，X 为 DataFrame（不含常数项）
+    ordered：同一 y / X 上的有序 logit 结果，用于热启动
+    """
+    codes, levels = encode_outcome(y)
+    exog_names = ["const"] + list(X.columns)
+    X1 = _with_const(np.asarray(X, dtype=float))
+    Y = np.eye(len(levels))[codes]
+    if ordered is not None:
+        B = mnl_start_from_ordered(ordered)
+    else:
+        share = np.clip(Y.mean(axis=0), 1e-6, None)
+        B = np.zeros((X1.shape[1], len(levels) - 1))
+        B[0] = np.log(share[1:] / share[0])
+
+    k1, K = B.shape
+    llf, grad, hess = _mnl_derivatives(B, X1, Y)
+    converged = False
+    for n_iter in range(1, maxiter + 1):
+        step = np.linalg.solve(-hess, grad.T.reshape(-1)).reshape(K, k1).T
+        slack = 1e-12 * max(1.0, abs(llf))
+        scale = 1.0
+        while True:
+            trial = B + scale * step
+            llf_new, grad_new, hess_new = _mnl_derivatives(trial, X1, Y)
+            if np.isfinite(llf_new) and llf_new >= llf - slack:
+                break
+            scale /= 2
+            if scale < 1e-10:
+                if np.max(np.abs(step)) < np.sqrt(tol):
+                    converged = True
+                    break
+                raise RuntimeError("Multinomial logit Newton step failed to improve the likelihood")
+        if converged:
+            break
+        B, llf, grad, hess = trial, llf_new, grad_new, hess_new
+        if np.max(np.abs(scale * step)) < tol or np.max(np.abs(grad)) < tol:
+            converged = True
+            break
+    return MNLogitResults(B, llf, hess, levels, exog_names, len(codes), converged, n_iter)
@@ -0,0 +1,238 @@
+"""
+报告图批量渲染 (Figure Registry + Renderer)
+
+figures/report_phase3/*.png 统一由这里生成，取代逐个启动 plot_* 脚本：
+- 登记表 FIGURES：每张图 = 数据源 + 绘图函数（各 plot 模块中返回 Figure 的 draw_*）+ savefig 参数
+- 数据源 SOURCES：每个数据源只在主进程加载一次（读 CSV / 模型文件，交互图在此拟合一次模型），
+  经进程池初始化参数共享给各工作进程；工作进程使用 Agg 后端，matplotlib 只导入一次，连续绘制多张图
+- 增量：每张图的键 = sha256(数据源输入文件内容 + 绘图/加载代码及其本地依赖 + savefig 参数)，
+  与 .render_cache.json 中记录一致且图片存在时跳过
+- 阈值样条图使用 threshold_spline_check.py 写出的曲线 CSV，不再重新拟合
+- 各模块的 RC_PARAMS（中文字体等）只在绘制该模块的图时通过 rc_context 生效
+
+用法：
+  python render_figures.py                 # 全部（只重画变化的）
+  python render_figures.py pca_loadings    # 指定图
+  python render_figures.py --force --jobs 4
+"""
+import argparse
+import hashlib
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+import matplotlib
+
+matplotlib.use("Agg")
+import matplotlib.pyplot as plt
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+from ceps_config import FIGURES_DIR
+from feature_store import feature_dir
+from pipeline import file_digest, local_modules
+import plot_interaction_pca
+import plot_pca_explained
+import plot_rf_importance
+import threshold_spline_check
+
+
+FIG_DIR = FIGURES_DIR / "report_phase3"
+CACHE_FILE = FIG_DIR / ".render_cache.json"
+
+THRESHOLD_VARS = ["bonding_idx", "linking_idx"]
+
+
+def _dataset_files(data_file):
+    """read_dataset 读取的全部文件：基础 CSV + 旁路特征"""
+    return [Path(data_file)] + sorted(feature_dir(data_file).glob("*.parquet"))
+
+
+# source -> (module, loader name, loader args, input files)
+SOURCES = {
+    "pca": (
+        plot_pca_explained,
+        "load_pca_data",
+        (),
+        lambda: [plot_pca_explained.MODEL_FILE] + _dataset_files(plot_pca_explained.DATA_FILE),
+    ),
+    "interaction": (
+        plot_interaction_pca,
+        "interaction_curves",
+        (),
+        lambda: _dataset_files(plot_interaction_pca.DATA_FILE),
+    ),
+    "rf_importance": (
+        plot_rf_importance,
+        "load_importance",
+        (),
+        lambda: [plot_rf_importance.DATA_FILE],
+    ),
+    **{
+        f"threshold_{var}": (
+            threshold_spline_check,
+            "load_curve",
+            (var,),
+            lambda var=var: [Path(str(threshold_spline_check.CURVE_FILE).format(name=var))],
+        )
+        for var in THRESHOLD_VARS
+    },
+}
+
+SAVE_150 = {"dpi": 150, "bbox_inches": "tight"}
+SAVE_300 = {"dpi": 300}
+
+FIGURES = [
+    {"name": "pca_scree_plot", "source": "pca", "draw": "draw_scree", "save": SAVE_150},
+    {"name": "pca_loadings", "source": "pca", "draw": "draw_loadings", "save": SAVE_150},
+    {"name": "pca_input_correlation", "source": "pca", "draw": "draw_correlation", "save": SAVE_150},
+    {"name": "pca_ses_distribution", "source": "pca", "draw": "draw_ses_distribution", "save": SAVE_150},
+    {"name": "interaction_plot_pca", "source": "interaction", "draw": "draw_interaction", "save": SAVE_300},
+    {"name": "rf_feature_importance", "source": "rf_importance", "draw": "draw_importance", "save": SAVE_150},
+    *[
+        {
+            "name": f"threshold_{var}_spline",
+            "source": f"threshold_{var}",
+            "draw": "draw_threshold",
+            "args": (var,),
+            "save": SAVE_300,
+        }
+        for var in THRESHOLD_VARS
+    ],
+]
+
+_WORKER = {}
+
+
+def _registry():
+    return {fig["name"]: fig for fig in FIGURES}
+
+
+def figure_key(fig, input_digests):
+    module = SOURCES[fig["source"]][0]
+    h = hashlib.sha256()
+    for path in local_modules(Path(module.__file__).resolve()):
+        h.update(path.name.encode("utf-8"))
+        h.update(file_digest(path).encode("ascii"))
+    for digest in input_digests:
+        h.update(digest.encode("ascii"))
+    h.update(json.dumps([fig["name"], fig["draw"], fig.get("args", ()), fig["save"]]).encode("utf-8"))
+    return h.hexdigest()
+
+
+def _read_cache():
+    try:
+        with open(CACHE_FILE, encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def _write_cache(cache):
+    tmp = CACHE_FILE.with_suffix(".json.tmp")
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(cache, f, indent=1)
+    os.replace(tmp, CACHE_FILE)
+
+
+def _init_worker(prepared):
+    _WORKER["prepared"] = prepared
+
+
+def _render(name):
+    start = time.perf_counter()
+    fig_spec = _registry()[name]
+    module = SOURCES[fig_spec["source"]][0]
+    draw = getattr(module, fig_spec["draw"])
+    out_path = FIG_DIR / f"{name}.png"
+    tmp = FIG_DIR / f".{name}.{os.getpid()}.png"
+    # Module-specific rc settings (fonts) must not leak into the next figure drawn by this worker
+    with plt.rc_context(getattr(module, "RC_PARAMS", {})):
+        fig = draw(_WORKER["prepared"][fig_spec["source"]], *fig_spec.get("args", ()))
+        fig.savefig(tmp, format="png", **fig_spec["save"])
+    plt.close(fig)
+    os.replace(tmp, out_path)
+    return name, time.perf_counter() - start
+
+
+def plan(names=None, force=False):
+    """返回 (需要渲染的 {图: 键}, 需要加载的数据源, 因输入缺失而跳过的图)"""
+    cache = _read_cache()
+    digests = {}
+    stale, missing = {}, []
+    for fig in FIGURES:
+        if names and fig["name"] not in names:
+            continue
+        inputs = SOURCES[fig["source"]][3]()
+        absent = [str(p) for p in inputs if not p.is_file()]
+        if absent:
+            missing.append((fig["name"], absent))
+            continue
+        for path in inputs:
+            if path not in digests:
+                digests[path] = file_digest(path)
+        key = figure_key(fig, [digests[p] for p in inputs])
+        if force or cache.get(fig["name"]) != key or not (FIG_DIR / f"{fig['name']}.png").exists():
+            stale[fig["name"]] = key
+    sources = sorted({_registry()[name]["source"] for name in stale})
+    return stale, sources, missing
+
+
+def render(names=None, force=False, n_jobs=None):
+    stale, sources, missing = plan(names, force)
+    for name, absent in missing:
+        print(f"[WARN] {name}: missing inputs {absent}")
+    if not stale:
+        print("[INFO] All figures up to date")
+        return stale
+
+    start = time.perf_counter()
+    prepared = {}
+    for source in sources:
+        module, loader, args, _inputs = SOURCES[source]
+        prepared[source] = getattr(module, loader)(*args)
+    print(f"[INFO] Loaded {len(sources)} data sources in {time.perf_counter() - start:.1f}s")
+
+    FIG_DIR.mkdir(parents=True, exist_ok=True)
+    cache = _read_cache()
+    n_jobs = n_jobs or min(len(stale), os.cpu_count() or 1)
+    if n_jobs == 1:
+        _init_worker(prepared)
+        done = map(_render, stale)
+        pool = None
+    else:
+        pool = ProcessPoolExecutor(n_jobs, initializer=_init_worker, initargs=(prepared,))
+        done = pool.map(_render, stale)
+    try:
+        for name, seconds in done:
+            cache[name] = stale[name]
+            print(f"[DONE] {name}.png ({seconds:.1f}s)")
+    finally:
+        _write_cache(cache)
+        if pool is not None:
+            pool.shutdown()
+    print(f"[DONE] Rendered {len(stale)} figures in {time.perf_counter() - start:.1f}s -> {FIG_DIR}")
+    return stale
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Render the report figures, redrawing only those whose inputs changed.")
+    parser.add_argument("names", nargs="*", help="figures to render (default: all)")
+    parser.add_argument("--force", action="store_true", help="redraw even if up to date")
+    parser.add_argument("--jobs", type=int, default=None)
+    parser.add_argument("--list", action="store_true")
+    args = parser.parse_args()
+    if args.list:
+        for fig in FIGURES:
+            print(f"{fig['name']}: {fig['source']}")
+        return
+    unknown = [n for n in args.names if n not in _registry()]
+    if unknown:
+        raise SystemExit(f"Unknown figures: {unknown}")
+    render(args.names or None, args.force, args.jobs)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,211 @@
+"""
+随机森林置换重要性 (Permutation Importance)
+
+Gini 重要性（feature_importances_）偏向取值多的连续变量（cog_score），对二值的 hukou_type 不公平；
+这里改为在留出折上计算置换重要性：
+- 两种森林：nominal 为把 9 个类别当作无序类别的 RandomForestClassifier；
+  ordinal 为 Frank & Hall 累积阈值森林，对每个阈值 j 拟合二元森林估计 P(y > j)，
+  按阈值方向单调修正后差分得到类别概率
+- 评分为损失（默认 ranked probability score，考虑类别顺序；或 log loss），重要性 = 置换后损失 - 原始损失
+- 变量组（如社会资本块 bonding_idx + linking_idx）按同一随机置换联合打乱
+- 复用树遍历：每棵树在测试折上的叶节点贡献只算一次；置换某组变量时，只有在该组变量上分裂过的树需要重新遍历，
+  其余树的贡献不变；同组的全部置换重复堆叠为一个批次一次遍历
+- 各折在进程池中并行，每折的随机种子由 SeedSequence(seed).spawn 固定
+"""
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+from sklearn.ensemble import RandomForestClassifier
+from sklearn.model_selection import StratifiedKFold
+
+
+FOREST_PARAMS = {"n_estimators": 200, "max_depth": 5, "min_samples_leaf": 80}
+
+_WORKER = {}
+
+
+class ForestModel:
+    """
+    森林的原始输出 = base + 各树叶节点贡献之和，finalize() 把原始输出映射为类别概率
+    nominal：原始输出即类别概率 (n, J)；ordinal：原始输出为 P(y > j) (n, J-1)
+    """
+
+    def __init__(self, levels, mode, forests):
+        self.levels = levels
+        self.mode = mode
+        self.forests = forests
+        width = len(levels) if mode == "nominal" else len(levels) - 1
+        self.base = np.zeros(width)
+        # (tree_, features split on, output columns, leaf table (n_nodes, len(columns)))
+        self.units = []
+        for column, forest in forests:
+            if not hasattr(forest, "estimators_"):
+                # Constant binary target in this training fold
+                self.base[column] += forest
+                continue
+            n_trees = len(forest.estimators_)
+            for est in forest.estimators_:
+                tree = est.tree_
+                value = tree.value[:, 0, :]
+                value = value / value.sum(axis=1, keepdims=True) / n_trees
+                if mode == "nominal":
+                    columns, table = np.searchsorted(levels, forest.classes_), value
+                else:
+                    columns, table = np.array([column]), value[:, list(forest.classes_).index(1)][:, None]
+                used = frozenset(int(f) for f in tree.feature[tree.feature >= 0])
+                self.units.append((tree, used, columns, table))
+
+    def tree_contributions(self, X, units=None):
+        """各树贡献之和 (n, width)"""
+        X = np.ascontiguousarray(X, dtype=np.float32)
+        total = np.zeros((len(X), len(self.base)))
+        for tree, _used, columns, table in self.units if units is None else units:
+            total[:, columns] += table[tree.apply(X)]
+        return total
+
+    def finalize(self, raw):
+        if self.mode == "nominal":
+            return raw
+        # P(y > j) must be non-increasing in j
+        exceed = np.clip(np.minimum.accumulate(raw, axis=-1), 0.0, 1.0)
+        ones = np.ones(raw.shape[:-1] + (1,))
+        return -np.diff(np.concatenate([ones, exceed, 0 * ones], axis=-1), axis=-1)
+
+    def predict_proba(self, X):
+        return self.finalize(self.base + self.tree_contributions(X))
+
+    def gini_importance(self):
+        fitted = [forest for _column, forest in self.forests if hasattr(forest, "estimators_")]
+        return np.mean([forest.feature_importances_ for forest in fitted], axis=0)
+
+
+def fit_forest(X, y, mode="nominal", seed=42, n_jobs=1, **params):
+    """mode：nominal | ordinal；params 覆盖 FOREST_PARAMS"""
+    params = {**FOREST_PARAMS, **params}
+    X = np.asarray(X, dtype=float)
+    y = np.asarray(y)
+    levels = np.unique(y)
+    if mode == "nominal":
+        forest = RandomForestClassifier(random_state=seed, n_jobs=n_jobs, **params).fit(X, y)
+        return ForestModel(levels, mode, [(None, forest)])
+    if mode != "ordinal":
+        raise ValueError(f"Unknown forest mode '{mode}'")
+    forests = []
+    for j, level in enumerate(levels[:-1]):
+        target = (y > level).astype(int)
+        if target.min() == target.max():
+            forests.append((j, float(target[0])))
+            continue
+        forest = RandomForestClassifier(random_state=seed + j, n_jobs=n_jobs, **params)
+        forests.append((j, forest.fit(X, target)))
+    return ForestModel(levels, mode, forests)
+
+
+def ranked_probability_score(probs, codes):
+    """多类别 RPS：累积概率与累积指示的平方差之和，取样本均值"""
+    cum = np.cumsum(probs, axis=-1)[..., :-1]
+    observed = codes[..., None] <= np.arange(probs.shape[-1] - 1)
+    return ((cum - observed) ** 2).sum(axis=-1).mean(axis=-1)
+
+
+def log_loss(probs, codes):
+    p = np.take_along_axis(probs, codes[..., None], axis=-1)[..., 0]
+    return -np.log(np.clip(p, 1e-15, None)).mean(axis=-1)
+
+
+SCORERS = {"rps": ranked_probability_score, "logloss": log_loss}
+
+
+def permutation_drops(model, X, y, groups, n_repeats, rng, scorer="rps"):
+    """
+    测试折上各变量组的损失增量 (n_groups, n_repeats)
+    groups：[列索引列表]；未在组内变量上分裂的树沿用原始贡献
+    """
+    score = SCORERS[scorer]
+    X = np.asarray(X, dtype=np.float32)
+    n = len(X)
+    codes = np.searchsorted(model.levels, y)
+    raw = model.base + model.tree_contributions(X)
+    baseline = score(model.finalize(raw), codes)
+
+    drops = np.zeros((len(groups), n_repeats))
+    for g, cols in enumerate(groups):
+        affected = [unit for unit in model.units if unit[1] & set(cols)]
+        orders = np.stack([rng.permutation(n) for _ in range(n_repeats)])
+        if not affected:
+            continue
+        # All repeats stacked as one batch: (n_repeats * n, p)
+        batch = np.tile(X, (n_repeats, 1))
+        batch[:, cols] = X[orders.reshape(-1)][:, cols]
+        kept = raw - model.tree_contributions(X, affected)
+        permuted = kept[None] + model.tree_contributions(batch, affected).reshape(n_repeats, n, -1)
+        drops[g] = score(model.finalize(permuted), np.broadcast_to(codes, (n_repeats, n))) - baseline
+    return drops
+
+
+def _init_worker(X, y, groups, mode, n_repeats, scorer, forest_params):
+    _WORKER.update(
+        X=X, y=y, groups=groups, mode=mode, n_repeats=n_repeats, scorer=scorer, forest_params=forest_params
+    )
+
+
+def _fold_task(task):
+    train, test, seed_seq = task
+    w = _WORKER
+    rng = np.random.default_rng(seed_seq)
+    seed = int(seed_seq.generate_state(1)[0] % (2**31))
+    model = fit_forest(w["X"][train], w["y"][train], w["mode"], seed=seed, **w["forest_params"])
+    drops = permutation_drops(model, w["X"][test], w["y"][test], w["groups"], w["n_repeats"], rng, w["scorer"])
+    return drops, model.gini_importance()
+
+
+def permutation_importance(
+    X,
+    y,
+    groups=None,
+    mode="nominal",
+    n_folds=5,
+    n_repeats=10,
+    scorer="rps",
+    seed=20240601,
+    n_jobs=None,
+    **forest_params,
+):
+    """
+    X：DataFrame；groups：{组名: [列名]}（默认每个变量单独一组）
+    返回 DataFrame：行为组，列 importance / importance_std（跨折与重复）/ importance_se（折间）/ gini
+    """
+    names = list(X.columns)
+    groups = groups or {c: [c] for c in names}
+    group_cols = [[names.index(c) for c in cols] for cols in groups.values()]
+    Xa = X.to_numpy(dtype=float)
+    ya = np.asarray(y)
+
+    folds = StratifiedKFold(n_folds, shuffle=True, random_state=seed % (2**31)).split(Xa, ya)
+    seeds = np.random.SeedSequence(seed).spawn(n_folds)
+    tasks = [(train, test, s) for (train, test), s in zip(folds, seeds)]
+    initargs = (Xa, ya, group_cols, mode, n_repeats, scorer, forest_params)
+    n_jobs = n_jobs or min(n_folds, os.cpu_count() or 1)
+    if n_jobs == 1:
+        _init_worker(*initargs)
+        results = [_fold_task(t) for t in tasks]
+    else:
+        with ProcessPoolExecutor(n_jobs, initializer=_init_worker, initargs=initargs) as pool:
+            results = list(pool.map(_fold_task, tasks))
+
+    drops = np.stack([r[0] for r in results])  # (folds, groups, repeats)
+    gini = np.mean([r[1] for r in results], axis=0)
+    fold_means = drops.mean(axis=2)
+    table = pd.DataFrame(
+        {
+            "importance": drops.mean(axis=(0, 2)),
+            "importance_std": drops.transpose(1, 0, 2).reshape(len(groups), -1).std(axis=1, ddof=1),
+            "importance_se": fold_means.std(axis=0, ddof=1) / np.sqrt(n_folds),
+            "gini": [gini[cols].sum() for cols in group_cols],
+        },
+        index=pd.Index(list(groups), name="feature"),
+    )
+    table.attrs.update(mode=mode, scorer=scorer, n_folds=n_folds, n_repeats=n_repeats)
+    return table
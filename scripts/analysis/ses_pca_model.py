@@ -0,0 +1,154 @@
+"""
+SES 主成分模型 (SesPCA)
+
+拟合一次、保存为小的 .npz 文件，计算、绘图与对新数据打分的脚本都加载同一份结果：
+- mean / std：z 分数所用的均值和标准差（ddof=0，均值已按反向标记调整）
+- invert：逐列反向标记（1 - value）
+- eigvals / loadings：相关矩阵的特征值（降序）与特征向量，PC1 符号已与 align_col 对齐
+- corr：反向后输入变量的相关矩阵
+- 加权拟合（抽样权重）：chunk_moments 传入 weights，矩中的 n 为权重和，合并公式不变；
+  权重应先归一化到均值 1，n 才与样本量同一量级
+"""
+from pathlib import Path
+
+import numpy as np
+
+
+PCA_COLS = [
+    "parent_edu_max",
+    "family_econ",
+    "home_books",
+    "has_desk",
+    "has_computer",
+]
+ALIGN_COL = "family_econ"
+INVERTIBLE_COLS = ["has_computer"]
+
+
+def chunk_moments(X, weights=None):
+    """(n, mean, M2)，M2 为中心化叉积矩阵；weights 给定时 n 为权重和，mean / M2 为加权"""
+    if weights is None:
+        mean = X.mean(axis=0)
+        D = X - mean
+        return len(X), mean, D.T @ D
+    weights = np.asarray(weights, dtype=float)
+    total = weights.sum()
+    mean = weights @ X / total
+    D = X - mean
+    return total, mean, (D * weights[:, None]).T @ D
+
+
+def merge_moments(a, b):
+    """Chan et al. 的两组矩合并（数值稳定，顺序无关）"""
+    n_a, mean_a, m2_a = a
+    n_b, mean_b, m2_b = b
+    if n_a == 0:
+        return b
+    if n_b == 0:
+        return a
+    n = n_a + n_b
+    delta = mean_b - mean_a
+    mean = mean_a + delta * (n_b / n)
+    m2 = m2_a + m2_b + np.outer(delta, delta) * (n_a * n_b / n)
+    return n, mean, m2
+
+
+def empty_moments(k):
+    return 0, np.zeros(k), np.zeros((k, k))
+
+
+class SesPCA:
+    def __init__(self, columns, n, mean, std, invert, eigvals, loadings, corr):
+        self.columns = list(columns)
+        self.n = int(round(float(n)))
+        self.mean = np.asarray(mean, dtype=float)
+        self.std = np.asarray(std, dtype=float)
+        self.invert = np.asarray(invert, dtype=bool)
+        self.eigvals = np.asarray(eigvals, dtype=float)
+        self.loadings = np.asarray(loadings, dtype=float)
+        self.corr = np.asarray(corr, dtype=float)
+
+    @classmethod
+    def from_moments(cls, moments, columns=PCA_COLS, align_col=ALIGN_COL, invertible=INVERTIBLE_COLS):
+        """
+        由累积矩拟合（z 分数的 ddof=0 协方差即相关矩阵）
+        - invertible 中与 align_col 负相关的列取 1 - value（相关矩阵对应行列变号）
+        - PC1 与 align_col 的协方差为 eigval * loading[align_col]，据此对齐符号
+        """
+        n, mean, m2 = moments
+        cov = m2 / n
+        std = np.sqrt(np.diag(cov))
+        corr = cov / np.outer(std, std)
+        mean = mean.copy()
+
+        i_align = columns.index(align_col)
+        invert = np.array([c in invertible and corr[i, i_align] < 0 for i, c in enumerate(columns)])
+        if invert.any():
+            flip = np.where(invert, -1.0, 1.0)
+            corr = corr * np.outer(flip, flip)
+            mean[invert] = 1 - mean[invert]
+
+        eigvals, eigvecs = np.linalg.eigh(corr)
+        order = np.argsort(eigvals)[::-1]
+        eigvals = eigvals[order]
+        eigvecs = eigvecs[:, order]
+        # Align sign so higher scores indicate higher SES
+        if eigvecs[i_align, 0] < 0:
+            eigvecs[:, 0] = -eigvecs[:, 0]
+
+        return cls(columns, n, mean, std, invert, eigvals, eigvecs, corr)
+
+    @classmethod
+    def fit(cls, X, **kwargs):
+        return cls.from_moments(chunk_moments(np.asarray(X, dtype=float)), **kwargs)
+
+    @property
+    def explained_ratio(self):
+        return self.eigvals / self.eigvals.sum()
+
+    @property
+    def pc1_weights(self):
+        """原始尺度上的 PC1 权重：score = X @ w + b（反向列的权重已变号）"""
+        sign = np.where(self.invert, -1.0, 1.0)
+        return sign * self.loadings[:, 0] / self.std
+
+    @property
+    def pc1_offset(self):
+        shift = np.where(self.invert, 1.0, 0.0)
+        return float(((shift - self.mean) / self.std) @ self.loadings[:, 0])
+
+    def transform(self, X):
+        """PC1 得分；X 为 DataFrame（按 columns 取列）或列顺序一致的数组"""
+        if hasattr(X, "columns"):
+            X = X[self.columns]
+        X = np.asarray(X, dtype=float)
+        return X @ self.pc1_weights + self.pc1_offset
+
+    def save(self, path):
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        np.savez(
+            path,
+            columns=np.array(self.columns),
+            n=self.n,
+            mean=self.mean,
+            std=self.std,
+            invert=self.invert,
+            eigvals=self.eigvals,
+            loadings=self.loadings,
+            corr=self.corr,
+        )
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path, allow_pickle=False) as z:
+            return cls(
+                [str(c) for c in z["columns"]],
+                z["n"],
+                z["mean"],
+                z["std"],
+                z["invert"],
+                z["eigvals"],
+                z["loadings"],
+                z["corr"],
+            )
@@ -0,0 +1,206 @@
+"""
+交互假设的多规格批量拟合 (Specification Grid)
+
+一次运行拟合一组有序 logit 规格并输出对比表：
+- 所有规格用到的列只构造一次，组成共享设计矩阵；规格只是列下标的子集
+- 所有规格使用同一样本（任一所需列缺失的行统一剔除），LLF / AIC / BIC 可直接比较
+- 各规格在进程池中并行拟合，聚类稳健 SE 按 clsids 计算
+- LR 检验（嵌套基准 = 项集为其真子集的规格）：
+  joint_* 对项数最少的嵌套基准（默认规格中即 main），检验全部新增项；
+  step_* 对项数最多的嵌套基准（项数相同时取列表中靠前者），检验最后加入的项，与 joint 相同时不重复
+
+规格可用 --specs 指定 JSON 文件：[{"name": "...", "terms": ["bonding_idx_z", ...]}, ...]
+"""
+import argparse
+import json
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+from scipy import stats
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+from ceps_config import DATA_FILE, RESULTS_DIR
+from analysis_data import INTERACTIONS, PREDICTORS, add_columns, add_interactions, load_model_frame
+from ordered_logit import cov_cluster, fit_ordered_logit
+
+
+OUTPUT_FILE = RESULTS_DIR / "phase3" / "spec_grid_report.txt"
+TABLE_FILE = RESULTS_DIR / "phase3" / "spec_grid_table.csv"
+
+# Variables outside the shared model frame that alternates may use
+ALTERNATE_COLS = ["ses_self"]
+
+SES_SELF_MAIN = ["bonding_idx_z", "linking_idx_z", "ses_self_z", "hukou_type", "cog_score_z"]
+DEFAULT_SPECS = [
+    {"name": "main", "terms": PREDICTORS},
+    {"name": "linking_x_ses", "terms": PREDICTORS + ["linking_x_ses"]},
+    {"name": "bonding_x_ses", "terms": PREDICTORS + ["bonding_x_ses"]},
+    {"name": "linking_x_hukou", "terms": PREDICTORS + ["linking_x_hukou"]},
+    {"name": "all_interactions", "terms": PREDICTORS + ["linking_x_ses", "bonding_x_ses", "linking_x_hukou"]},
+    {"name": "ses_self_main", "terms": SES_SELF_MAIN},
+    {
+        "name": "ses_self_interactions",
+        "terms": SES_SELF_MAIN + ["linking_x_ses_self", "bonding_x_ses_self", "linking_x_hukou"],
+    },
+]
+
+_WORKER = {}
+
+
+def _init_worker(y, X, groups, columns):
+    _WORKER.update(y=y, X=X, groups=groups, columns=columns)
+
+
+def _fit_spec(terms):
+    w = _WORKER
+    idx = [w["columns"].index(t) for t in terms]
+    X = pd.DataFrame(w["X"][:, idx], columns=terms)
+    try:
+        res = fit_ordered_logit(w["y"], X)
+        robust_se = np.sqrt(np.diag(cov_cluster(res, w["groups"])))
+    except (np.linalg.LinAlgError, RuntimeError) as exc:
+        return {"error": str(exc)}
+    return {
+        "params": res.params,
+        "robust_se": pd.Series(robust_se, index=res.params.index),
+        "llf": res.llf,
+        "aic": res.aic,
+        "bic": res.bic,
+        "k": len(res.params),
+        "nobs": res.nobs,
+        "converged": res.converged,
+    }
+
+
+def build_design(df, specs):
+    """共享设计矩阵：所有规格用到的列（交互项按需构造），剔除任一列缺失的行"""
+    columns = list(dict.fromkeys(t for spec in specs for t in spec["terms"]))
+    add_interactions(df, [c for c in columns if c in INTERACTIONS])
+    missing = [c for c in columns if c not in df.columns]
+    if missing:
+        raise ValueError(f"Unknown terms in specs: {missing}")
+    keep = df[columns + ["expect_edu_raw", "clsids"]].notna().all(axis=1).to_numpy()
+    X = df.loc[keep, columns].to_numpy(dtype=float)
+    return X, df.loc[keep, "expect_edu_raw"].to_numpy(), df.loc[keep, "clsids"].to_numpy(), columns, int((~keep).sum())
+
+
+def nested_base(specs):
+    """{规格名: (joint 基准, stepwise 基准)}；没有嵌套规格时为 (None, None)"""
+    bases = {}
+    for spec in specs:
+        terms = set(spec["terms"])
+        candidates = [s for s in specs if set(s["terms"]) < terms]
+        if not candidates:
+            bases[spec["name"]] = (None, None)
+            continue
+        joint = min(candidates, key=lambda s: len(s["terms"]))["name"]
+        step = max(candidates, key=lambda s: len(s["terms"]))["name"]
+        bases[spec["name"]] = (joint, step)
+    return bases
+
+
+def lr_test(fit, base_fit):
+    lr = 2 * (fit["llf"] - base_fit["llf"])
+    df_lr = fit["k"] - base_fit["k"]
+    return lr, df_lr, stats.chi2.sf(lr, df_lr)
+
+
+def run_grid(df, specs, n_jobs=None):
+    """返回 (对比表, {规格名: 拟合摘要}, 剔除行数)"""
+    X, y, groups, columns, n_dropped = build_design(df, specs)
+    n_jobs = n_jobs or min(len(specs), os.cpu_count() or 1)
+    initargs = (y, X, groups, columns)
+    terms = [spec["terms"] for spec in specs]
+    if n_jobs == 1:
+        _init_worker(*initargs)
+        fits = [_fit_spec(t) for t in terms]
+    else:
+        with ProcessPoolExecutor(n_jobs, initializer=_init_worker, initargs=initargs) as pool:
+            fits = list(pool.map(_fit_spec, terms))
+    fits = dict(zip([spec["name"] for spec in specs], fits))
+
+    rows = []
+    bases = nested_base(specs)
+    for spec in specs:
+        name = spec["name"]
+        fit = fits[name]
+        row = {"spec": name, "n_terms": len(spec["terms"])}
+        if "error" in fit:
+            row["error"] = fit["error"]
+            rows.append(row)
+            continue
+        row.update({k: fit[k] for k in ["nobs", "k", "llf", "aic", "bic", "converged"]})
+        joint, step = bases[name]
+        if joint is not None and "error" not in fits[joint]:
+            lr, df_lr, p = lr_test(fit, fits[joint])
+            row.update({"joint_base": joint, "joint_lr": lr, "joint_df": df_lr, "joint_p": p})
+        if step is not None and step != joint and "error" not in fits[step]:
+            lr, df_lr, p = lr_test(fit, fits[step])
+            row.update({"step_base": step, "step_lr": lr, "step_df": df_lr, "step_p": p})
+        rows.append(row)
+    return pd.DataFrame(rows).set_index("spec"), fits, n_dropped
+
+
+def coefficient_tables(specs, fits, columns):
+    """项 x 规格 的系数、聚类稳健 SE 与 p 值表"""
+    ok = [s["name"] for s in specs if "error" not in fits[s["name"]]]
+    coef = pd.DataFrame({name: fits[name]["params"] for name in ok}).reindex(columns)
+    se = pd.DataFrame({name: fits[name]["robust_se"] for name in ok}).reindex(columns)
+    p = pd.DataFrame(2 * stats.norm.sf(np.abs(coef / se)), index=coef.index, columns=coef.columns)
+    return coef, se, p
+
+
+def load_specs(path):
+    with open(path, encoding="utf-8") as f:
+        specs = json.load(f)
+    names = [s["name"] for s in specs]
+    if len(set(names)) != len(names):
+        raise ValueError("Spec names must be unique")
+    return specs
+
+
+def main(specs=None, n_jobs=None):
+    specs = specs or DEFAULT_SPECS
+    df = load_model_frame(DATA_FILE)
+    needed = {t for spec in specs for t in spec["terms"]}
+    needed |= {c for name in needed if name in INTERACTIONS for c in INTERACTIONS[name]}
+    extra = [c for c in ALTERNATE_COLS if f"{c}_z" in needed or c in needed]
+    if extra:
+        add_columns(df, DATA_FILE, extra)
+
+    table, fits, n_dropped = run_grid(df, specs, n_jobs)
+    terms = list(dict.fromkeys(t for spec in specs for t in spec["terms"]))
+    coef, se, p = coefficient_tables(specs, fits, terms)
+
+    OUTPUT_FILE.parent.mkdir(parents=True, exist_ok=True)
+    table.to_csv(TABLE_FILE, encoding="utf-8-sig")
+    with open(OUTPUT_FILE, "w", encoding="utf-8") as f:
+        f.write("=== Specification Grid: Ordered Logit (expect_edu_raw) ===\n\n")
+        f.write(f"Specs: {len(specs)}   Common sample N: {int(table['nobs'].max())}   ")
+        f.write(f"Rows dropped for missing alternates: {n_dropped}\n")
+        f.write("joint_*: LR test against the smallest nested spec (all added terms jointly).\n")
+        f.write("step_*: LR test against the largest nested spec (last added terms), when different.\n\n")
+        f.write("--- Model Comparison ---\n")
+        f.write(table.to_string(float_format=lambda x: f"{x:.4f}"))
+        f.write("\n\n--- Coefficients ---\n")
+        f.write(coef.to_string(float_format=lambda x: f"{x:.4f}", na_rep=""))
+        f.write("\n\n--- Cluster-robust SE (by clsids) ---\n")
+        f.write(se.to_string(float_format=lambda x: f"{x:.4f}", na_rep=""))
+        f.write("\n\n--- Cluster-robust p-values ---\n")
+        f.write(p.to_string(float_format=lambda x: f"{x:.4f}", na_rep=""))
+        f.write("\n")
+
+    print(f"[DONE] Report: {OUTPUT_FILE}")
+    print(f"[DONE] Table: {TABLE_FILE}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Fit a grid of ordered logit specifications.")
+    parser.add_argument("--specs", type=Path, help="JSON file with [{name, terms}, ...]")
+    parser.add_argument("--jobs", type=int, default=None, help="worker processes (default: one per spec)")
+    args = parser.parse_args()
+    main(load_specs(args.specs) if args.specs else None, args.jobs)
@@ -0,0 +1,73 @@
+"""
+B 样条基 (BSplineBasis)
+
+与 patsy bs(x, df, degree, include_intercept) 相同的节点规则与基函数：
+- 内部节点取训练数据的分位数（np.percentile 线性插值），边界节点为训练数据的最小/最大值
+- 节点在 from_data() 时固定，之后对预测网格、bootstrap 重抽样等任意 x 求值都使用同一组节点
+  （patsy 无状态调用会按新数据重新取分位数）
+- 求值为向量化 de Boor 三角递推：每个 x 只计算 degree + 1 个非零基函数，无公式解析
+- 超出训练范围的 x 按端区间多项式外推（patsy 会直接报错）
+"""
+import numpy as np
+import pandas as pd
+
+
+class BSplineBasis:
+    def __init__(self, inner_knots, lower, upper, degree=3, include_intercept=False):
+        self.inner_knots = np.asarray(inner_knots, dtype=float)
+        self.lower = float(lower)
+        self.upper = float(upper)
+        self.degree = int(degree)
+        self.include_intercept = bool(include_intercept)
+        p = self.degree
+        self.knots = np.concatenate([[self.lower] * (p + 1), self.inner_knots, [self.upper] * (p + 1)])
+        self.n_basis = len(self.knots) - p - 1
+
+    @classmethod
+    def from_data(cls, x, df=4, degree=3, include_intercept=False):
+        """按 patsy 规则由训练数据确定节点；df 为输出列数"""
+        x = np.asarray(x, dtype=float)
+        n_inner = df - degree - (1 if include_intercept else 0)
+        if n_inner < 0:
+            raise ValueError(f"df={df} is too small for degree={degree}")
+        quantiles = np.linspace(0, 1, n_inner + 2)[1:-1]
+        inner = np.percentile(x, 100 * quantiles) if n_inner else np.array([])
+        return cls(inner, x.min(), x.max(), degree, include_intercept)
+
+    @property
+    def df(self):
+        return self.n_basis - (0 if self.include_intercept else 1)
+
+    def transform(self, x):
+        """(n, df) 基矩阵"""
+        x = np.asarray(x, dtype=float)
+        t, p = self.knots, self.degree
+        # Knot span of each x, clamped so that points outside use the end pieces
+        span = np.clip(np.searchsorted(t, x, side="right") - 1, p, self.n_basis - 1)
+
+        N = np.zeros((len(x), p + 1))
+        N[:, 0] = 1.0
+        left = np.zeros((len(x), p + 1))
+        right = np.zeros((len(x), p + 1))
+        for j in range(1, p + 1):
+            left[:, j] = x - t[span + 1 - j]
+            right[:, j] = t[span + j] - x
+            saved = np.zeros(len(x))
+            for r in range(j):
+                denom = right[:, r + 1] + left[:, j - r]
+                # Repeated knots give 0/0; the B-spline convention takes it as 0
+                temp = np.divide(N[:, r], denom, out=np.zeros(len(x)), where=denom != 0)
+                N[:, r] = saved + right[:, r + 1] * temp
+                saved = left[:, j - r] * temp
+            N[:, j] = saved
+
+        basis = np.zeros((len(x), self.n_basis))
+        cols = span[:, None] - p + np.arange(p + 1)
+        np.put_along_axis(basis, cols, N, axis=1)
+        return basis if self.include_intercept else basis[:, 1:]
+
+    def column_names(self, prefix="spl"):
+        return [f"{prefix}_{i}" for i in range(self.df)]
+
+    def frame(self, x, prefix="spl", index=None):
+        return pd.DataFrame(self.transform(x), columns=self.column_names(prefix), index=index)
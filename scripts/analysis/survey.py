@@ -0,0 +1,252 @@
+"""
+复杂抽样设计下的加权估计 (Survey-weighted Estimation)
+
+CEPS 为分层、多阶段整群抽样，按样本直接计算的统计量不代表总体。这里提供统一的设计对象与加权估计：
+- SurveyDesign：权重 + 分层 + 初级抽样单元 (PSU)；按"最终整群"近似，只用第一阶段的 PSU 计算方差
+- 设计方差（Taylor 线性化）：估计量的逐观测影响值 z_k 乘以权重后按 PSU 求和得 t_hi，
+  V = sum_h n_h/(n_h-1) sum_i (t_hi - mean_h)(t_hi - mean_h)'；只有一个 PSU 的层不贡献方差
+- PSU 与层的编码、排序与分段起点在构造时计算一次，之后每次求方差只是一次 np.add.reduceat
+  加几次矩阵乘法，与不加权的聚类稳健方差开销相当
+- 加权 z 分数（权重全为 1 时与 analysis_data.zscore 的 ddof=1 完全一致）
+- 加权有序 logit：伪似然 (ordered_logit.fit_ordered_logit 的 weights 参数)，协方差为设计 sandwich
+- 域均值之差的设计 t 检验、二维表的 Rao-Scott 校正卡方（一阶校正及 F 近似，同 R survey::svychisq）
+
+设计变量来自清洗阶段写出的旁路特征 features/survey_design.parquet（sweight / stratum / psu）；
+数据中没有这些列时 SurveyDesign.from_frame 返回 None，调用方退回不加权结果。
+"""
+import numpy as np
+import pandas as pd
+from scipy import stats
+
+from ordered_logit import fit_ordered_logit
+
+
+DESIGN_COLS = ["sweight", "stratum", "psu"]
+
+
+class SurveyDesign:
+    def __init__(self, weights, strata=None, psu=None):
+        self.weights = np.asarray(weights, dtype=float)
+        n = len(self.weights)
+        if not np.isfinite(self.weights).all() or (self.weights <= 0).any():
+            raise ValueError("Survey weights must be positive and finite")
+        strata = np.zeros(n) if strata is None else np.asarray(strata)
+        # Without PSUs every observation is its own sampling unit
+        psu = np.arange(n) if psu is None else np.asarray(psu)
+        self.strata = strata
+        self.psu = psu
+
+        # PSU ids are only unique within a stratum; sort by (stratum, psu) so that
+        # observations of a PSU and PSUs of a stratum are both contiguous segments
+        stratum_codes, _ = pd.factorize(strata, sort=True)
+        psu_codes, _ = pd.factorize(psu, sort=True)
+        self.order = np.lexsort((psu_codes, stratum_codes))
+        s_sorted, p_sorted = stratum_codes[self.order], psu_codes[self.order]
+        new_psu = np.r_[True, (s_sorted[1:] != s_sorted[:-1]) | (p_sorted[1:] != p_sorted[:-1])]
+        self.psu_starts = np.flatnonzero(new_psu)
+        psu_stratum = s_sorted[self.psu_starts]
+        self.stratum_starts = np.flatnonzero(np.r_[True, psu_stratum[1:] != psu_stratum[:-1]])
+        self.n_psu = len(self.psu_starts)
+        self.n_strata = len(self.stratum_starts)
+        psu_per_stratum = np.diff(np.r_[self.stratum_starts, self.n_psu])
+        self.psu_stratum = np.repeat(np.arange(self.n_strata), psu_per_stratum)
+        self.n_singleton = int((psu_per_stratum == 1).sum())
+        with np.errstate(divide="ignore"):
+            factor = np.where(psu_per_stratum > 1, psu_per_stratum / (psu_per_stratum - 1.0), 0.0)
+        self._psu_scale = np.sqrt(factor)[self.psu_stratum]
+        self._psu_per_stratum = psu_per_stratum
+
+    @classmethod
+    def from_frame(cls, df, weight="sweight", strata="stratum", psu="psu"):
+        """df 中没有权重列时返回 None；分层 / PSU 列缺失时按单层 / 逐观测处理"""
+        if weight not in df.columns or df[weight].isna().all():
+            return None
+        strata_values = df[strata].to_numpy() if strata in df.columns else None
+        psu_values = df[psu].to_numpy() if psu in df.columns else None
+        return cls(df[weight].to_numpy(dtype=float), strata_values, psu_values)
+
+    def subset(self, mask):
+        mask = np.asarray(mask, dtype=bool)
+        return SurveyDesign(self.weights[mask], self.strata[mask], self.psu[mask])
+
+    @property
+    def nobs(self):
+        return len(self.weights)
+
+    @property
+    def df(self):
+        """设计自由度 = PSU 数 - 层数"""
+        return max(self.n_psu - self.n_strata, 1)
+
+    @property
+    def normalized_weights(self):
+        """均值为 1 的权重（伪似然、PCA 矩等只依赖相对权重的量）"""
+        return self.weights / self.weights.mean()
+
+    def psu_totals(self, values, weighted=True):
+        """
+        sum_{k in PSU} w_k * values_k，values 为 (n,) 或 (n, p)；返回 (n_psu, p)
+        values 已含权重（如加权伪似然的得分）时传 weighted=False，只按 PSU 求和
+        """
+        values = np.asarray(values, dtype=float)
+        if values.ndim == 1:
+            values = values[:, None]
+        values = values[self.order]
+        if weighted:
+            values = values * self.weights[self.order, None]
+        return np.add.reduceat(values, self.psu_starts, axis=0)
+
+    def meat(self, values, weighted=True):
+        """影响值 values (n, p) 之加权总和的设计协方差 (p, p)"""
+        totals = self.psu_totals(values, weighted)
+        stratum_sums = np.add.reduceat(totals, self.stratum_starts, axis=0)
+        stratum_means = stratum_sums / self._psu_per_stratum[:, None]
+        centered = (totals - stratum_means[self.psu_stratum]) * self._psu_scale[:, None]
+        return centered.T @ centered
+
+
+def weighted_mean(x, weights):
+    x = np.asarray(x, dtype=float)
+    return float(np.sum(weights * x) / np.sum(weights))
+
+
+def weighted_var(x, weights):
+    """可靠性权重的方差：sum w (x - m)^2 / (V1 - V2 / V1)，权重全为 1 时即 ddof=1 的样本方差"""
+    x = np.asarray(x, dtype=float)
+    w = np.asarray(weights, dtype=float)
+    v1, v2 = w.sum(), np.sum(w ** 2)
+    mean = np.sum(w * x) / v1
+    return float(np.sum(w * (x - mean) ** 2) / (v1 - v2 / v1))
+
+
+def weighted_zscore(series, weights):
+    """analysis_data.zscore 的加权版本（总体均值与标准差）"""
+    std = np.sqrt(weighted_var(series, weights))
+    if std == 0 or pd.isna(std):
+        return series * 0
+    return (series - weighted_mean(series, weights)) / std
+
+
+def cov_survey(result, design, domain=None):
+    """
+    加权有序 logit（伪似然）的设计 sandwich 协方差：H^-1 V(加权得分总和) H^-1
+    - result 须以与设计权重成比例的权重拟合（如 fit_survey_ordered_logit 的归一化权重）；
+      result.score_obs() 已含拟合权重，与 Hessian 同一尺度，按 PSU 求和时不再乘设计权重
+    - domain：拟合样本在设计中的布尔掩码（子总体估计）；域外观测得分为 0 但保留其 PSU 与层，
+      不能先 subset 设计再求方差，否则会丢掉没有域内观测的 PSU
+    """
+    if result.weights is None:
+        raise ValueError("cov_survey needs a weighted fit (fit_ordered_logit(..., weights=...))")
+    scores = result.score_obs()
+    if domain is not None:
+        domain = np.asarray(domain, dtype=bool)
+        padded = np.zeros((design.nobs, scores.shape[1]))
+        padded[domain] = scores
+        scores = padded
+    bread = np.linalg.inv(result.hessian)
+    return bread @ design.meat(scores, weighted=False) @ bread
+
+
+def fit_survey_ordered_logit(y, X, design, domain=None, start_params=None):
+    """
+    以归一化权重拟合有序 logit，结果对象的 cov_params() / bse / summary() 使用设计协方差
+    （设计协方差与权重的整体缩放无关）；domain 给定时 y / X 只含域内的行，顺序与设计一致
+    """
+    weights = design.weights if domain is None else design.weights[np.asarray(domain, dtype=bool)]
+    res = fit_ordered_logit(y, X, start_params=start_params, weights=weights / weights.mean())
+    res.cov = cov_survey(res, design, domain)
+    res.cov_type = f"survey design ({design.n_strata} strata, {design.n_psu} PSUs)"
+    return res
+
+
+def domain_mean_diff(y, in_a, in_b, design):
+    """
+    两个域的加权均值之差及设计 t 检验；y 中缺失的观测不计入任何一个域
+    返回 (差值, 标准误, t, p, 自由度)
+    """
+    y = np.asarray(y, dtype=float)
+    ok = ~np.isnan(y)
+    y0 = np.where(ok, y, 0.0)
+    w = design.weights
+    influence = []
+    means = []
+    for dom in (np.asarray(in_a, dtype=bool) & ok, np.asarray(in_b, dtype=bool) & ok):
+        total = np.sum(w[dom])
+        mean = np.sum(w[dom] * y0[dom]) / total
+        # Linearization of the ratio estimator sum(w y d) / sum(w d)
+        influence.append(np.where(dom, y0 - mean, 0.0) / total)
+        means.append(mean)
+    diff = means[0] - means[1]
+    se = float(np.sqrt(design.meat(influence[0] - influence[1])[0, 0]))
+    t_stat = diff / se if se > 0 else np.nan
+    p_val = 2 * stats.t.sf(abs(t_stat), design.df)
+    return diff, se, t_stat, p_val, design.df
+
+
+def _main_effect_design(n_rows, n_cols):
+    """单元格按行优先展开时的主效应 (截距 + 行 + 列) 与交互效应虚拟变量矩阵"""
+    rows = np.repeat(np.arange(n_rows), n_cols)
+    cols = np.tile(np.arange(n_cols), n_rows)
+    row_dummies = (rows[:, None] == np.arange(1, n_rows)).astype(float)
+    col_dummies = (cols[:, None] == np.arange(1, n_cols)).astype(float)
+    X1 = np.hstack([np.ones((len(rows), 1)), row_dummies, col_dummies])
+    X12 = (row_dummies[:, :, None] * col_dummies[:, None, :]).reshape(len(rows), -1)
+    return X1, X12
+
+
+def rao_scott_chi2(row_values, col_values, design):
+    """
+    二维列联表独立性的 Rao-Scott 检验（同 R survey::svychisq 的 "Chisq" 与 "F"）
+    - 加权单元格比例的设计协方差由线性化得到；对交互对比做广义设计效应矩阵 Delta
+    - 一阶校正：X2 / mean(eig Delta) ~ chi2((r-1)(c-1))
+    - F 近似：X2 / trace(Delta) ~ F(d0, d0 * 设计自由度)，d0 = trace(Delta)^2 / trace(Delta^2)
+    row_values / col_values 中任一缺失的观测不计入
+    """
+    rows = pd.Series(row_values)
+    cols = pd.Series(col_values)
+    ok = (rows.notna() & cols.notna()).to_numpy()
+    row_codes, row_levels = pd.factorize(rows, sort=True)
+    col_codes, col_levels = pd.factorize(cols, sort=True)
+    n_rows, n_cols = len(row_levels), len(col_levels)
+    if n_rows < 2 or n_cols < 2:
+        return None
+
+    cell = np.where(ok, row_codes * n_cols + col_codes, -1)
+    n_cells = n_rows * n_cols
+    w = design.weights
+    indicators = (cell[:, None] == np.arange(n_cells)).astype(float)
+    total = np.sum(w[ok])
+    props = (w @ indicators) / total
+    # Influence of the ratio estimator p_c = sum(w 1_c) / sum(w), zero outside the sample
+    influence = np.where(ok[:, None], indicators - props, 0.0) / total
+    V = design.meat(influence)
+
+    n = int(ok.sum())
+    table = props.reshape(n_rows, n_cols)
+    expected = np.outer(table.sum(axis=1), table.sum(axis=0))
+    pearson = float(n * np.sum((table - expected) ** 2 / np.where(expected > 0, expected, np.inf)))
+
+    X1, X12 = _main_effect_design(n_rows, n_cols)
+    # Interaction contrasts orthogonalized against the main effects
+    C = X12 - X1 @ np.linalg.lstsq(X1, X12, rcond=None)[0]
+    inv_p = np.where(props > 0, 1 / np.where(props > 0, props, 1), 0.0)
+    denom = C.T @ (inv_p[:, None] / n * C)
+    numer = C.T @ (inv_p[:, None] * V * inv_p[None, :]) @ C
+    delta = np.linalg.solve(denom, numer)
+    dof = (n_rows - 1) * (n_cols - 1)
+    trace, trace_sq = np.trace(delta), np.trace(delta @ delta)
+    chi2 = pearson / (trace / dof)
+    d0 = trace ** 2 / trace_sq
+    f_stat = pearson / trace
+    return {
+        "pearson": pearson,
+        "chi2": chi2,
+        "df": dof,
+        "p": float(stats.chi2.sf(chi2, dof)),
+        "mean_deff": trace / dof,
+        "F": f_stat,
+        "df_num": d0,
+        "df_den": d0 * design.df,
+        "p_F": float(stats.f.sf(f_stat, d0, d0 * design.df)),
+        "table": pd.DataFrame(table, index=row_levels, columns=col_levels),
+    }
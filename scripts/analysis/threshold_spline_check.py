@@ -1,40 +1,30 @@
 import math
+import sys
 from pathlib import Path
 
 import numpy as np
 import pandas as pd
-from patsy import dmatrix
-from statsmodels.miscmodels.ordinal_model import OrderedModel
 from scipy import stats
 
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+from ceps_config import DATA_FILE, RESULTS_DIR
+from analysis_data import load_model_frame
+from ordered_logit import fit_ordered_logit
+from ordinal_predict import prob_at_least
+from spline_basis import BSplineBasis
 
-WORKSPACE = Path(r"c:\Users\13926\Desktop\CEPS数据汇总")
-DATA_FILE = WORKSPACE / "rescued_data" / "merged_rescued_all_with_pca_ses.csv"
-REPORT_FILE = WORKSPACE / "results" / "phase3" / "threshold_spline_report.txt"
-FIG_DIR = WORKSPACE / "figures" / "report_phase3"
 
+REPORT_FILE = RESULTS_DIR / "phase3" / "threshold_spline_report.txt"
+# Plotted curves; the figures themselves are drawn by render_figures.py
+CURVE_FILE = RESULTS_DIR / "phase3" / "threshold_{name}_curve.csv"
 
-def zscore(series):
-    return (series - series.mean()) / series.std()
-
-
-def sigmoid(x):
-    return 1 / (1 + np.exp(-x))
-
-
-def fit_ordered_logit(y, X):
-    model = OrderedModel(y, X, distr="logit")
-    return model.fit(method="bfgs", disp=False)
+SPLINE_DF = 4
+DF_GRID = [3, 4, 5, 6, 7, 8]
 
 
 def spline_basis(x, df=4, degree=3, prefix="spl"):
-    basis = dmatrix(
-        f"0 + bs(x, df={df}, degree={degree}, include_intercept=False)",
-        {"x": x},
-        return_type="dataframe",
-    )
-    basis.columns = [f"{prefix}_{i}" for i in range(basis.shape[1])]
-    return basis
+    basis = BSplineBasis.from_data(x, df=df, degree=degree)
+    return basis, basis.frame(x, prefix=prefix, index=getattr(x, "index", None))
 
 
 def lr_test(llf_full, llf_base, df_full, df_base):
@@ -44,67 +34,85 @@ def lr_test(llf_full, llf_base, df_full, df_base):
     return lr_stat, df, p_val
 
 
-def plot_threshold(res, base_row, var_grid, spline_df, prefix, title, out_path):
-    params = res.params
-    cut_6_7 = params["6/7"]
+def threshold_curve(res, base_row, var_grid, basis, prefix):
+    # Evaluate on the grid with the knots fixed from the fitted data
+    data = {col: base_row[col].iloc[0] for col in base_row.columns}
+    data.update(zip(basis.column_names(prefix), basis.transform(var_grid).T))
+    return prob_at_least(res, data, 7)
+
+
+def linear_curve(res, base_row, var_grid, var):
+    data = {col: base_row[col].iloc[0] for col in base_row.columns}
+    data[var] = np.asarray(var_grid, dtype=float)
+    return prob_at_least(res, data, 7)
+
 
-    basis = spline_basis(var_grid, df=spline_df, degree=3, prefix=prefix)
-    X = pd.DataFrame(np.repeat(base_row.values, len(var_grid), axis=0), columns=base_row.columns)
-    X[basis.columns] = basis.values
+def load_curve(name):
+    return pd.read_csv(str(CURVE_FILE).format(name=name))
 
-    xb = X @ params[X.columns]
-    p_le_6 = sigmoid(cut_6_7 - xb)
-    p_ge_7 = 1 - p_le_6
 
+def draw_threshold(curve, name):
+    """curve：threshold_<name>_curve.csv（z, p_ge_7, df）"""
     import matplotlib.pyplot as plt
 
-    plt.figure(figsize=(7, 5))
-    plt.plot(var_grid, p_ge_7, color="#2c7fb8")
-    plt.xlabel("z-score")
-    plt.ylabel("P(Expectation ≥ Bachelor)")
-    plt.title(title)
-    plt.tight_layout()
-    plt.savefig(out_path, dpi=300)
+    fig, ax = plt.subplots(figsize=(7, 5))
+    ax.plot(curve["z"], curve["p_ge_7"], color="#2c7fb8")
+    ax.set_xlabel("z-score")
+    ax.set_ylabel("P(Expectation ≥ Bachelor)")
+    ax.set_title(f"{name.replace('_', ' ').title()} Spline Effect (df={int(curve['df'].iloc[0])})")
+    fig.tight_layout()
+    return fig
 
 
 def main():
-    df = pd.read_csv(DATA_FILE, low_memory=False)
-    cols = [
-        "expect_edu_raw",
-        "bonding_idx",
-        "linking_idx",
-        "ses_pca",
-        "hukou_type",
-        "cog_score",
-    ]
-    df = df[cols].dropna()
-    df = df[df["expect_edu_raw"].between(1, 9)]
-
-    for c in ["bonding_idx", "linking_idx", "ses_pca", "cog_score"]:
-        df[f"{c}_z"] = zscore(df[c])
+    df = load_model_frame(DATA_FILE)
 
     y = df["expect_edu_raw"].astype(int)
 
     results = []
-    FIG_DIR.mkdir(parents=True, exist_ok=True)
+    CURVE_FILE.parent.mkdir(parents=True, exist_ok=True)
 
+    sweeps = {}
     for var in ["bonding_idx_z", "linking_idx_z"]:
-        spline_df = 4
         base_cols = ["ses_pca_z", "hukou_type", "cog_score_z"]
         linear_cols = [var] + base_cols
 
         X_linear = df[linear_cols]
         res_linear = fit_ordered_logit(y, X_linear)
 
-        basis = spline_basis(df[var], df=spline_df, degree=3, prefix=var)
-        X_spline = pd.concat([basis, df[base_cols]], axis=1)
-        res_spline = fit_ordered_logit(y, X_spline)
-
-        lr_stat, df_lr, p_val = lr_test(res_spline.llf, res_linear.llf, len(res_spline.params), len(res_linear.params))
-
-        results.append((var, res_linear.llf, res_spline.llf, lr_stat, df_lr, p_val))
-
-        # Plot spline effect holding controls at mean
+        # df sweep: one basis per df with knots from the data, no formula parsing
+        fits = {}
+        for spline_df in DF_GRID:
+            basis, basis_df = spline_basis(df[var], df=spline_df, degree=3, prefix=var)
+            X_spline = pd.concat([basis_df, df[base_cols]], axis=1)
+            try:
+                fits[spline_df] = (basis, fit_ordered_logit(y, X_spline))
+            except (np.linalg.LinAlgError, RuntimeError) as exc:
+                # Too few distinct values for this many knots
+                print(f"[WARN] {var} spline df={spline_df} failed: {exc}")
+        # AIC choice includes the linear model (best_df = None); df=1 in the curve file
+        best_df = None
+        if fits:
+            best_spline = min(fits, key=lambda k: fits[k][1].aic)
+            if fits[best_spline][1].aic < res_linear.aic:
+                best_df = best_spline
+        sweeps[var] = (res_linear, fits, best_df)
+
+        # LR test at SPLINE_DF, or at the AIC-best estimable df when that fit failed
+        if not fits:
+            print(f"[WARN] {var}: no spline fit estimable; LR test skipped, linear curve saved")
+            results.append((var, None, res_linear.llf, None, None, None, None))
+        else:
+            test_df = SPLINE_DF if SPLINE_DF in fits else min(fits, key=lambda k: fits[k][1].aic)
+            if test_df != SPLINE_DF:
+                print(f"[WARN] {var}: spline df={SPLINE_DF} failed; LR test uses df={test_df}")
+            res_spline = fits[test_df][1]
+            lr_stat, df_lr, p_val = lr_test(
+                res_spline.llf, res_linear.llf, len(res_spline.params), len(res_linear.params)
+            )
+            results.append((var, test_df, res_linear.llf, res_spline.llf, lr_stat, df_lr, p_val))
+
+        # AIC-selected spline effect holding controls at mean
         base_row = pd.DataFrame(
             {
                 "ses_pca_z": [df["ses_pca_z"].mean()],
@@ -113,27 +121,50 @@ def main():
             }
         )
         grid = np.linspace(-2.5, 2.5, 80)
-        plot_threshold(
-            res_spline,
-            base_row,
-            grid,
-            spline_df,
-            var,
-            f"{var.replace('_z','').replace('_',' ').title()} Spline Effect",
-            FIG_DIR / f"threshold_{var.replace('_z','')}_spline.png",
-        )
-
+        if best_df is None:
+            curve = pd.DataFrame({"z": grid, "p_ge_7": linear_curve(res_linear, base_row, grid, var)})
+            curve["df"] = 1
+        else:
+            best_basis, best_res = fits[best_df]
+            curve = pd.DataFrame({"z": grid, "p_ge_7": threshold_curve(best_res, base_row, grid, best_basis, var)})
+            curve["df"] = best_df
+        curve.to_csv(str(CURVE_FILE).format(name=var.replace("_z", "")), index=False)
+
+    REPORT_FILE.parent.mkdir(parents=True, exist_ok=True)
     with REPORT_FILE.open("w", encoding="utf-8") as f:
         f.write("Threshold (Spline) Check for Ordered Logit\n")
         f.write("=========================================\n")
-        f.write("Spline df=4, degree=3. Compare linear vs spline via LR test.\n\n")
-        for var, llf_lin, llf_spl, lr_stat, df_lr, p_val in results:
+        f.write(f"Spline df={SPLINE_DF}, degree=3. Compare linear vs spline via LR test.\n\n")
+        for var, test_df, llf_lin, llf_spl, lr_stat, df_lr, p_val in results:
             f.write(f"{var}:\n")
             f.write(f"  LLF linear: {llf_lin:.3f}\n")
-            f.write(f"  LLF spline: {llf_spl:.3f}\n")
+            if test_df is None:
+                f.write("  LLF spline: not estimable for any df; LR test skipped\n\n")
+                continue
+            note = "" if test_df == SPLINE_DF else f" (df={SPLINE_DF} failed; AIC-best estimable df={test_df})"
+            f.write(f"  LLF spline: {llf_spl:.3f}{note}\n")
             f.write(f"  LR stat: {lr_stat:.3f}, df={df_lr}, approx p~{p_val:.4f}\n\n")
 
+        f.write("Spline df sweep (AIC selection incl. linear; * = selected, used for the figure)\n")
+        f.write("-----------------------------------------\n")
+        for var, (res_linear, fits, best_df) in sweeps.items():
+            mark = "*" if best_df is None else " "
+            f.write(f"{var}:\n {mark} linear: LLF={res_linear.llf:.3f}, AIC={res_linear.aic:.3f}\n")
+            for spline_df in DF_GRID:
+                if spline_df not in fits:
+                    f.write(f"   df={spline_df}: not estimable (too few distinct values for the knots)\n")
+                    continue
+                res = fits[spline_df][1]
+                lr_stat, df_lr, p_val = lr_test(res.llf, res_linear.llf, len(res.params), len(res_linear.params))
+                mark = "*" if spline_df == best_df else " "
+                f.write(
+                    f" {mark} df={spline_df}: LLF={res.llf:.3f}, AIC={res.aic:.3f}, "
+                    f"LR vs linear={lr_stat:.3f} (df={df_lr}, p~{p_val:.4f})\n"
+                )
+            f.write("\n")
+
     print(f"[DONE] Saved {REPORT_FILE}")
+    print("[INFO] Spline curves saved; draw the figures with render_figures.py")
 
 
 if __name__ == "__main__":
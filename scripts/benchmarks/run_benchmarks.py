@@ -0,0 +1,239 @@
+"""
+性能基准 (Benchmark Harness)
+
+在合成数据（synthetic_ceps.py）上按规模计时清洗与建模，结果追加到 benchmarks.jsonl，便于跨提交对比：
+- 任务：clean（clean_ceps_rescue.py）、pca（compute_ses_pca.py）、ordered_logit
+  （ordinal_analysis.py --no-multilevel：有序 logit、cov_cluster、Brant、MNLogit）、rf（随机森林置换重要性）
+- 每个任务在独立子进程中运行，CEPS_* 路径全部指向该规模的合成工作区；
+  阶段耗时与峰值 RSS 取自脚本自己写出的跟踪文件（见 profiling.py），另记录含解释器启动的总耗时
+- 默认冷启动：每次运行前删除 .dta 解析缓存与模型数据框缓存（--warm 保留）
+- 默认关闭 tracemalloc，避免其开销计入耗时（--memory 打开，得到各阶段的分配峰值）
+- 任务所需的上游输出（如 ordered_logit 需要 pca 的 ses_pca 旁路特征）缺失时先运行上游，不计时
+- 每条记录带 git 提交号（工作区 scripts/ 有未提交修改时标记 dirty）、规模、任务、重复序号
+
+用法：
+  python run_benchmarks.py                               # 10k / 100k / 1M，全部任务
+  python run_benchmarks.py --sizes 10000 100000 --tasks clean pca --repeats 3
+  python run_benchmarks.py --compare                     # 最近两个提交的中位耗时对比
+  python run_benchmarks.py --compare a1b2c3d e4f5a6b
+"""
+import argparse
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import time
+from datetime import datetime
+from pathlib import Path
+
+import pandas as pd
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+import ceps_config
+from synthetic_ceps import generate
+
+
+SCRIPTS_DIR = Path(__file__).resolve().parents[1]
+BENCH_ROOT = ceps_config.SCRATCH_DIR / "bench"
+RESULTS_FILE = ceps_config.RESULTS_DIR / "benchmarks" / "benchmarks.jsonl"
+
+SIZES = [10_000, 100_000, 1_000_000]
+SEED = 20240601
+
+# task -> script, arguments, trace file (relative to the workspace), upstream task
+TASKS = {
+    "clean": {
+        "script": "cleaning/clean_ceps_rescue.py",
+        "args": [],
+        "trace": "rescued_reports/clean_ceps_rescue_trace.json",
+        "needs": None,
+    },
+    "pca": {
+        "script": "analysis/compute_ses_pca.py",
+        "args": [],
+        "trace": "results/phase3/ses_pca_trace.json",
+        "needs": None,
+    },
+    "ordered_logit": {
+        "script": "analysis/ordinal_analysis.py",
+        "args": ["--no-multilevel"],
+        "trace": "results/phase3/ordinal_model_trace.json",
+        "needs": "pca",
+    },
+    "rf": {
+        "script": "analysis/ordinal_rf_pca.py",
+        "args": ["--folds", "2", "--repeats", "3"],
+        "trace": "results/phase3/ordinal_rf_trace.json",
+        "needs": "pca",
+    },
+}
+# Outputs whose presence satisfies a "needs" entry
+PROVIDES = {"pca": "rescued_data/features/ses_pca.parquet"}
+COLD_CACHES = [".cache", "rescued_data/.cache"]
+
+
+def workspace_env(workspace, memory):
+    """子进程环境：全部数据根目录显式指向合成工作区（环境变量优先于 ceps.toml）"""
+    env = {k: v for k, v in os.environ.items() if not k.startswith("CEPS_")}
+    env.update(
+        {
+            "CEPS_WORKSPACE": str(workspace),
+            "CEPS_RAW_DIR": str(workspace),
+            "CEPS_RESCUED_DIR": str(workspace / "rescued_data"),
+            "CEPS_RESULTS_DIR": str(workspace / "results"),
+            "CEPS_FIGURES_DIR": str(workspace / "figures"),
+            "CEPS_REPORTS_DIR": str(workspace / "rescued_reports"),
+            "CEPS_SCRATCH_DIR": str(workspace / "runs"),
+            "CEPS_TRACE_MEMORY": "1" if memory else "0",
+        }
+    )
+    return env
+
+
+def git_revision():
+    def git(*args):
+        out = subprocess.run(["git", *args], cwd=SCRIPTS_DIR, capture_output=True, text=True)
+        return out.stdout.strip() if out.returncode == 0 else None
+
+    commit = git("rev-parse", "--short", "HEAD")
+    dirty = bool(git("status", "--porcelain", "--", str(SCRIPTS_DIR)))
+    return commit, dirty
+
+
+def run_task(task, workspace, env, warm=False):
+    spec = TASKS[task]
+    if not warm:
+        for rel in COLD_CACHES:
+            shutil.rmtree(workspace / rel, ignore_errors=True)
+    trace_path = workspace / spec["trace"]
+    trace_path.unlink(missing_ok=True)
+    script = SCRIPTS_DIR / spec["script"]
+    log_path = workspace / "logs" / f"{task}.log"
+    log_path.parent.mkdir(parents=True, exist_ok=True)
+
+    start = time.perf_counter()
+    with open(log_path, "w", encoding="utf-8") as log:
+        proc = subprocess.run(
+            [sys.executable, script.name, *spec["args"]],
+            cwd=script.parent,
+            env=env,
+            stdout=log,
+            stderr=subprocess.STDOUT,
+        )
+    process_wall = time.perf_counter() - start
+
+    try:
+        with open(trace_path, encoding="utf-8") as f:
+            trace = json.load(f)
+    except (OSError, ValueError):
+        trace = {"status": f"no trace (exit code {proc.returncode})", "stages": []}
+    stages = {}
+    for record in trace["stages"]:
+        stages[record["name"]] = round(stages.get(record["name"], 0.0) + record["wall_s"], 4)
+    record = {
+        "status": trace["status"] if proc.returncode == 0 else f"exit {proc.returncode}: {trace['status']}",
+        "process_wall_s": round(process_wall, 4),
+        "wall_s": trace.get("wall_s"),
+        "cpu_s": trace.get("cpu_s"),
+        "max_rss_mb": trace.get("max_rss_mb"),
+        "stages": stages,
+        "log": str(log_path),
+    }
+    if trace.get("traced_peak_mb") is not None:
+        record["traced_peak_mb"] = trace["traced_peak_mb"]
+        record["stage_alloc_peak_mb"] = {r["name"]: r.get("alloc_peak_mb") for r in trace["stages"]}
+    return record
+
+
+def run(sizes, tasks, repeats=1, seed=SEED, root=BENCH_ROOT, results_file=RESULTS_FILE, warm=False, memory=False):
+    commit, dirty = git_revision()
+    if dirty:
+        print(f"[WARN] scripts/ has uncommitted changes; records are marked dirty (commit {commit})")
+    results_file.parent.mkdir(parents=True, exist_ok=True)
+    base = {
+        "commit": commit,
+        "dirty": dirty,
+        "host": platform.node(),
+        "python": platform.python_version(),
+        "cpu_count": os.cpu_count(),
+        "seed": seed,
+        "warm": warm,
+    }
+    for n in sizes:
+        workspace = generate(n, Path(root) / f"n{n}_s{seed}", seed)
+        env = workspace_env(workspace, memory)
+        for task in tasks:
+            needs = TASKS[task]["needs"]
+            if needs and not (workspace / PROVIDES[needs]).exists():
+                print(f"[INFO] n={n}: running {needs} first for {task} (not timed)")
+                run_task(needs, workspace, env, warm=True)
+            for rep in range(repeats):
+                result = run_task(task, workspace, env, warm)
+                entry = {
+                    **base,
+                    "timestamp": datetime.now().astimezone().isoformat(timespec="seconds"),
+                    "n_students": n,
+                    "task": task,
+                    "repeat": rep,
+                    **result,
+                }
+                with open(results_file, "a", encoding="utf-8") as f:
+                    f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+                mark = "[DONE]" if result["status"] == "ok" else "[WARN]"
+                print(
+                    f"{mark} n={n:>9,} {task:<14} #{rep}: {result['process_wall_s']:8.2f}s "
+                    f"(in script {result['wall_s'] or float('nan'):.2f}s, "
+                    f"peak RSS {result['max_rss_mb'] or float('nan'):.0f} MB) {result['status']}"
+                )
+    print(f"[DONE] Results appended to {results_file}")
+
+
+def load_results(results_file=RESULTS_FILE):
+    with open(results_file, encoding="utf-8") as f:
+        return pd.DataFrame([json.loads(line) for line in f if line.strip()])
+
+
+def compare(revisions=None, results_file=RESULTS_FILE):
+    """各提交在每个 (任务, 规模) 上成功运行的中位耗时；默认取最近出现的两个提交"""
+    df = load_results(results_file)
+    df = df[df["status"] == "ok"]
+    df["revision"] = df["commit"].fillna("?") + df["dirty"].map({True: "+dirty", False: ""})
+    if not revisions:
+        order = df.sort_values("timestamp")["revision"].drop_duplicates(keep="last")
+        revisions = list(order.iloc[-2:])
+    else:
+        known = df["revision"].unique()
+        revisions = [next((r for r in known if r.startswith(rev)), rev) for rev in revisions]
+    table = (
+        df[df["revision"].isin(revisions)]
+        .pivot_table(index=["task", "n_students"], columns="revision", values="process_wall_s", aggfunc="median")
+        .reindex(columns=revisions)
+    )
+    if len(revisions) == 2:
+        table["ratio"] = table[revisions[1]] / table[revisions[0]]
+    return table
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark cleaning and modeling on synthetic CEPS-shaped data.")
+    parser.add_argument("--sizes", type=int, nargs="+", default=SIZES, help="numbers of students")
+    parser.add_argument("--tasks", nargs="+", choices=list(TASKS), default=list(TASKS))
+    parser.add_argument("--repeats", type=int, default=1)
+    parser.add_argument("--seed", type=int, default=SEED)
+    parser.add_argument("--root", type=Path, default=BENCH_ROOT, help="where the synthetic workspaces live")
+    parser.add_argument("--results", type=Path, default=RESULTS_FILE)
+    parser.add_argument("--warm", action="store_true", help="keep parse / model-frame caches between runs")
+    parser.add_argument("--memory", action="store_true", help="enable tracemalloc (slower, per-stage allocations)")
+    parser.add_argument("--compare", nargs="*", metavar="COMMIT", help="print a comparison instead of running")
+    args = parser.parse_args()
+
+    if args.compare is not None:
+        print(compare(args.compare, args.results).to_string(float_format=lambda x: f"{x:.3f}"))
+        return
+    run(args.sizes, args.tasks, args.repeats, args.seed, args.root, args.results, args.warm, args.memory)
+
+
+if __name__ == "__main__":
+    main()
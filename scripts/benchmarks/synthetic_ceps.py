@@ -0,0 +1,292 @@
+"""
+CEPS 结构的合成数据 (Synthetic CEPS-shaped Data)
+
+为性能基准生成任意规模的数据，结构与真实数据一致，但不含任何真实记录：
+- 层级：学校 -> 班级（每校约 2 个班，班级人数 ~ N(44, 13) 截断到 [9, 85]）-> 学生；
+  ids / clsids / schids 与原始问卷的列名一致（学生表为 w2clsids / w2schids）
+- 四张原始表（.dta，目录布局同 RAW_DIR）：学生、家长（每个学生至多一行）、
+  任课教师（每班 3-6 名）、校领导（每校一行）；学生表另加若干无关的小整数列，模拟问卷宽度
+- 分析表 merged_rescued_all_with_pca_ses.csv 的列同真实文件（ses_pca 由 compute_ses_pca 另行生成旁路特征）
+- 潜变量：学校/班级随机效应 + SES、同伴、师生三个潜因子；w2b18 由有序 logit 生成，
+  1-9 的边际分布按真实数据的阈值校准，约 4% 为 10（"无所谓"），低认知得分者更多
+- 缺失：整份家长问卷不回答约 8%；w2a09 缺失约 20%，且低 SES 更高（MAR）；
+  w2cogscore 用 0 表示缺失（约 1%）；w2b18 缺失约 3%（清洗时被删除）
+- 抽样设计：每 4 所学校为一个县（PSU，ctyids），县随机分入 3 个抽样框（层，frame）；
+  学生权重 w2sweight 随县、校变化，农村学校约高 1.6 倍（使加权与不加权结果可区分）；
+  设计变量由独立的随机流生成，不改变其他列。分析表旁另写 features/survey_design.parquet，
+  与 clean_ceps_rescue 写出的旁路文件相同
+
+同一 (n_students, seed) 总是生成相同的数据。
+
+用法：
+  python synthetic_ceps.py 100000 --out /scratch/ceps_bench/n100000
+"""
+import argparse
+import json
+import shutil
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import pyreadstat
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+import ceps_config
+
+
+# Bump when the generated data changes so cached benchmark workspaces are rebuilt.
+GENERATOR_VERSION = 2
+
+RAW_FILES = {
+    "student": Path("学生数据") / "cepsw2studentCN.dta",
+    "parent": Path("家长数据") / "cepsw2parentCN.dta",
+    "teacher": Path("任课教师数据") / "cepsw2teacherCN.dta",
+    "principal": Path("校领导学校数据") / "cepsw2principalCN.dta",
+}
+DATA_NAME = ceps_config.DATA_FILE.name
+MARKER_NAME = "synthetic.json"
+
+# Share of w2b18 = 1..9 among codes 1-9 in the real sample
+EXPECT_SHARES = np.array([48, 230, 311, 276, 786, 1503, 3429, 1568, 1242], dtype=float)
+CLASS_SIZE = (44, 13, 9, 85)
+CLASSES_PER_SCHOOL = 2
+SCHOOLS_PER_COUNTY = 4
+N_FRAMES = 3
+FILLER_COLS = 40
+
+
+def _logistic(x):
+    return 1 / (1 + np.exp(-x))
+
+
+def _likert(rng, latent, levels, spread=1.0):
+    """潜变量 -> 1..levels 的等级（加噪声后按等距阈值切分）"""
+    noisy = latent + rng.normal(0, spread, len(latent))
+    cuts = np.linspace(-1.5, 1.5, levels - 1)
+    return (np.searchsorted(cuts, noisy) + 1).astype(float)
+
+
+def _with_missing(rng, values, rate):
+    values = np.asarray(values, dtype=float).copy()
+    rate = np.broadcast_to(rate, values.shape)
+    values[rng.random(len(values)) < rate] = np.nan
+    return values
+
+
+def _zscore(x):
+    return (x - np.nanmean(x)) / np.nanstd(x, ddof=1)
+
+
+def _class_sizes(rng, n_students):
+    mean, sd, low, high = CLASS_SIZE
+    sizes = []
+    total = 0
+    while total < n_students:
+        draw = np.clip(np.round(rng.normal(mean, sd, 256)), low, high).astype(int)
+        sizes.extend(draw)
+        total += draw.sum()
+    sizes = np.array(sizes)
+    n_classes = np.searchsorted(np.cumsum(sizes), n_students) + 1
+    sizes = sizes[:n_classes]
+    sizes[-1] -= sizes.sum() - n_students
+    return sizes
+
+
+def simulate(n_students, seed=20240601):
+    """返回 {"student", "parent", "teacher", "principal", "analysis", "design"} 六个 DataFrame"""
+    rng = np.random.default_rng(seed)
+    sizes = _class_sizes(rng, n_students)
+    n_classes = len(sizes)
+    n_schools = -(-n_classes // CLASSES_PER_SCHOOL)
+
+    # Schools: pla01 = 4 is rural (maps to agricultural hukou in the rescue cascade)
+    school_loc = rng.choice([1, 2, 3, 4], n_schools, p=[0.3, 0.25, 0.2, 0.25])
+    rural = (school_loc == 4).astype(float)
+    school_ses = rng.normal(0, 0.6, n_schools) - 0.5 * rural
+    class_school = np.arange(n_classes) // CLASSES_PER_SCHOOL
+    class_effect = rng.normal(0, 0.5, n_classes)
+    class_linking = rng.normal(0, 0.3, n_classes)
+
+    cls = np.repeat(np.arange(n_classes), sizes)
+    sch = class_school[cls]
+    ids = np.arange(1, n_students + 1)
+
+    agri = rng.random(n_students) < np.where(rural[sch] > 0, 0.85, 0.4)
+    ses = school_ses[sch] - 0.4 * agri + rng.normal(0, 1, n_students)
+    bonding = rng.normal(0, 1, n_students)
+    linking = class_linking[cls] + 0.2 * ses + rng.normal(0, 1, n_students)
+    cog = np.clip(np.round(23 + 1.8 * ses + rng.normal(0, 6, n_students)), 1, 35)
+    cog_z = (cog - 23) / 6.5
+
+    # Outcome: ordered logit on the latent factors, cut to the real 1-9 margins
+    eta = 0.35 * bonding + 0.25 * linking + 0.45 * ses - 0.2 * agri + 0.6 * cog_z + class_effect[cls]
+    latent = eta + rng.logistic(0, 1, n_students)
+    cuts = np.quantile(latent, np.cumsum(EXPECT_SHARES)[:-1] / EXPECT_SHARES.sum())
+    expect = (np.searchsorted(cuts, latent) + 1).astype(float)
+    indifferent = rng.random(n_students) < _logistic(-3.3 - 0.5 * cog_z)
+    expect[indifferent] = 10
+    expect = _with_missing(rng, expect, 0.03)
+
+    hukou_code = np.where(agri, 1, rng.choice([2, 3, 4], n_students, p=[0.6, 0.3, 0.1]))
+    self_econ = _likert(rng, 0.6 * ses, 5, 0.6)
+    talk_code = np.where(rng.random(n_students) < _logistic(-0.6 + 0.5 * linking), 1, rng.choice([2, 3], n_students))
+
+    student = pd.DataFrame(
+        {
+            "ids": ids.astype(float),
+            "w2clsids": (cls + 1).astype(float),
+            "w2schids": (sch + 1).astype(float),
+            "w2b18": expect,
+            "w2a09": _with_missing(rng, self_econ, np.clip(0.2 - 0.08 * ses, 0.02, 0.6)),
+            "w2a18": _with_missing(rng, hukou_code, 0.1),
+            "w2c09": _with_missing(rng, talk_code, 0.02),
+            "w2cogscore": np.where(rng.random(n_students) < 0.01, 0.0, cog),
+        }
+    )
+    for col in ["w2b0507", "w2b0508", "w2b0509"]:
+        student[col] = _with_missing(rng, _likert(rng, 0.8 * linking, 4), 0.01)
+    for col in ["w2b0605", "w2b0606", "w2b0607"]:
+        student[col] = _with_missing(rng, _likert(rng, 0.8 * bonding, 4), 0.01)
+    for i in range(FILLER_COLS):
+        student[f"w2x{i:03d}"] = _with_missing(rng, rng.integers(1, 6, n_students), 0.05).astype(np.float32)
+
+    # Sampling design from its own stream so the columns above stay as they were
+    design_rng = np.random.default_rng([seed, 1])
+    county = np.arange(n_schools) // SCHOOLS_PER_COUNTY
+    n_counties = county[-1] + 1
+    county_frame = design_rng.integers(1, N_FRAMES + 1, n_counties)
+    school_weight = (
+        design_rng.lognormal(3.0, 0.4, n_counties)[county]
+        * design_rng.lognormal(0, 0.3, n_schools)
+        * np.where(rural > 0, 1.6, 1.0)
+    )
+    student["frame"] = county_frame[county[sch]].astype(float)
+    student["ctyids"] = (county[sch] + 1).astype(float)
+    student["w2sweight"] = school_weight[sch] * design_rng.lognormal(0, 0.1, n_students)
+
+    responded = rng.random(n_students) >= 0.08
+    parent = pd.DataFrame(
+        {
+            "ids": ids[responded].astype(float),
+            "w2be23": _with_missing(rng, _likert(rng, 0.6 * ses[responded], 5, 0.6), 0.15),
+            "w2be25": _with_missing(rng, _likert(rng, 0.5 * ses[responded], 5, 0.7), 0.15),
+        }
+    )
+
+    n_teachers = rng.integers(3, 7, n_classes)
+    teacher_cls = np.repeat(np.arange(n_classes), n_teachers)
+    teacher = pd.DataFrame(
+        {
+            "w2clsids": (teacher_cls + 1).astype(float),
+            "hr01": _with_missing(rng, rng.choice([1, 2, 3], len(teacher_cls), p=[0.5, 0.3, 0.2]), 0.1),
+            "hr02": _with_missing(rng, np.round(rng.uniform(1, 5, len(teacher_cls)), 1), 0.1),
+        }
+    )
+
+    principal = pd.DataFrame(
+        {
+            "schids": np.arange(1, n_schools + 1, dtype=float),
+            "pla01": school_loc.astype(float),
+            "pla04": rng.choice([1, 2], n_schools, p=[0.9, 0.1]).astype(float),
+        }
+    )
+
+    # Analysis table: rescued columns plus the PCA inputs, rows with an outcome only
+    keep = ~np.isnan(expect)
+    praise = student[["w2b0507", "w2b0508", "w2b0509"]].mean(axis=1).to_numpy()
+    talk = np.where(np.isnan(student["w2c09"]), np.nan, (student["w2c09"] == 1).astype(float))
+    peer = student[["w2b0605", "w2b0606", "w2b0607"]].mean(axis=1).to_numpy()
+    linking_raw = _zscore(np.where(np.isnan(praise), np.nanmean(praise), praise))
+    linking_raw += _zscore(np.where(np.isnan(talk), np.nanmean(talk), talk))
+    has_computer = (rng.random(n_students) < _logistic(-1.8 - 0.3 * ses)).astype(float)
+    analysis = pd.DataFrame(
+        {
+            "ids": ids,
+            "clsids": cls + 1,
+            "expect_college": (expect >= 7).astype(float),
+            "expect_edu_raw": expect,
+            "linking_idx": _zscore(linking_raw),
+            "teacher_praise": praise,
+            "teacher_talk": talk,
+            "bonding_idx": _zscore(np.where(np.isnan(peer), np.nanmean(peer), peer)),
+            "hukou_type": agri.astype(float),
+            "cog_score": np.where(student["w2cogscore"] == 0, np.nan, cog),
+            "ses_self": np.where(np.isnan(student["w2a09"]), np.round(np.nanmean(self_econ)), student["w2a09"]),
+            "parent_edu_max": np.clip(np.round(4.5 + 1.5 * ses + rng.normal(0, 1.2, n_students)), 1, 9),
+            "family_econ": np.clip(np.round(2.8 + 0.45 * ses + rng.normal(0, 0.4, n_students)), 1, 5),
+            "home_books": np.clip(np.round(3 + 0.6 * ses + rng.normal(0, 0.9, n_students)), 1, 5),
+            "has_desk": (rng.random(n_students) < _logistic(1.3 + 0.6 * ses)).astype(float),
+            "has_computer": has_computer,
+        }
+    )[keep]
+    design = pd.DataFrame(
+        {
+            "ids": ids,
+            "sweight": student["w2sweight"],
+            "stratum": student["frame"],
+            "psu": student["ctyids"],
+        }
+    )[keep]
+
+    return {
+        "student": student,
+        "parent": parent,
+        "teacher": teacher,
+        "principal": principal,
+        "analysis": analysis,
+        "design": design,
+    }
+
+
+def read_marker(out_dir):
+    try:
+        with open(Path(out_dir) / MARKER_NAME, encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def generate(n_students, out_dir, seed=20240601):
+    """
+    写出一个完整的工作区：<out_dir>/<原始表>.dta 与 <out_dir>/rescued_data/<DATA_FILE>；
+    out_dir 中已有同一参数生成的数据时直接返回，由其他参数生成的合成工作区整个删除后重建
+    """
+    out_dir = Path(out_dir)
+    spec = {"version": GENERATOR_VERSION, "n_students": int(n_students), "seed": int(seed)}
+    if read_marker(out_dir) == spec:
+        return out_dir
+
+    if read_marker(out_dir) is not None:
+        # A workspace from other parameters: drop its derived outputs along with the data
+        shutil.rmtree(out_dir)
+    start = time.perf_counter()
+    tables = simulate(n_students, seed)
+    for name, rel in RAW_FILES.items():
+        path = out_dir / rel
+        path.parent.mkdir(parents=True, exist_ok=True)
+        pyreadstat.write_dta(tables[name], str(path))
+    data_path = out_dir / "rescued_data" / DATA_NAME
+    data_path.parent.mkdir(parents=True, exist_ok=True)
+    tables["analysis"].to_csv(data_path, index=False)
+    feature_dir = data_path.parent / "features"
+    feature_dir.mkdir(parents=True, exist_ok=True)
+    tables["design"].to_parquet(feature_dir / "survey_design.parquet", index=False)
+    # Written last: a workspace without a marker is incomplete and will be regenerated
+    with open(out_dir / MARKER_NAME, "w", encoding="utf-8") as f:
+        json.dump(spec, f)
+    print(
+        f"[INFO] Generated {n_students} students ({len(tables['analysis'])} analysis rows) "
+        f"in {time.perf_counter() - start:.1f}s -> {out_dir}"
+    )
+    return out_dir
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Generate a synthetic CEPS-shaped workspace.")
+    parser.add_argument("n_students", type=int)
+    parser.add_argument("--out", type=Path, required=True, help="workspace directory to write")
+    parser.add_argument("--seed", type=int, default=20240601)
+    args = parser.parse_args()
+    generate(args.n_students, args.out, args.seed)
@@ -0,0 +1,97 @@
+"""
+路径配置 (Data Roots)
+
+各脚本不再硬编码 WORKSPACE，而是从这里取目录。优先级：环境变量 > 项目配置文件 > 默认值
+- 默认值：workspace 为仓库根目录（rescued_data / results / figures 所在处），与平台和当前工作目录无关
+- 配置文件：环境变量 CEPS_CONFIG 指定的 TOML 文件，否则为仓库根目录下的 ceps.toml（可不存在，
+  不入库；ceps.toml.example 为模板）；其中的相对路径相对配置文件所在目录解析，
+  环境变量中的相对路径相对当前工作目录解析
+
+    [paths]
+    workspace = "/data/ceps"        # 其余目录的默认父目录
+    raw = "/data/ceps/raw"          # 原始 .dta（默认 = workspace）
+    rescued = "rescued_data"        # 清洗结果与旁路特征
+    results = "results"
+    figures = "figures"
+    reports = "rescued_reports"
+    scratch = "/scratch/ceps"       # 每次运行的临时根目录（默认 workspace/runs）
+
+- 环境变量：CEPS_WORKSPACE / CEPS_RAW_DIR / CEPS_RESCUED_DIR / CEPS_RESULTS_DIR /
+  CEPS_FIGURES_DIR / CEPS_REPORTS_DIR / CEPS_SCRATCH_DIR
+- 每次运行的隔离目录：设置 CEPS_RUN_ID 后，results / figures（以及流水线状态）默认改为
+  <scratch>/<run_id>/ 下的同名目录，同一节点上的多个实例（bootstrap 分片、敏感性分析）互不覆盖；
+  原始数据、清洗数据及其报告 (reports) 仍为共享目录。显式设置的目录不受 CEPS_RUN_ID 影响
+"""
+import os
+from pathlib import Path
+
+try:
+    import tomllib
+except ImportError:  # Python < 3.11：只用环境变量与默认值
+    tomllib = None
+
+
+REPO_DIR = Path(__file__).resolve().parents[1]
+DEFAULT_WORKSPACE = REPO_DIR
+
+
+def _load_file():
+    path = Path(os.environ.get("CEPS_CONFIG", REPO_DIR / "ceps.toml"))
+    if not path.is_file():
+        if "CEPS_CONFIG" in os.environ:
+            raise FileNotFoundError(f"CEPS_CONFIG points to a missing file: {path}")
+        return {}, path.parent
+    if tomllib is None:
+        print(f"[WARN] tomllib unavailable, ignoring {path}")
+        return {}, path.parent
+    with open(path, "rb") as f:
+        return tomllib.load(f).get("paths", {}), path.parent
+
+
+_FILE_PATHS, _FILE_DIR = _load_file()
+
+
+def _resolve(key, default):
+    env = os.environ.get("CEPS_WORKSPACE" if key == "workspace" else f"CEPS_{key.upper()}_DIR")
+    if env:
+        return Path(env).expanduser().resolve()
+    if key in _FILE_PATHS:
+        return (_FILE_DIR / Path(_FILE_PATHS[key]).expanduser()).resolve()
+    return default
+
+
+WORKSPACE = _resolve("workspace", DEFAULT_WORKSPACE)
+RAW_DIR = _resolve("raw", WORKSPACE)
+RESCUED_DIR = _resolve("rescued", WORKSPACE / "rescued_data")
+REPORTS_DIR = _resolve("reports", WORKSPACE / "rescued_reports")
+CACHE_DIR = WORKSPACE / ".cache"
+
+RUN_ID = os.environ.get("CEPS_RUN_ID") or None
+SCRATCH_DIR = _resolve("scratch", WORKSPACE / "runs")
+RUN_DIR = SCRATCH_DIR / RUN_ID if RUN_ID else None
+# Root for per-run outputs and state: the workspace itself unless CEPS_RUN_ID is set
+OUTPUT_ROOT = RUN_DIR or WORKSPACE
+
+RESULTS_DIR = _resolve("results", OUTPUT_ROOT / "results")
+FIGURES_DIR = _resolve("figures", OUTPUT_ROOT / "figures")
+
+DATA_FILE = RESCUED_DIR / "merged_rescued_all_with_pca_ses.csv"
+
+
+def describe():
+    return "\n".join(
+        f"{name}: {value}"
+        for name, value in [
+            ("workspace", WORKSPACE),
+            ("raw", RAW_DIR),
+            ("rescued", RESCUED_DIR),
+            ("results", RESULTS_DIR),
+            ("figures", FIGURES_DIR),
+            ("reports", REPORTS_DIR),
+            ("run_id", RUN_ID or "-"),
+        ]
+    )
+
+
+if __name__ == "__main__":
+    print(describe())
@@ -0,0 +1,283 @@
+"""
+多轮面板构建 (Multi-wave Panel Builder)
+
+clean_ceps_rescue.py 只处理第二轮（cepsw2*CN.dta）。这里把基线 (w1) 与追踪 (w2) 两轮接成学生面板：
+- 每轮通过列映射表 WAVES 把该轮的原始列名改成清洗逻辑使用的写法（STAGE_COLUMNS，即第二轮的列名），
+  之后完全复用 clean_ceps_rescue.rescue()：教师按班聚合、学生为中心合并、救援填补、变量构造
+- 各轮互不依赖，在进程池中并行处理，总耗时约等于最慢的一轮
+- 各轮结果按 ids 排序后做有序键合并：所有轮次 ids 的有序并集为面板行，各轮用 searchsorted 定位
+- 变化分数 d_<变量>_<轮次> = 本轮 - 上一轮；教育期望取 10（"无所谓"）的一轮不计算变化；
+  bonding_idx / linking_idx 在各轮内标准化，其变化是相对位置的变化
+- 输出：rescued_data/ceps_panel_wide.csv（每名学生一行）与 ceps_panel_long.csv（每名学生每轮一行），
+  报告 rescued_reports/panel_report.txt
+
+注意：基线轮的题号与第二轮并不一一对应，WAVES["w1"] 中的原始列名需对照基线问卷码本核对；
+映射到的列在文件中不存在时，该列按缺失处理并在报告中列出。
+
+用法：
+  python build_panel.py                  # 全部轮次，宽表与长表
+  python build_panel.py --format wide --jobs 1
+"""
+import argparse
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+from clean_ceps_rescue import DESIGN_SOURCES, OUTPUT_DIR, RAW_DIR, REPORT_DIR, STAGE_COLUMNS, load_data, rescue
+from joins import KEY_ALIASES
+from profiling import stage, tracing
+
+
+# Either spelling of a linkage key satisfies the other
+KEY_SPELLINGS = {**KEY_ALIASES, **{key: alias for alias, key in KEY_ALIASES.items()}}
+# Design variables are requested under every known spelling; one of them is enough
+DESIGN_SPELLINGS = {c: sources for sources in DESIGN_SOURCES.values() for c in sources}
+
+ROLES = {
+    "student": ("Student", "学生数据"),
+    "parent": ("Parent", "家长数据"),
+    "teacher": ("Teacher", "任课教师数据"),
+    "principal": ("School", "校领导学校数据"),
+}
+
+# wave -> file names by role, and {name used by the rescue logic: raw column in this wave}.
+# Columns not listed are read under their own name.
+WAVES = {
+    "w1": {
+        "files": {
+            "student": "cepsw1studentCN.dta",
+            "parent": "cepsw1parentCN.dta",
+            "teacher": "cepsw1teacherCN.dta",
+            "principal": "cepsw1principalCN.dta",
+        },
+        # Baseline items carry no wave prefix; check item numbers against the baseline codebook
+        "columns": {
+            "w2b18": "b18",
+            "w2a09": "a09",
+            "w2a18": "a18",
+            "w2c09": "c09",
+            "w2cogscore": "cogscore",
+            "w2b0507": "b0507",
+            "w2b0508": "b0508",
+            "w2b0509": "b0509",
+            "w2b0605": "b0605",
+            "w2b0606": "b0606",
+            "w2b0607": "b0607",
+            "w2be23": "be23",
+            "w2be25": "be25",
+        },
+    },
+    "w2": {
+        "files": {
+            "student": "cepsw2studentCN.dta",
+            "parent": "cepsw2parentCN.dta",
+            "teacher": "cepsw2teacherCN.dta",
+            "principal": "cepsw2principalCN.dta",
+        },
+        "columns": {},
+    },
+}
+
+PANEL_VARS = [
+    "clsids",
+    "schids",
+    "expect_edu_raw",
+    "expect_college",
+    "bonding_idx",
+    "linking_idx",
+    "teacher_praise",
+    "teacher_talk",
+    "ses_self",
+    "hukou_type",
+    "cog_score",
+]
+CHANGE_VARS = ["expect_edu_raw", "expect_college", "bonding_idx", "linking_idx"]
+# Expectation code 10 ("无所谓") has no position on the 1-9 scale
+EXPECT_VARS = ["expect_edu_raw", "expect_college"]
+INDIFFERENT_CODE = 10
+
+WIDE_FILE = OUTPUT_DIR / "ceps_panel_wide.csv"
+LONG_FILE = OUTPUT_DIR / "ceps_panel_long.csv"
+REPORT_FILE = REPORT_DIR / "panel_report.txt"
+TRACE_FILE = REPORT_DIR / "build_panel_trace.json"
+
+
+def wave_file(wave, role):
+    return RAW_DIR / ROLES[role][1] / WAVES[wave]["files"][role]
+
+
+def load_wave_tables(wave):
+    """读取一轮的四张表并改成 STAGE_COLUMNS 的列名；返回 ({角色: DataFrame 或 None}, 文件中缺少的列)"""
+    mapping = WAVES[wave]["columns"]
+    tables, absent = {}, []
+    for role, (label, _folder) in ROLES.items():
+        raw_cols = list(dict.fromkeys(mapping.get(c, c) for c in STAGE_COLUMNS[role]))
+        df = load_data(f"{label} {wave}", wave_file(wave, role), raw_cols)
+        if df is not None:
+            df = df.rename(columns={mapping.get(c, c): c for c in STAGE_COLUMNS[role]})
+            found = set(df.columns)
+            absent += [
+                f"{role}.{mapping.get(c, c)}"
+                for c in STAGE_COLUMNS[role]
+                if c not in found
+                and KEY_SPELLINGS.get(c) not in found
+                and not found.intersection(DESIGN_SPELLINGS.get(c, ()))
+            ]
+        tables[role] = df
+    return tables, absent
+
+
+def build_wave(wave):
+    """处理一轮：返回 {"wave", "frame"（按 ids 排序）, "absent", "seconds"}；学生表缺失时 frame 为 None"""
+    start = time.perf_counter()
+    tables, absent = load_wave_tables(wave)
+    if tables["student"] is None:
+        return {"wave": wave, "frame": None, "absent": absent, "seconds": time.perf_counter() - start}
+    result = rescue(tables["student"], tables["parent"], tables["teacher"], tables["principal"])
+    final = result["final"]
+    frame = final[["ids"] + [c for c in PANEL_VARS if c in final.columns]]
+    frame = frame.dropna(subset=["ids"]).sort_values("ids", kind="stable").reset_index(drop=True)
+    if frame["ids"].duplicated().any():
+        raise ValueError(f"{wave}: {int(frame['ids'].duplicated().sum())} duplicated ids in the student file")
+    return {"wave": wave, "frame": frame, "absent": absent, "seconds": time.perf_counter() - start}
+
+
+def align_waves(frames):
+    """
+    有序键合并：frames 为 {轮次: 按 ids 升序且唯一的 DataFrame}
+    返回 (所有轮次 ids 的有序并集, {轮次: 该轮各行在并集中的位置})
+    """
+    keys = np.unique(np.concatenate([f["ids"].to_numpy() for f in frames.values()]))
+    return keys, {wave: np.searchsorted(keys, f["ids"].to_numpy()) for wave, f in frames.items()}
+
+
+def wide_panel(frames):
+    keys, positions = align_waves(frames)
+    columns = {"ids": keys}
+    for wave, frame in frames.items():
+        pos = positions[wave]
+        present = np.zeros(len(keys), dtype=np.int8)
+        present[pos] = 1
+        columns[f"in_{wave}"] = present
+        for var in PANEL_VARS:
+            out = np.full(len(keys), np.nan)
+            if var in frame.columns:
+                out[pos] = frame[var].to_numpy(dtype=float, na_value=np.nan)
+            columns[f"{var}_{wave}"] = out
+
+    waves = list(frames)
+    for prev, cur in zip(waves, waves[1:]):
+        valid = np.ones(len(keys), dtype=bool)
+        for wave in (prev, cur):
+            valid &= columns[f"expect_edu_raw_{wave}"] != INDIFFERENT_CODE
+        for var in CHANGE_VARS:
+            change = columns[f"{var}_{cur}"] - columns[f"{var}_{prev}"]
+            if var in EXPECT_VARS:
+                change[~valid] = np.nan
+            columns[f"d_{var}_{cur}"] = change
+    return pd.DataFrame(columns)
+
+
+def long_panel(frames, wide):
+    """每名学生每轮一行；变化分数放在较晚一轮的行上（第一轮为缺失）"""
+    waves = list(frames)
+    parts = []
+    for i, (wave, frame) in enumerate(frames.items()):
+        part = frame.copy()
+        part.insert(1, "wave", wave)
+        for var in CHANGE_VARS:
+            if i == 0:
+                part[f"d_{var}"] = np.nan
+            else:
+                # Both are sorted by ids, so the wave's rows are a sorted subset of the wide rows
+                pos = np.searchsorted(wide["ids"].to_numpy(), frame["ids"].to_numpy())
+                part[f"d_{var}"] = wide[f"d_{var}_{wave}"].to_numpy()[pos]
+        parts.append(part)
+    order = {wave: i for i, wave in enumerate(waves)}
+    long = pd.concat(parts, ignore_index=True)
+    rank = long["wave"].map(order).to_numpy()
+    return long.iloc[np.lexsort((rank, long["ids"].to_numpy()))].reset_index(drop=True)
+
+
+def write_report(results, wide, elapsed):
+    waves = [r["wave"] for r in results if r["frame"] is not None]
+    with open(REPORT_FILE, "w", encoding="utf-8") as f:
+        f.write("CEPS Multi-wave Panel Report\n")
+        f.write("============================\n")
+        f.write(f"Waves: {', '.join(waves) or 'none'}\n")
+        f.write(f"Wall time: {elapsed:.1f}s (per wave: ")
+        f.write(", ".join(f"{r['wave']}={r['seconds']:.1f}s" for r in results) + ")\n\n")
+        for r in results:
+            f.write(f"{r['wave']}:\n")
+            if r["frame"] is None:
+                f.write(f"  skipped: student file not found ({wave_file(r['wave'], 'student')})\n")
+            else:
+                f.write(f"  Students with an expectation: {len(r['frame'])}\n")
+            if r["absent"]:
+                f.write(f"  Mapped columns missing from the files (treated as missing): {', '.join(r['absent'])}\n")
+            f.write("\n")
+        if wide is not None and len(waves) > 1:
+            in_all = np.logical_and.reduce([wide[f"in_{w}"].to_numpy() == 1 for w in waves])
+            f.write(f"Panel students: {len(wide)} (in all waves: {int(in_all.sum())})\n")
+            for w in waves:
+                only = (wide[f"in_{w}"] == 1) & ~pd.Series(in_all)
+                f.write(f"  {w} without a match in every other wave: {int(only.sum())}\n")
+            f.write("\nChange scores (students in both waves, expectation code 10 excluded):\n")
+            change_cols = [c for c in wide.columns if c.startswith("d_")]
+            f.write(wide[change_cols].describe().T.to_string(float_format=lambda x: f"{x:.3f}"))
+            f.write("\n")
+
+
+def main(waves=None, fmt="both", n_jobs=None):
+    waves = waves or list(WAVES)
+    start = time.perf_counter()
+    n_jobs = n_jobs or min(len(waves), os.cpu_count() or 1)
+    with stage("build_waves") as st:
+        if n_jobs == 1:
+            results = [build_wave(w) for w in waves]
+        else:
+            with ProcessPoolExecutor(n_jobs) as pool:
+                results = list(pool.map(build_wave, waves))
+        st.note(seconds_by_wave={r["wave"]: round(r["seconds"], 3) for r in results})
+
+    frames = {r["wave"]: r["frame"] for r in results if r["frame"] is not None}
+    for r in results:
+        if r["frame"] is None:
+            print(f"[WARN] {r['wave']}: student file not found, wave skipped")
+        if r["absent"]:
+            print(f"[WARN] {r['wave']}: mapped columns not in the files: {r['absent']}")
+    if not frames:
+        print("Critical Error: no wave has student data.")
+        return
+    if len(frames) == 1:
+        print(f"[WARN] Only {list(frames)} available; the panel has no change scores")
+
+    with stage("align_waves") as st:
+        wide = st.frame(wide_panel(frames))
+    OUTPUT_DIR.mkdir(parents=True, exist_ok=True)
+    if fmt in ("wide", "both"):
+        wide.to_csv(WIDE_FILE, index=False)
+        print(f"[DONE] Saved wide panel ({len(wide)} students) to {WIDE_FILE}")
+    if fmt in ("long", "both"):
+        with stage("long_panel") as st:
+            long = st.frame(long_panel(frames, wide))
+        long.to_csv(LONG_FILE, index=False)
+        print(f"[DONE] Saved long panel ({len(long)} rows) to {LONG_FILE}")
+    write_report(results, wide, time.perf_counter() - start)
+    print(f"[DONE] Saved panel report to {REPORT_FILE}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build a student panel from the CEPS baseline and follow-up waves.")
+    parser.add_argument("--waves", nargs="+", choices=list(WAVES), default=None)
+    parser.add_argument("--format", choices=["long", "wide", "both"], default="both")
+    parser.add_argument("--jobs", type=int, default=None, help="worker processes (default: one per wave)")
+    args = parser.parse_args()
+    with tracing("build_panel", TRACE_FILE):
+        main(args.waves, args.format, args.jobs)
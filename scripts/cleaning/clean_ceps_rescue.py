@@ -12,18 +12,29 @@ CEPS 数据清洗与整合脚本 (Rescued Version 2.1)
 - bonding_idx：同辈关系（横向）= 同伴/班级氛围条目合成
 - linking_idx：师生关系（纵向）= 教师表扬 + 与教师交流
 """
+import os
 import pandas as pd
 import numpy as np
+import sys
 from pathlib import Path
 import pyreadstat
 
-# Paths
-WORKSPACE = Path(r"c:\Users\13926\Desktop\CEPS数据汇总")
-RAW_DIR = WORKSPACE
-OUTPUT_DIR = WORKSPACE / "rescued_data"
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+import ceps_config
+from dta_cache import read_cached
+from group_stats import group_codes, mean_by_code, mode_by_code
+from imputation import imputed_by_statistic, run_cascades, write_imputation_flags
+from joins import join_sources
+from profiling import stage, traced, tracing
+
+# Paths (resolved by ceps_config: env vars > ceps.toml > defaults)
+RAW_DIR = ceps_config.RAW_DIR
+OUTPUT_DIR = ceps_config.RESCUED_DIR
 OUTPUT_DIR.mkdir(parents=True, exist_ok=True)
-REPORT_DIR = WORKSPACE / "rescued_reports"
+REPORT_DIR = ceps_config.REPORTS_DIR
 REPORT_DIR.mkdir(parents=True, exist_ok=True)
+CACHE_DIR = ceps_config.CACHE_DIR / "dta"
+TRACE_FILE = REPORT_DIR / "clean_ceps_rescue_trace.json"
 
 # File Paths
 FILES = {
@@ -34,15 +45,129 @@ FILES = {
 }
 
 
-def load_data(name, path):
+# Columns each stage actually uses; everything else in the questionnaires is
+# never read. Wave-prefixed id columns are listed alongside the plain ones
+# because the files are not consistent about which spelling they carry.
+STAGE_COLUMNS = {
+    "student": [
+        "ids", "clsids", "w2clsids", "schids", "w2schids",
+        "w2b18", "w2a09", "w2a18", "w2c09", "w2cogscore",
+        "w2b0507", "w2b0508", "w2b0509",
+        "w2b0605", "w2b0606", "w2b0607",
+        "w2sweight", "sweight", "frame", "w2frame", "ctyids", "w2ctyids",
+    ],
+    "parent": ["ids", "w2be23", "w2be25"],
+    "teacher": ["clsids", "w2clsids", "hr01", "hr02"],
+    "principal": ["schids", "w2schids", "pla01", "pla04"],
+}
+
+# Rescue cascades, applied in order: row-level sources, then class-level
+# statistic, then global statistic (see imputation.run_cascades).
+RESCUE_CASCADES = [
+    # SES (w2a09) -> parent w2be23/w2be25 -> Class Mean
+    {
+        "target": "ses_self",
+        "sources": [("w2a09", None), ("w2be23", None), ("w2be25", None)],
+        "group": ("clsids", "mean"),
+        "global": None,
+    },
+    # Hukou (w2a18) -> school_loc -> Class Mode -> Global Mode
+    {
+        "target": "hukou_type",
+        "sources": [
+            ("w2a18", {1: 1, 2: 0, 3: 0, 4: np.nan}),
+            ("school_loc", {1: 0, 2: 0, 3: 0, 4: 1}),
+        ],
+        "group": ("clsids", "mode"),
+        "global": "mode",
+    },
+]
+
+# Sampling design: student weight, stratum (sampling frame) and PSU (county).
+# First spelling present in the student file wins; written as a sidecar
+# feature for the survey-weighted estimates (analysis/survey.py).
+DESIGN_SOURCES = {
+    "sweight": ["w2sweight", "sweight"],
+    "stratum": ["frame", "w2frame"],
+    "psu": ["ctyids", "w2ctyids"],
+}
+
+# Rows per pyreadstat read; bounds the transient parse buffer per chunk.
+CHUNK_ROWS = 20000
+
+
+def load_data(name, path, columns=None, chunk_rows=CHUNK_ROWS):
+    """
+    按列、分块读取 .dta 文件
+    - columns：本阶段需要的列（文件中不存在的列自动忽略）；None 表示全部列
+    - 每次只解析 chunk_rows 行，峰值内存随所用列数而非问卷总宽度增长
+    - 解析结果缓存为 Feather（见 dta_cache），源文件不变时直接读缓存，跳过 .dta 解析
+    """
     if not path.exists():
         print(f"[WARN] File not found: {path}")
         return None
     print(f"[INFO] Loading {name} from {path}...")
-    df, _meta = pyreadstat.read_dta(str(path))
+    with stage(f"load_data:{name}") as st:
+        return st.frame(read_cached(
+            path, columns, lambda: _read_dta_chunked(name, path, columns, chunk_rows), CACHE_DIR
+        ))
+
+
+def _read_dta_chunked(name, path, columns, chunk_rows):
+    _empty, meta = pyreadstat.read_dta(str(path), metadataonly=True)
+    usecols = None
+    if columns is not None:
+        usecols = [c for c in columns if c in meta.column_names]
+        if not usecols:
+            print(f"[WARN] None of the requested columns found in {path.name}")
+            return None
+
+    n_rows = meta.number_rows
+    if n_rows is None or n_rows <= chunk_rows:
+        df, _meta = pyreadstat.read_dta(str(path), usecols=usecols)
+        return df
+
+    chunks = []
+    for offset in range(0, n_rows, chunk_rows):
+        chunk, _meta = pyreadstat.read_dta(
+            str(path), usecols=usecols, row_offset=offset, row_limit=chunk_rows
+        )
+        chunks.append(chunk)
+    df = pd.concat(chunks, ignore_index=True)
+    print(f"[INFO] {name}: {len(df)} rows x {df.shape[1]} cols in {len(chunks)} chunks")
     return df
 
 
+def survey_design(stu_df, ids):
+    """
+    按 ids 取出 final 行的设计变量（sweight / stratum / psu），学生表中没有权重列时返回 None
+    """
+    present = {}
+    for target, sources in DESIGN_SOURCES.items():
+        source = next((c for c in sources if c in stu_df.columns), None)
+        if source is not None:
+            present[target] = source
+    if "sweight" not in present:
+        return None
+    design = stu_df[["ids"] + list(present.values())].drop_duplicates("ids")
+    design = design.rename(columns={v: k for k, v in present.items()}).set_index("ids")
+    design = design.reindex(pd.Index(ids, name="ids")).reset_index()
+    design["sweight"] = pd.to_numeric(design["sweight"], errors="coerce")
+    return design
+
+
+def write_survey_design(out_dir, design, name="survey_design"):
+    """写入 <out_dir>/features/<name>.parquet（临时文件 + os.replace）"""
+    feature_dir = os.path.join(out_dir, "features")
+    os.makedirs(feature_dir, exist_ok=True)
+    path = os.path.join(feature_dir, f"{name}.parquet")
+    tmp = os.path.join(feature_dir, f".{name}.{os.getpid()}.parquet.tmp")
+    design.to_parquet(tmp, index=False)
+    os.replace(tmp, path)
+    return path
+
+
+@traced()
 def aggregate_teacher_data(df):
     """
     聚合教师数据到班级层级 (Class Level)
@@ -57,16 +182,16 @@ def aggregate_teacher_data(df):
         print("[ERR] clsids not found in teacher data.")
         return None
 
-    agg_dict = {}
+    if "hr01" not in df.columns and "hr02" not in df.columns:
+        return df.drop_duplicates(subset=["clsids"])  # Fallback
+
+    codes, classes = group_codes(df["clsids"])
+    grouped = pd.DataFrame({"clsids": classes})
     if "hr01" in df.columns:
-        agg_dict["hr01"] = lambda x: x.mode()[0] if not x.mode().empty else np.nan
+        grouped["hr01"] = mode_by_code(codes, len(classes), df["hr01"])
     if "hr02" in df.columns:
-        agg_dict["hr02"] = "mean"
-
-    if not agg_dict:
-        return df.drop_duplicates(subset=["clsids"])  # Fallback
+        grouped["hr02"] = mean_by_code(codes, len(classes), df["hr02"])
 
-    grouped = df.groupby("clsids").agg(agg_dict).reset_index()
     print(f"Aggregated Teacher Data: {len(df)} rows -> {len(grouped)} classes")
     return grouped
 
@@ -75,17 +200,12 @@ def zscore(s):
     return (s - s.mean()) / s.std()
 
 
-def main():
-    # 1. Load Raw Data
-    stu_df = load_data("Student", FILES["student"])
-    par_df = load_data("Parent", FILES["parent"])
-    tea_df = load_data("Teacher", FILES["teacher"])
-    sch_df = load_data("School", FILES["principal"])
-
-    if stu_df is None:
-        print("Critical Error: Student data missing.")
-        return
-
+def rescue(stu_df, par_df=None, tea_df=None, sch_df=None):
+    """
+    步骤 2-5：辅助表预处理、以学生为中心合并、救援填补与变量构造、按因变量筛选
+    输入列名为 STAGE_COLUMNS 中的写法（其他调查轮次先按列映射改名，见 build_panel.py）
+    返回 {"final": DataFrame, "flags": {列: 与 final 行对齐的布尔数组}, "join_report", "cascade_results"}
+    """
     # 2. Pre-process Auxiliary Data
     tea_clean = aggregate_teacher_data(tea_df) if tea_df is not None else None
 
@@ -105,28 +225,22 @@ def main():
 
     # 3. Merge Raw Data (Student Centric)
     print("--- Merging Raw Datasets ---")
-    merged = stu_df.copy()
-
-    if par_clean is not None:
-        merged = pd.merge(merged, par_clean, on="ids", how="left")
-
-    if tea_clean is not None:
-        if "w2clsids" in merged.columns:
-            if "clsids" in merged.columns:
-                merged = merged.drop(columns=["w2clsids"])
-            else:
-                merged = merged.rename(columns={"w2clsids": "clsids"})
-        if "clsids" in merged.columns and "clsids" in tea_clean.columns:
-            merged = pd.merge(merged, tea_clean, on="clsids", how="left")
-
-    if sch_clean is not None:
-        if "w2schids" in merged.columns:
-            if "schids" in merged.columns:
-                merged = merged.drop(columns=["w2schids"])
-            else:
-                merged = merged.rename(columns={"w2schids": "schids"})
-        if "schids" in merged.columns and "schids" in sch_clean.columns:
-            merged = pd.merge(merged, sch_clean, on="schids", how="left")
+    merged = stu_df
+    with stage("merge_sources") as st:
+        join_report = join_sources(
+            merged,
+            [
+                {"name": "parent", "frame": par_clean, "key": "ids"},
+                {"name": "teacher", "frame": tea_clean, "key": "clsids"},
+                {"name": "school", "frame": sch_clean, "key": "schids"},
+            ],
+        )
+        st.frame(merged)
+    for name, key, rate in join_report:
+        if rate is None:
+            print(f"[WARN] {name}: skipped (missing source or key '{key}')")
+        else:
+            print(f"{name} on {key}: match rate {rate:.1%}")
 
     print(f"Merged Raw Shape: {merged.shape}")
 
@@ -142,31 +256,12 @@ def main():
     else:
         merged["expect_college"] = np.nan
 
-    # 4.2 SES (w2a09) -> parent w2be23/w2be25 -> Class Mean
-    merged["ses_combined"] = merged.get("w2a09")
-    if "w2be23" in merged.columns:
-        merged["ses_combined"] = merged["ses_combined"].fillna(merged["w2be23"])
-    if "w2be25" in merged.columns:
-        merged["ses_combined"] = merged["ses_combined"].fillna(merged["w2be25"])
-    if "clsids" in merged.columns:
-        class_ses_mean = merged.groupby("clsids")["ses_combined"].transform("mean")
-        merged["ses_combined"] = merged["ses_combined"].fillna(class_ses_mean)
-    merged["ses_self"] = merged["ses_combined"]
-
-    # 4.3 Hukou (w2a18) -> school_loc -> Mode
-    hukou_map = {1: 1, 2: 0, 3: 0, 4: np.nan}
-    merged["hukou_type"] = merged["w2a18"].map(hukou_map)
-    if "school_loc" in merged.columns:
-        school_hukou_proxy = merged["school_loc"].map({1: 0, 2: 0, 3: 0, 4: 1})
-        merged["hukou_type"] = merged["hukou_type"].fillna(school_hukou_proxy)
-    if "clsids" in merged.columns:
-        def get_mode(x):
-            m = x.mode()
-            return m[0] if not m.empty else np.nan
-        class_hukou_mode = merged.groupby("clsids")["hukou_type"].transform(get_mode)
-        merged["hukou_type"] = merged["hukou_type"].fillna(class_hukou_mode)
-    global_mode = merged["hukou_type"].mode()[0]
-    merged["hukou_type"] = merged["hukou_type"].fillna(global_mode)
+    # 4.2 / 4.3 SES and Hukou cascades
+    with stage("rescue_cascades", merged):
+        cascade_results = run_cascades(merged, RESCUE_CASCADES)
+    for target, res in cascade_results.items():
+        merged[target] = res["values"]
+        print(f"{target}: " + ", ".join(f"{label}={n}" for label, n in res["counts"]))
 
     # 4.4 Linking SC (Teacher Praise + Talk) -> linking_idx
     praise_cols = ["w2b0507", "w2b0508", "w2b0509"]
@@ -181,6 +276,13 @@ def main():
     else:
         merged["teacher_talk"] = np.nan
 
+    flags = {
+        f"imp_{spec['target']}": imputed_by_statistic(spec, cascade_results[spec["target"]])
+        for spec in RESCUE_CASCADES
+    }
+    flags["imp_teacher_praise"] = merged["teacher_praise"].isna().to_numpy()
+    flags["imp_teacher_talk"] = merged["teacher_talk"].isna().to_numpy()
+
     tp = merged["teacher_praise"].fillna(merged["teacher_praise"].mean())
     tt = merged["teacher_talk"].fillna(merged["teacher_talk"].mean())
     linking_raw = zscore(tp) + zscore(tt)
@@ -191,6 +293,7 @@ def main():
     peer_cols = [c for c in peer_cols if c in merged.columns]
     if peer_cols:
         peer_mean = merged[peer_cols].mean(axis=1)
+        flags["imp_bonding_idx"] = peer_mean.isna().to_numpy()
         merged["bonding_idx"] = zscore(peer_mean.fillna(peer_mean.mean()))
     else:
         merged["bonding_idx"] = np.nan
@@ -230,10 +333,48 @@ def main():
     final_df = final_df.dropna(subset=["expect_college"])
     print(f"Rows dropped due to missing Target: {len_before - len(final_df)}")
 
+    kept = merged.index.get_indexer(final_df.index)
+    return {
+        "final": final_df,
+        "flags": {col: mask[kept] for col, mask in flags.items()},
+        "join_report": join_report,
+        "cascade_results": cascade_results,
+    }
+
+
+def main():
+    # 1. Load Raw Data
+    stu_df = load_data("Student", FILES["student"], STAGE_COLUMNS["student"])
+    par_df = load_data("Parent", FILES["parent"], STAGE_COLUMNS["parent"])
+    tea_df = load_data("Teacher", FILES["teacher"], STAGE_COLUMNS["teacher"])
+    sch_df = load_data("School", FILES["principal"], STAGE_COLUMNS["principal"])
+
+    if stu_df is None:
+        print("Critical Error: Student data missing.")
+        return
+
+    result = rescue(stu_df, par_df, tea_df, sch_df)
+    final_df = result["final"]
+    join_report = result["join_report"]
+    cascade_results = result["cascade_results"]
+
     out_path = OUTPUT_DIR / "merged_rescued_all.csv"
-    final_df.to_csv(out_path, index=False)
+    with stage("write_csv", final_df):
+        final_df.to_csv(out_path, index=False)
     print(f"[SUCCESS] Saved rescued data to {out_path}")
 
+    # Cells filled by a single statistic, for multiple imputation downstream
+    flags_path = write_imputation_flags(OUTPUT_DIR, final_df["ids"], result["flags"])
+    print(f"[INFO] Saved imputation flags to {flags_path}")
+
+    design = survey_design(stu_df, final_df["ids"].to_numpy())
+    if design is None:
+        print("[WARN] No sampling weight column in the student file; survey-weighted estimates unavailable")
+        (OUTPUT_DIR / "features" / "survey_design.parquet").unlink(missing_ok=True)
+    else:
+        design_path = write_survey_design(OUTPUT_DIR, design)
+        print(f"[INFO] Saved survey design ({', '.join(design.columns[1:])}) to {design_path}")
+
     missing_counts = final_df.isna().sum()
     with open(REPORT_DIR / "merged_data_quality_v2.txt", "w", encoding="utf-8") as f:
         f.write("Merged Data Quality Report (Rescue V2.1 - OFFICIAL)\n")
@@ -244,9 +385,20 @@ def main():
         f.write(" - Teacher Data: Aggregated by Class (Mode/Mean)\n")
         f.write(" - SES: Imputed with Parent Econ (w2be23/w2be25) & Class Mean\n")
         f.write(" - Hukou: Imputed with School Location\n\n")
+        f.write("Join Match Rates (student rows):\n")
+        for name, key, rate in join_report:
+            f.write(f"  {name} on {key}: " + ("skipped" if rate is None else f"{rate:.1%}") + "\n")
+        f.write("\n")
+        f.write("Cascade Fills (rows filled at each level, before target filter):\n")
+        for target, res in cascade_results.items():
+            f.write(f"  {target}:\n")
+            for label, n in res["counts"]:
+                f.write(f"    {label}: {n}\n")
+        f.write("\n")
         f.write("Missing Values After Rescue:\n")
         f.write(missing_counts.to_string())
 
 
 if __name__ == "__main__":
-    main()
+    with tracing("clean_ceps_rescue", TRACE_FILE):
+        main()
@@ -0,0 +1,104 @@
+"""
+.dta 解析结果的二进制缓存 (Arrow IPC / Feather)
+
+- 首次读取：把按列裁剪后的 DataFrame 写成未压缩的 Feather 文件，旁边放一个
+  JSON 清单，记录源文件的 size / mtime / sha256 以及列集合
+- 之后读取：清单与源文件一致时直接读 Feather 文件，跳过 pyreadstat；Feather 本身以 memory-map
+  打开，但 to_pandas() 会把整张表复制成普通的 DataFrame（含 NaN 的列本就无法零拷贝，
+  且清洗步骤会原地改写这些数据框），所以节省的是解析时间，不是内存
+- 源文件 size 或 mtime 变化时重新计算哈希；内容确实变了才重新解析
+"""
+import hashlib
+import json
+import os
+from pathlib import Path
+
+try:
+    import pyarrow.feather as feather
+except ImportError:  # pyarrow 不可用时退化为直接解析
+    feather = None
+
+
+HASH_BLOCK = 1 << 20
+
+
+def file_digest(path):
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(HASH_BLOCK), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+def _cache_paths(cache_dir, path, columns):
+    col_key = "*" if columns is None else "\x1f".join(columns)
+    col_digest = hashlib.sha256(col_key.encode("utf-8")).hexdigest()[:12]
+    stem = f"{path.stem}-{col_digest}"
+    return cache_dir / f"{stem}.arrow", cache_dir / f"{stem}.json"
+
+
+def _read_manifest(manifest_path):
+    try:
+        with open(manifest_path, encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _write_manifest(manifest_path, manifest):
+    tmp = manifest_path.with_suffix(".json.tmp")
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2)
+    os.replace(tmp, manifest_path)
+
+
+def read_cached(path, columns, loader, cache_dir):
+    """
+    返回 path 的（列裁剪后）数据；命中缓存时从 Feather 文件读出（复制为 DataFrame），
+    未命中时调用 loader() 并写入缓存。columns 参与缓存键，不同阶段的列集合互不覆盖。
+    """
+    if feather is None:
+        return loader()
+
+    path = Path(path)
+    cache_dir = Path(cache_dir)
+    data_path, manifest_path = _cache_paths(cache_dir, path, columns)
+    stat = path.stat()
+    manifest = _read_manifest(manifest_path)
+
+    if manifest is not None and data_path.exists():
+        same_stat = (
+            manifest.get("size") == stat.st_size
+            and manifest.get("mtime_ns") == stat.st_mtime_ns
+        )
+        if not same_stat and manifest.get("size") == stat.st_size:
+            # 被 touch 过但内容可能未变：用哈希确认
+            if manifest.get("sha256") == file_digest(path):
+                manifest["mtime_ns"] = stat.st_mtime_ns
+                _write_manifest(manifest_path, manifest)
+                same_stat = True
+        if same_stat:
+            print(f"[INFO] Cache hit: {data_path.name}")
+            table = feather.read_table(str(data_path), memory_map=True)
+            return table.to_pandas()
+
+    df = loader()
+    if df is None:
+        return None
+
+    cache_dir.mkdir(parents=True, exist_ok=True)
+    tmp = data_path.with_suffix(".arrow.tmp")
+    feather.write_feather(df, str(tmp), compression="uncompressed")
+    os.replace(tmp, data_path)
+    _write_manifest(
+        manifest_path,
+        {
+            "source": str(path),
+            "size": stat.st_size,
+            "mtime_ns": stat.st_mtime_ns,
+            "sha256": file_digest(path),
+            "columns": list(df.columns),
+        },
+    )
+    print(f"[INFO] Cached {path.name} -> {data_path.name}")
+    return df
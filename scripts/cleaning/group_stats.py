@@ -0,0 +1,68 @@
+"""
+分组统计原语（无逐组 Python 回调）
+
+- 分组键先 factorize 成整数编码（缺失键编码为 -1，与 groupby 默认丢弃 NaN 键一致）
+- 均值：np.bincount 求和/计数
+- 众数：对 (组, 取值) 编码对计数后逐组取 argmax；并列时取最小值，
+  与 pandas 的 Series.mode()[0] 一致；全缺失的组返回 NaN
+"""
+import numpy as np
+import pandas as pd
+
+
+# Above this many (group, value) cells the dense count table is replaced by a
+# sort over the observed pairs only.
+DENSE_PAIR_LIMIT = 1 << 24
+
+
+def group_codes(keys):
+    """返回 (codes, uniques)；uniques 已排序，codes 中 -1 表示缺失键"""
+    codes, uniques = pd.factorize(np.asarray(keys), sort=True)
+    return codes.astype(np.int64), np.asarray(uniques)
+
+
+def mean_by_code(codes, n_groups, values):
+    values = np.asarray(values, dtype=float)
+    ok = (codes >= 0) & ~np.isnan(values)
+    sums = np.bincount(codes[ok], weights=values[ok], minlength=n_groups)
+    counts = np.bincount(codes[ok], minlength=n_groups)
+    out = np.full(n_groups, np.nan)
+    np.divide(sums, counts, out=out, where=counts > 0)
+    return out
+
+
+def mode_by_code(codes, n_groups, values):
+    vcodes, vuniq = pd.factorize(np.asarray(values), sort=True)
+    vuniq = np.asarray(vuniq, dtype=float)
+    out = np.full(n_groups, np.nan)
+    ok = (codes >= 0) & (vcodes >= 0)
+    n_vals = len(vuniq)
+    if n_vals == 0 or not ok.any():
+        return out
+
+    pair = codes[ok] * n_vals + vcodes[ok]
+    if n_groups * n_vals <= DENSE_PAIR_LIMIT:
+        counts = np.bincount(pair, minlength=n_groups * n_vals).reshape(n_groups, n_vals)
+        has = counts.any(axis=1)
+        # argmax returns the first maximum, i.e. the smallest tied value
+        best = counts.argmax(axis=1)
+        out[has] = vuniq[best[has]]
+        return out
+
+    pairs, counts = np.unique(pair, return_counts=True)
+    grp = pairs // n_vals
+    val = pairs % n_vals
+    order = np.lexsort((val, -counts, grp))
+    grp, val = grp[order], val[order]
+    first = np.r_[True, grp[1:] != grp[:-1]]
+    out[grp[first]] = vuniq[val[first]]
+    return out
+
+
+def broadcast(codes, per_group):
+    """把逐组结果按 codes 展开回逐行（缺失键为 NaN）"""
+    out = np.full(len(codes), np.nan)
+    ok = codes >= 0
+    out[ok] = per_group[codes[ok]]
+    return out
+
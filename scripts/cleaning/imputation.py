@@ -0,0 +1,119 @@
+"""
+声明式填补级联 (Imputation Cascade)
+
+每条规则 (spec) 是一个 dict：
+- target：输出列名
+- sources：[(列名, 映射或 None), ...]，按顺序逐行填补（学生自报 -> 家长 -> 学校代理）
+- group：(分组键, "mean" | "mode") 或 None，组内统计填补
+- global："mean" | "mode" | None，全样本统计兜底
+
+执行顺序保证与逐步手写的 fillna 链等价：
+  1. 所有规则的行级来源
+  2. 每个分组键只 factorize 一次，在此基础上计算所有规则的组统计并填补
+  3. 全局统计填补
+每条规则只依赖自身的列，因此跨规则合并同一阶段不会改变结果。
+
+write_imputation_flags() 把"哪些格子是单一填补值"写成按 ids 连接的旁路 parquet，
+供分析阶段的多重插补 (scripts/analysis/multiple_imputation.py) 重新插补这些格子。
+"""
+import os
+
+import numpy as np
+import pandas as pd
+
+from group_stats import broadcast, group_codes, mean_by_code, mode_by_code
+
+
+GROUP_STATS = {"mean": mean_by_code, "mode": mode_by_code}
+
+
+def _source_values(df, col, mapping):
+    if col not in df.columns:
+        return None
+    src = df[col]
+    if mapping is not None:
+        src = src.map(mapping)
+    return src.to_numpy(dtype=float, na_value=np.nan)
+
+
+def _fill(values, level, candidate, level_id):
+    mask = np.isnan(values) & ~np.isnan(candidate)
+    values[mask] = candidate[mask]
+    level[mask] = level_id
+    return int(mask.sum())
+
+
+def run_cascades(df, cascades):
+    """
+    对 df 执行全部级联规则（不修改 df）
+
+    返回 {target: {"values": ndarray, "level": ndarray, "counts": [(标签, 填补数), ...]}}
+    level 记录每行由第几级填补（-1 表示仍缺失），counts 最后一项为剩余缺失数
+    """
+    n = len(df)
+    results = {}
+
+    # 1. Row-level sources
+    for spec in cascades:
+        values = np.full(n, np.nan)
+        level = np.full(n, -1, dtype=np.int8)
+        counts = []
+        for col, mapping in spec["sources"]:
+            candidate = _source_values(df, col, mapping)
+            filled = 0 if candidate is None else _fill(values, level, candidate, len(counts))
+            counts.append((col, filled))
+        results[spec["target"]] = {"values": values, "level": level, "counts": counts}
+
+    # 2. Group-level statistics, one factorization per key
+    by_key = {}
+    for spec in cascades:
+        if spec.get("group"):
+            by_key.setdefault(spec["group"][0], []).append(spec)
+    for key, specs in by_key.items():
+        if key not in df.columns:
+            for spec in specs:
+                results[spec["target"]]["counts"].append((f"{key} {spec['group'][1]}", 0))
+            continue
+        codes, uniques = group_codes(df[key])
+        for spec in specs:
+            res = results[spec["target"]]
+            stat = spec["group"][1]
+            per_group = GROUP_STATS[stat](codes, len(uniques), res["values"])
+            filled = _fill(res["values"], res["level"], broadcast(codes, per_group), len(res["counts"]))
+            res["counts"].append((f"{key} {stat}", filled))
+
+    # 3. Global fallback
+    for spec in cascades:
+        stat = spec.get("global")
+        if not stat:
+            continue
+        res = results[spec["target"]]
+        everyone = np.zeros(n, dtype=np.int64)
+        value = GROUP_STATS[stat](everyone, 1, res["values"])
+        filled = _fill(res["values"], res["level"], np.full(n, value[0]), len(res["counts"]))
+        res["counts"].append((f"global {stat}", filled))
+
+    for res in results.values():
+        res["counts"].append(("still missing", int(np.isnan(res["values"]).sum())))
+    return results
+
+
+def imputed_by_statistic(spec, result):
+    """由组统计或全局统计（而非行级来源）填补的行"""
+    return result["level"] >= len(spec["sources"])
+
+
+def write_imputation_flags(out_dir, ids, flags, name="imputation_flags"):
+    """
+    flags：{列名: 布尔数组}；写入 <out_dir>/features/<name>.parquet（临时文件 + os.replace）
+    """
+    frame = pd.DataFrame({"ids": np.asarray(ids)})
+    for col, mask in flags.items():
+        frame[col] = np.asarray(mask, dtype=bool)
+    feature_dir = os.path.join(out_dir, "features")
+    os.makedirs(feature_dir, exist_ok=True)
+    path = os.path.join(feature_dir, f"{name}.parquet")
+    tmp = os.path.join(feature_dir, f".{name}.{os.getpid()}.parquet.tmp")
+    frame.to_parquet(tmp, index=False)
+    os.replace(tmp, path)
+    return path
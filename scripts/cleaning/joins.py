@@ -0,0 +1,92 @@
+"""
+学生为中心的多对一连接 (Student-centric many-to-one joins)
+
+- 键列（ids / clsids / schids）只在学生表上 factorize 一次，得到紧凑整数编码
+- 辅助表（家长、班级、学校）按键校验唯一性后，映射成 "编码 -> 辅助表行号" 的查找数组
+- 通过位置 take 把辅助列直接写入学生表，不复制、不重排学生表
+- 每次连接报告匹配率
+"""
+import numpy as np
+import pandas as pd
+
+from group_stats import group_codes
+
+
+# Wave-prefixed spellings of the linkage keys
+KEY_ALIASES = {"w2clsids": "clsids", "w2schids": "schids"}
+
+
+def normalize_key_columns(df):
+    """w2clsids -> clsids, w2schids -> schids（已有非前缀列时丢弃前缀列），原地修改"""
+    for alias, key in KEY_ALIASES.items():
+        if alias not in df.columns:
+            continue
+        if key in df.columns:
+            df.drop(columns=[alias], inplace=True)
+        else:
+            df.rename(columns={alias: key}, inplace=True)
+    return df
+
+
+def _lookup(key_codes, aux_keys, name, key):
+    """返回长度为 n_codes 的数组：每个编码对应的辅助表行号，-1 表示无匹配"""
+    codes, uniques = key_codes
+    aux_keys = pd.Series(aux_keys)
+    valid = aux_keys.notna().to_numpy()
+    if aux_keys[valid].duplicated().any():
+        n_dup = int(aux_keys[valid].duplicated().sum())
+        raise ValueError(f"{name}: {n_dup} duplicated '{key}' values; expected one row per key")
+    aux_code = pd.Index(uniques).get_indexer(aux_keys)
+    aux_code[~valid] = -1
+    lookup = np.full(len(uniques), -1, dtype=np.int64)
+    hit = aux_code >= 0
+    lookup[aux_code[hit]] = np.flatnonzero(hit)
+    return lookup
+
+
+def attach_many_to_one(base, key_codes, aux, key, name):
+    """把 aux 的非键列按 key 附加到 base（原地），返回匹配率"""
+    codes, _uniques = key_codes
+    lookup = _lookup(key_codes, aux[key].to_numpy(), name, key)
+    take = np.full(len(codes), -1, dtype=np.int64)
+    has_key = codes >= 0
+    take[has_key] = lookup[codes[has_key]]
+    matched = take >= 0
+
+    for col in aux.columns:
+        if col == key:
+            continue
+        if col in base.columns:
+            raise ValueError(f"{name}: column '{col}' already present in base frame")
+        values = aux[col].to_numpy()
+        if values.dtype.kind in "biuf":
+            out = np.full(len(base), np.nan)
+        else:
+            out = np.full(len(base), None, dtype=object)
+        out[matched] = values[take[matched]]
+        base[col] = out
+
+    return float(matched.mean()) if len(base) else 0.0
+
+
+def join_sources(base, sources):
+    """
+    依次把 sources 中的辅助表连接到 base（原地）
+    sources：[{"name": ..., "frame": DataFrame 或 None, "key": ...}, ...]
+    返回 [(name, key, 匹配率或 None), ...]；None 表示该来源缺失或缺少键列而跳过
+    """
+    normalize_key_columns(base)
+    key_codes = {}
+    report = []
+    for src in sources:
+        name, aux, key = src["name"], src["frame"], src["key"]
+        if aux is not None:
+            normalize_key_columns(aux)
+        if aux is None or key not in base.columns or key not in aux.columns:
+            report.append((name, key, None))
+            continue
+        if key not in key_codes:
+            key_codes[key] = group_codes(base[key])
+        rate = attach_many_to_one(base, key_codes[key], aux, key, name)
+        report.append((name, key, rate))
+    return report
@@ -0,0 +1,445 @@
+"""
+增量流水线 (Pipeline DAG Runner)
+
+每个步骤声明脚本、参数、输入文件与输出文件（"{根目录}/相对路径"，根目录取自 ceps_config，可用通配符），
+依赖关系由“某步骤的输出匹配另一步骤的输入”自动推出：
+- 步骤键 = sha256(脚本及其同目录本地模块的源码 + 参数 + 各输入文件内容哈希)；
+  上游输出内容未变时下游键也不变（即使上游重跑过）
+- 键与上次成功运行一致且输出文件内容未被改动 -> 跳过；
+  键在历史中出现过（如撤销了一次修改）-> 从内容寻址对象库恢复输出，不重跑
+- 文件哈希按 (size, mtime) 缓存，未改动的大文件不会重复读取
+- 互不依赖的分支（如随机森林重要性与样条检验）在线程池中并发启动子进程
+- 输入缺失（如本机没有原始 .dta）时沿用磁盘上已有的输出；"optional" 中的输出（旁路特征等）
+  可以不存在，其余非通配输出必须都在。"optional" 中的输入缺失时不报错（存在与否都计入步骤键）
+状态、对象库与日志位于 <OUTPUT_ROOT>/.cache/pipeline/（设置 CEPS_RUN_ID 时每次运行各自一份）
+
+用法：
+  python pipeline.py                     # 全部步骤
+  python pipeline.py render_figures      # 指定目标及其上游
+  python pipeline.py --dry-run           # 只列出会执行/恢复/跳过的步骤
+  python pipeline.py --force ordinal_analysis
+"""
+import argparse
+import ast
+import hashlib
+import json
+import os
+import shutil
+import subprocess
+import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from fnmatch import fnmatch
+from pathlib import Path
+
+import ceps_config
+
+
+SCRIPTS_DIR = Path(__file__).resolve().parent
+STATE_DIR = ceps_config.OUTPUT_ROOT / ".cache" / "pipeline"
+ROOTS = {
+    "raw": ceps_config.RAW_DIR,
+    "rescued": ceps_config.RESCUED_DIR,
+    "results": ceps_config.RESULTS_DIR,
+    "figures": ceps_config.FIGURES_DIR,
+    "reports": ceps_config.REPORTS_DIR,
+}
+
+DATA = "{rescued}/" + ceps_config.DATA_FILE.name
+# DATA is the cleaned table plus the PCA inputs, assembled outside this pipeline from
+# the clean step's CSV; declaring the CSV makes a re-run of clean re-run the PCA step
+CLEAN_CSV = "{rescued}/merged_rescued_all.csv"
+SURVEY_DESIGN = "{rescued}/features/survey_design.parquet"
+# read_dataset joins every sidecar feature, so analysis steps depend on all of them
+FEATURES = "{rescued}/features/*.parquet"
+PHASE3 = "{results}/phase3"
+FIGURES = "{figures}/report_phase3"
+
+HASH_BLOCK = 1 << 20
+
+STEPS = [
+    {
+        "name": "clean",
+        "script": "cleaning/clean_ceps_rescue.py",
+        "inputs": [
+            "{raw}/学生数据/cepsw2studentCN.dta",
+            "{raw}/家长数据/cepsw2parentCN.dta",
+            "{raw}/任课教师数据/cepsw2teacherCN.dta",
+            "{raw}/校领导学校数据/cepsw2principalCN.dta",
+        ],
+        "outputs": [
+            CLEAN_CSV,
+            "{rescued}/features/imputation_flags.parquet",
+            SURVEY_DESIGN,
+            "{reports}/merged_data_quality_v2.txt",
+        ],
+        # Sidecars: older outputs on disk may lack them, and the design sidecar
+        # is only written when the student file carries sampling weights
+        "optional": ["{rescued}/features/imputation_flags.parquet", SURVEY_DESIGN],
+    },
+    {
+        "name": "compute_ses_pca",
+        "script": "analysis/compute_ses_pca.py",
+        # Adds the survey-weighted ses_pca_w feature whenever the design sidecar exists
+        "inputs": [DATA, CLEAN_CSV, SURVEY_DESIGN],
+        "outputs": [
+            "{rescued}/features/ses_pca.parquet",
+            f"{PHASE3}/ses_pca_report.txt",
+            f"{PHASE3}/ses_pca_model.npz",
+            "{rescued}/features/ses_pca_w.parquet",
+            f"{PHASE3}/ses_pca_w_model.npz",
+        ],
+        "optional": [SURVEY_DESIGN, "{rescued}/features/ses_pca_w.parquet", f"{PHASE3}/ses_pca_w_model.npz"],
+    },
+    {
+        "name": "ordinal_analysis",
+        "script": "analysis/ordinal_analysis.py",
+        "inputs": [DATA, FEATURES],
+        "outputs": [f"{PHASE3}/ordinal_model_report.txt"],
+    },
+    {
+        "name": "interaction_verification",
+        "script": "analysis/interaction_verification.py",
+        "inputs": [DATA, FEATURES],
+        "outputs": [f"{PHASE3}/interaction_verification_report.txt"],
+    },
+    {
+        "name": "threshold_spline_check",
+        "script": "analysis/threshold_spline_check.py",
+        "inputs": [DATA, FEATURES],
+        "outputs": [f"{PHASE3}/threshold_spline_report.txt", f"{PHASE3}/threshold_*_curve.csv"],
+    },
+    {
+        "name": "spec_grid",
+        "script": "analysis/spec_grid.py",
+        "inputs": [DATA, FEATURES],
+        "outputs": [f"{PHASE3}/spec_grid_report.txt", f"{PHASE3}/spec_grid_table.csv"],
+    },
+    {
+        "name": "multiple_imputation",
+        "script": "analysis/multiple_imputation.py",
+        "inputs": [DATA, FEATURES],
+        "outputs": [f"{PHASE3}/multiple_imputation_report.txt"],
+    },
+    {
+        "name": "ordinal_rf_pca",
+        "script": "analysis/ordinal_rf_pca.py",
+        "inputs": [DATA, FEATURES],
+        "outputs": [f"{PHASE3}/ordinal_rf_feature_importance.csv"],
+    },
+    {
+        # All report figures; render_figures.py also skips figures whose own inputs are unchanged
+        "name": "render_figures",
+        "script": "analysis/render_figures.py",
+        "inputs": [
+            DATA,
+            FEATURES,
+            f"{PHASE3}/ses_pca_model.npz",
+            f"{PHASE3}/ordinal_rf_feature_importance.csv",
+            f"{PHASE3}/threshold_*_curve.csv",
+        ],
+        "outputs": [f"{FIGURES}/*.png"],
+    },
+]
+
+
+def file_digest(path):
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(HASH_BLOCK), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+class State:
+    """state.json：文件哈希缓存 + 每个步骤各键对应的输出内容哈希"""
+
+    def __init__(self, state_dir):
+        self.path = state_dir / "state.json"
+        self.objects = state_dir / "objects"
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            data = {}
+        self.digests = data.get("digests", {})
+        self.runs = data.get("runs", {})
+
+    def digest(self, path):
+        st = path.stat()
+        name = str(Path(path).resolve())
+        cached = self.digests.get(name)
+        if cached and cached[0] == st.st_size and cached[1] == st.st_mtime_ns:
+            return cached[2]
+        digest = file_digest(path)
+        self.digests[name] = [st.st_size, st.st_mtime_ns, digest]
+        return digest
+
+    def object_path(self, digest):
+        return self.objects / digest[:2] / digest
+
+    def store(self, path, digest):
+        target = self.object_path(digest)
+        if not target.exists():
+            target.parent.mkdir(parents=True, exist_ok=True)
+            # Copy rather than hard-link: scripts rewrite their outputs in place
+            tmp = target.with_name(f".{digest}.{os.getpid()}.tmp")
+            shutil.copyfile(path, tmp)
+            os.replace(tmp, target)
+
+    def save(self):
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = self.path.with_suffix(".json.tmp")
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({"digests": self.digests, "runs": self.runs}, f, ensure_ascii=False, indent=1)
+        os.replace(tmp, self.path)
+
+
+def is_glob(pattern):
+    return any(c in pattern for c in "*?[")
+
+
+def locate(pattern):
+    """"{root}/a/b" -> (根目录, "a/b")"""
+    root, _, tail = pattern.partition("/")
+    return ROOTS[root.strip("{}")], tail
+
+
+def label(path):
+    """绝对路径 -> "{root}/相对路径"，与根目录的实际位置无关，用于哈希与记录"""
+    path = Path(path)
+    for name, root in ROOTS.items():
+        if path.is_relative_to(root):
+            return f"{{{name}}}/{path.relative_to(root).as_posix()}"
+    raise ValueError(f"{path} is outside the configured data roots")
+
+
+def from_label(text):
+    root, tail = locate(text)
+    return root / tail
+
+
+def expand(patterns):
+    """通配符展开为现有文件（排序，保证哈希顺序稳定）"""
+    files = []
+    for pattern in patterns:
+        root, tail = locate(pattern)
+        matches = sorted(root.glob(tail)) if is_glob(tail) else [root / tail]
+        files += [p for p in matches if p.is_file()]
+    return files
+
+
+def local_modules(script):
+    """
+    脚本及其（递归）导入的本地模块；按脚本运行时的 sys.path 解析：各脚本先把 scripts/ 插到首位
+    （ceps_config、profiling 等），其后才是脚本自身所在目录
+    """
+    roots = [SCRIPTS_DIR, script.parent]
+    seen = []
+    stack = [script]
+    while stack:
+        path = stack.pop()
+        if path in seen:
+            continue
+        seen.append(path)
+        for node in ast.walk(ast.parse(path.read_text(encoding="utf-8"))):
+            if isinstance(node, ast.Import):
+                names = [alias.name for alias in node.names]
+            elif isinstance(node, ast.ImportFrom) and node.module and not node.level:
+                names = [node.module]
+            else:
+                continue
+            for name in names:
+                candidates = [root / f"{name.split('.')[0]}.py" for root in roots]
+                found = next((c for c in candidates if c.exists()), None)
+                if found is not None:
+                    stack.append(found)
+    return sorted(seen)
+
+
+def dependencies(steps):
+    """{步骤: 上游步骤集合}：某步骤的输出匹配本步骤的某个输入"""
+    deps = {}
+    for step in steps:
+        deps[step["name"]] = {
+            other["name"]
+            for other in steps
+            if other is not step
+            and any(fnmatch(out, inp) or fnmatch(inp, out) for out in other["outputs"] for inp in step["inputs"])
+        }
+    return deps
+
+
+def step_key(step, state):
+    h = hashlib.sha256()
+    for module in local_modules(SCRIPTS_DIR / step["script"]):
+        h.update(module.relative_to(SCRIPTS_DIR).as_posix().encode("utf-8"))
+        h.update(state.digest(module).encode("ascii"))
+    h.update(json.dumps(step.get("args", [])).encode("utf-8"))
+    inputs = expand(step["inputs"])
+    optional = step.get("optional", ())
+    missing = [p for p in step["inputs"] if not is_glob(p) and p not in optional and not from_label(p).is_file()]
+    if missing:
+        raise FileNotFoundError(f"{step['name']}: missing inputs {missing}")
+    for path in inputs:
+        h.update(label(path).encode("utf-8"))
+        h.update(state.digest(path).encode("ascii"))
+    return h.hexdigest()
+
+
+def plan_action(step, key, state):
+    """up-to-date | restore | run"""
+    recorded = state.runs.get(step["name"], {}).get(key)
+    if recorded is None:
+        return "run"
+    current = {label(p): state.digest(p) for p in expand(step["outputs"])}
+    if current == recorded:
+        return "up-to-date"
+    if all(state.object_path(d).exists() for d in recorded.values()):
+        return "restore"
+    return "run"
+
+
+def restore_outputs(step, key, state):
+    for text, digest in state.runs[step["name"]][key].items():
+        target = from_label(text)
+        target.parent.mkdir(parents=True, exist_ok=True)
+        shutil.copyfile(state.object_path(digest), target)
+
+
+def run_step(step):
+    """子进程执行脚本（工作目录为脚本所在目录，保证同目录模块可导入）；返回 (returncode, 秒数)"""
+    script = SCRIPTS_DIR / step["script"]
+    log_path = STATE_DIR / "logs" / f"{step['name']}.log"
+    log_path.parent.mkdir(parents=True, exist_ok=True)
+    start = time.perf_counter()
+    with open(log_path, "w", encoding="utf-8") as log:
+        proc = subprocess.run(
+            [sys.executable, script.name, *step.get("args", [])],
+            cwd=script.parent,
+            stdout=log,
+            stderr=subprocess.STDOUT,
+        )
+    return proc.returncode, time.perf_counter() - start
+
+
+def record_outputs(step, key, state):
+    outputs = {}
+    for path in expand(step["outputs"]):
+        digest = state.digest(path)
+        state.store(path, digest)
+        outputs[label(path)] = digest
+    state.runs.setdefault(step["name"], {})[key] = outputs
+
+
+def select(steps, deps, targets):
+    """目标步骤及其全部上游"""
+    if not targets:
+        return steps
+    names = {s["name"] for s in steps}
+    unknown = [t for t in targets if t not in names]
+    if unknown:
+        raise SystemExit(f"Unknown steps: {unknown}")
+    wanted, stack = set(), list(targets)
+    while stack:
+        name = stack.pop()
+        if name not in wanted:
+            wanted.add(name)
+            stack.extend(deps[name])
+    return [s for s in steps if s["name"] in wanted]
+
+
+def execute(steps, jobs=4, force=(), dry_run=False):
+    deps = dependencies(steps)
+    by_name = {s["name"]: s for s in steps}
+    state = State(STATE_DIR)
+    pending = {s["name"] for s in steps}
+    done, failed, stale = set(), set(), set()
+    running = {}
+
+    def ready(name):
+        return deps[name] & set(by_name) <= done
+
+    with ThreadPoolExecutor(max_workers=jobs) as pool:
+        while pending or running:
+            for name in [n for n in sorted(pending) if deps[n] & failed]:
+                pending.discard(name)
+                failed.add(name)
+                print(f"[WARN] {name}: skipped (upstream failed)")
+            for name in [n for n in sorted(pending, key=list(by_name).index) if ready(n)]:
+                pending.discard(name)
+                step = by_name[name]
+                if dry_run and deps[name] & stale:
+                    # Upstream would re-run first, so this step's inputs are not final yet
+                    print(f"[INFO] {name}: run (after upstream)")
+                    stale.add(name)
+                    done.add(name)
+                    continue
+                try:
+                    key = step_key(step, state)
+                except FileNotFoundError as exc:
+                    # e.g. raw .dta files not on this machine: use the outputs already on disk
+                    required = [p for p in step["outputs"] if not is_glob(p) and p not in step.get("optional", ())]
+                    if all(from_label(p).is_file() for p in required):
+                        print(f"[WARN] {exc}; using existing outputs")
+                        done.add(name)
+                    else:
+                        print(f"[WARN] {exc}")
+                        failed.add(name)
+                    continue
+                action = "run" if name in force else plan_action(step, key, state)
+                if dry_run:
+                    print(f"[INFO] {name}: {action}")
+                    if action == "run":
+                        stale.add(name)
+                    done.add(name)
+                elif action == "up-to-date":
+                    print(f"[INFO] {name}: up to date")
+                    done.add(name)
+                elif action == "restore":
+                    restore_outputs(step, key, state)
+                    print(f"[INFO] {name}: restored cached outputs")
+                    done.add(name)
+                else:
+                    print(f"[INFO] {name}: running")
+                    running[pool.submit(run_step, step)] = (name, key)
+            if not running:
+                continue
+            finished, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in finished:
+                name, key = running.pop(future)
+                code, seconds = future.result()
+                if code == 0:
+                    record_outputs(by_name[name], key, state)
+                    done.add(name)
+                    print(f"[DONE] {name} ({seconds:.1f}s)")
+                else:
+                    failed.add(name)
+                    print(f"[WARN] {name}: failed with exit code {code}, see {STATE_DIR / 'logs' / (name + '.log')}")
+            state.save()
+    state.save()
+    return not failed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the CEPS analysis steps, re-running only what changed.")
+    parser.add_argument("targets", nargs="*", help="steps to bring up to date (default: all)")
+    parser.add_argument("--jobs", type=int, default=min(4, os.cpu_count() or 1), help="steps run concurrently")
+    parser.add_argument("--force", nargs="*", default=[], help="re-run these steps even if cached")
+    parser.add_argument("--dry-run", action="store_true")
+    parser.add_argument("--list", action="store_true", help="print the steps and their upstream steps")
+    args = parser.parse_args()
+
+    deps = dependencies(STEPS)
+    if args.list:
+        for step in STEPS:
+            print(f"{step['name']}: {', '.join(sorted(deps[step['name']])) or '-'}")
+        return
+    steps = select(STEPS, deps, args.targets)
+    ok = execute(steps, jobs=args.jobs, force=set(args.force), dry_run=args.dry_run)
+    if not ok:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,68 @@
+import sys
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+ROOT = Path(__file__).resolve().parents[1] / "scripts"
+sys.path[:0] = [str(ROOT), str(ROOT / "analysis")]
+
+from multiple_imputation import MI_VARS, load_mi_frame, rubin_pool, run_mi  # noqa: E402
+
+
+def write_data(tmp_path, n=240, seed=0):
+    rng = np.random.default_rng(seed)
+    df = pd.DataFrame(
+        {
+            "ids": np.arange(1, n + 1),
+            "clsids": np.repeat(np.arange(1, n // 20 + 1), 20),
+            "expect_edu_raw": rng.integers(1, 10, n),
+            "bonding_idx": rng.normal(size=n),
+            "teacher_praise": rng.integers(1, 5, n).astype(float),
+            "teacher_talk": rng.integers(0, 2, n).astype(float),
+            "ses_pca": rng.normal(size=n),
+            "hukou_type": rng.integers(0, 2, n),
+            "cog_score": rng.normal(20, 5, n),
+            "ses_self": rng.integers(1, 6, n).astype(float),
+        }
+    )
+    df.loc[:4, "teacher_praise"] = np.nan
+    df["linking_idx"] = 0.5 * df["teacher_praise"].fillna(2.5) + df["teacher_talk"] - 1
+    data_file = tmp_path / "data.csv"
+    df.to_csv(data_file, index=False)
+
+    # Every student has a flag row, as written by the cleaning step
+    flags = pd.DataFrame({"ids": df["ids"]})
+    for var in MI_VARS:
+        flags[f"imp_{var}"] = rng.random(n) < 0.05
+    (tmp_path / "features").mkdir()
+    flags.to_parquet(tmp_path / "features" / "imputation_flags.parquet", index=False)
+    return data_file, df, flags
+
+
+def test_load_mi_frame_with_flags_sidecar(tmp_path):
+    data_file, df, flags = write_data(tmp_path)
+    frame, mi_flags = load_mi_frame(data_file)
+    assert len(frame) == len(df)
+    for var in MI_VARS:
+        expected = flags[f"imp_{var}"].to_numpy()
+        if var == "teacher_praise":
+            expected = expected | df["teacher_praise"].isna().to_numpy()
+        assert mi_flags[var].flags.writeable
+        np.testing.assert_array_equal(mi_flags[var], expected)
+
+
+def test_run_mi_with_flags_sidecar(tmp_path):
+    data_file, _df, _flags = write_data(tmp_path)
+    frame, mi_flags = load_mi_frame(data_file)
+    pooled, single = run_mi(frame, mi_flags, m=3, n_iter=2, n_jobs=1)
+    assert list(pooled.index) == list(single.params.index)
+    # Barnard-Rubin df never exceeds the complete-data df
+    assert (pooled["df"] <= len(frame) - len(single.params)).all()
+
+
+def test_rubin_pool_df_capped_without_between_variance():
+    estimates = np.ones((5, 2))
+    covs = [np.eye(2) * 0.01] * 5
+    pooled = rubin_pool(estimates, covs, ["a", "b"], dof_complete=100)
+    assert np.allclose(pooled["df"], 101 / 103 * 100)